@@ -1,6 +1,7 @@
-from flask import request, jsonify
+import json
+from flask import request, jsonify, current_app, Response, send_file, stream_with_context
 from . import bp
-from ..services.command import CommandService
+from ..services.container import get_services
 
 @bp.route('/chat', methods=['POST'])
 def chat():
@@ -11,7 +12,167 @@ def chat():
     data = request.json
     message = data.get('message', '')
     
-    command_service = CommandService()
+    command_service = get_services(current_app).command_service
     response = command_service.process_command(message)
     
-    return jsonify(response)
\ No newline at end of file
+    return jsonify(response)
+
+
+@bp.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Handle chat requests with progress pushed as server-sent events.
+    Events: status (stage started), token (model answer as it arrives),
+    error (the command failed) and result, with the same payload as /chat.
+    """
+    data = request.json
+    message = data.get('message', '')
+    
+    command_service = get_services(current_app).command_service
+    
+    def generate():
+        for event, payload in command_service.process_command_stream(message):
+            yield f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@bp.route('/files', methods=['GET'])
+def list_files():
+    """
+    List the files of the white list directories page by page.
+    Paging: limit (default 1000, at most 10000) and cursor (next_cursor of
+    the previous page); since: catalog version the client has, to list only
+    the changes; filters: directory, type. First pages carry an ETag of the
+    catalog version and answer If-None-Match with 304 Not Modified.
+    """
+    args = request.args
+    file_service = get_services(current_app).file_service
+    cursor = args.get('cursor')
+
+    etag = None
+    if not cursor:
+        version = file_service.get_listing_version(args.get('directory'))
+        if version is not None:
+            etag = f'files-{version}'
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+                response.set_etag(etag, weak=True)
+                return response
+
+    try:
+        limit = min(max(args.get('limit', 1000, type=int), 1), 10000)
+        page = file_service.list_files(
+            cursor=cursor,
+            limit=limit,
+            since=args.get('since', type=int),
+            directory=args.get('directory'),
+            file_type=args.get('type')
+        )
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query: {e}'}), 400
+
+    response = jsonify(page)
+    if etag:
+        response.set_etag(etag, weak=True)
+    elif not cursor and page['version'] is None:
+        # Without a catalog version, fall back to an ETag of the content
+        response.add_etag()
+        response.make_conditional(request)
+    return response
+
+def _preview_error(e):
+    """Map a preview path error to a JSON error response"""
+    if isinstance(e, FileNotFoundError):
+        return jsonify({'error': 'File not found'}), 404
+    if isinstance(e, PermissionError):
+        return jsonify({'error': 'File not readable'}), 403
+    return jsonify({'error': str(e)}), 400
+
+@bp.route('/preview', methods=['GET'])
+def preview():
+    """
+    Preview a file of the white list directories without opening it.
+    path: file to preview. Text files return the first max_preview_size
+    bytes, images point to /preview/thumbnail. Answers If-None-Match with
+    304 Not Modified while the file is unchanged.
+    """
+    preview_service = get_services(current_app).preview_service
+    if not preview_service.enabled:
+        return jsonify({'error': 'Previews are disabled'}), 404
+    try:
+        page = preview_service.get_preview(request.args.get('path', ''))
+    except (ValueError, OSError) as e:
+        return _preview_error(e)
+
+    response = jsonify(page)
+    response.set_etag(f"preview-{page['size']}-{page['mtime']}", weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+@bp.route('/preview/thumbnail', methods=['GET'])
+def preview_thumbnail():
+    """
+    Serve the cached thumbnail of an image.
+    path: image file. Falls back to the image itself when no thumbnail can
+    be made; both support conditional and Range requests.
+    """
+    preview_service = get_services(current_app).preview_service
+    if not preview_service.enabled:
+        return jsonify({'error': 'Previews are disabled'}), 404
+    try:
+        file_path = preview_service.resolve_path(request.args.get('path', ''))
+        thumbnail = preview_service.get_thumbnail(file_path)
+    except (ValueError, OSError) as e:
+        return _preview_error(e)
+    # Thumbnails are content-addressed, so a changed image gets another file and ETag
+    return send_file(thumbnail or file_path, conditional=True, max_age=0)
+
+@bp.route('/preview/content', methods=['GET'])
+def preview_content():
+    """
+    Stream the content of a file for in-browser viewing.
+    path: file to stream. Supports Range requests, so a client reads only
+    the part it shows.
+    """
+    preview_service = get_services(current_app).preview_service
+    if not preview_service.enabled:
+        return jsonify({'error': 'Previews are disabled'}), 404
+    try:
+        file_path = preview_service.resolve_path(request.args.get('path', ''))
+    except (ValueError, OSError) as e:
+        return _preview_error(e)
+    return send_file(file_path, conditional=True, max_age=0)
+
+@bp.route('/traces', methods=['GET'])
+def traces():
+    """
+    Query the execution trace log.
+    Matching traces are streamed as JSON lines, newest first unless order=asc.
+    Filters: type (repeatable or comma separated), start, end (ISO 8601 or
+    timestamp), trace_id, min_duration (seconds); paging: limit, offset.
+    """
+    args = request.args
+    types = [t for value in args.getlist('type') for t in value.split(',') if t] or None
+    try:
+        limit = min(args.get('limit', 100, type=int), 1000)
+        offset = max(args.get('offset', 0, type=int), 0)
+        min_duration = args.get('min_duration', type=float)
+        query = get_services(current_app).test_logger.query(
+            types=types,
+            start=args.get('start'),
+            end=args.get('end'),
+            trace_id=args.get('trace_id'),
+            min_duration=min_duration,
+            limit=limit,
+            offset=offset,
+            descending=args.get('order', 'desc') != 'asc'
+        )
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query: {e}'}), 400
+
+    def generate():
+        for trace in query:
+            yield json.dumps(trace, ensure_ascii=False) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
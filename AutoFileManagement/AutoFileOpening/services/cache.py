@@ -0,0 +1,204 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from prometheus_client import Counter
+
+RESPONSE_CACHE_HITS = Counter(
+    'llm_response_cache_hits_total',
+    'LLM file resolution results served from the response cache',
+    ['tier']
+)
+RESPONSE_CACHE_MISSES = Counter(
+    'llm_response_cache_misses_total',
+    'LLM file resolution lookups not found in the response cache'
+)
+RESPONSE_CACHE_EVICTIONS = Counter(
+    'llm_response_cache_evictions_total',
+    'Entries removed from the response cache',
+    ['tier', 'reason']
+)
+
+_PUNCTUATION = re.compile(r'[^\w\s.]+')
+
+
+def normalize_query(text):
+    """Normalize a chat message so trivially different phrasings share a cache entry"""
+    text = _PUNCTUATION.sub(' ', text.lower())
+    return ' '.join(text.split()).strip('. ')
+
+
+def make_key(query, files, model, temperature):
+    """
+    Build the cache key of a file resolution request
+
+    The key covers the normalized query, the exact candidate files (path,
+    size and mtime) and the model settings.
+    """
+    payload = json.dumps([
+        normalize_query(query),
+        sorted((f['path'], f.get('size'), f.get('mtime')) for f in files),
+        model,
+        temperature
+    ], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier cache of LLM file resolution results
+
+    An in-process LRU is backed by an optional SQLite tier shared by all
+    workers. Entries expire after ``ttl`` seconds, both tiers are bounded
+    in size, and every entry is bound to the file catalog version it was
+    computed against: a version change drops the in-memory entries, and
+    on-disk entries of another version are discarded when they are read.
+    """
+
+    def __init__(self, max_entries=1024, ttl=3600, disk_path=None, disk_max_entries=10000):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_path = disk_path
+        self.disk_max_entries = disk_max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._version = None
+        self._local = threading.local()
+
+        if disk_path:
+            db_dir = os.path.dirname(disk_path)
+            if db_dir:
+                os.makedirs(db_dir, exist_ok=True)
+            self._connect().execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, version TEXT, created_at REAL NOT NULL)'
+            )
+
+    def _connect(self):
+        """Get the SQLite connection of the current thread"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.disk_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _check_version(self, version):
+        """Drop in-memory entries computed against another catalog version"""
+        if version == self._version:
+            return
+        if self._entries:
+            RESPONSE_CACHE_EVICTIONS.labels(tier='memory', reason='invalidated').inc(len(self._entries))
+            self._entries.clear()
+        self._version = version
+
+    def get(self, key, version=None):
+        """
+        Look up a cached response
+
+        Returns:
+            str: Cached response, or None on a miss
+        """
+        now = time.time()
+        version = None if version is None else str(version)
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, created_at = entry
+                if now - created_at < self.ttl:
+                    self._entries.move_to_end(key)
+                    RESPONSE_CACHE_HITS.labels(tier='memory').inc()
+                    return value
+                del self._entries[key]
+                RESPONSE_CACHE_EVICTIONS.labels(tier='memory', reason='expired').inc()
+
+        if self.disk_path:
+            try:
+                value = self._disk_get(key, version, now)
+            except sqlite3.Error:
+                value = None
+            if value is not None:
+                RESPONSE_CACHE_HITS.labels(tier='disk').inc()
+                with self._lock:
+                    self._put(key, value, now)
+                return value
+
+        RESPONSE_CACHE_MISSES.inc()
+        return None
+
+    def set(self, key, value, version=None):
+        """Store a response computed against a catalog version"""
+        now = time.time()
+        version = None if version is None else str(version)
+        with self._lock:
+            self._check_version(version)
+            self._put(key, value, now)
+        if self.disk_path:
+            try:
+                self._disk_set(key, value, version, now)
+            except sqlite3.Error:
+                pass
+
+    def _put(self, key, value, created_at):
+        self._entries[key] = (value, created_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            RESPONSE_CACHE_EVICTIONS.labels(tier='memory', reason='size').inc()
+
+    def _disk_get(self, key, version, now):
+        conn = self._connect()
+        row = conn.execute('SELECT value, version, created_at FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        value, entry_version, created_at = row
+        if entry_version != version or now - created_at >= self.ttl:
+            conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+            RESPONSE_CACHE_EVICTIONS.labels(
+                tier='disk', reason='invalidated' if entry_version != version else 'expired').inc()
+            return None
+        return value
+
+    def _disk_set(self, key, value, version, now):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                'INSERT OR REPLACE INTO responses (key, value, version, created_at) VALUES (?, ?, ?, ?)',
+                (key, value, version, now)
+            )
+            expired = conn.execute('DELETE FROM responses WHERE created_at < ?', (now - self.ttl,)).rowcount
+            overflow = conn.execute(
+                'DELETE FROM responses WHERE key IN '
+                '(SELECT key FROM responses ORDER BY created_at DESC LIMIT -1 OFFSET ?)',
+                (self.disk_max_entries,)
+            ).rowcount
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        if expired:
+            RESPONSE_CACHE_EVICTIONS.labels(tier='disk', reason='expired').inc(expired)
+        if overflow:
+            RESPONSE_CACHE_EVICTIONS.labels(tier='disk', reason='size').inc(overflow)
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_response_cache(max_entries=1024, ttl=3600, disk_path=None, disk_max_entries=10000):
+    """Get the process-wide response cache for a configuration"""
+    key = (max_entries, ttl, disk_path, disk_max_entries)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = ResponseCache(max_entries, ttl, disk_path, disk_max_entries)
+            _caches[key] = cache
+        return cache
@@ -0,0 +1,395 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from .walker import ScandirWalker, subtree_bounds
+
+
+class FileCatalog:
+    """Persistent SQLite catalog of the files in the white list directories
+
+    The catalog keeps one row per file (name, path, extension, size, mtime,
+    root directory) and one row per directory with the directory mtime seen
+    at the last scan. A refresh only re-lists directories whose mtime has
+    changed, so keeping the catalog current costs one stat per directory
+    instead of a full walk with several stats per file.
+
+    Every file row carries the catalog version that last changed it, and
+    removed files leave a tombstone, so clients can fetch the changes since
+    a version instead of the whole listing. Tombstones are kept for
+    ``TOMBSTONE_VERSIONS`` versions; older versions need a full listing.
+    """
+
+    TOMBSTONE_VERSIONS = 1000
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS files (
+        root TEXT NOT NULL,
+        path TEXT NOT NULL,
+        name TEXT NOT NULL,
+        extension TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        mtime REAL NOT NULL,
+        parent TEXT NOT NULL,
+        version INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (root, path)
+    );
+    CREATE INDEX IF NOT EXISTS idx_files_parent ON files(root, parent);
+    CREATE INDEX IF NOT EXISTS idx_files_extension ON files(root, extension);
+    CREATE TABLE IF NOT EXISTS directories (
+        root TEXT NOT NULL,
+        path TEXT NOT NULL,
+        parent TEXT,
+        mtime_ns INTEGER NOT NULL,
+        PRIMARY KEY (root, path)
+    );
+    CREATE TABLE IF NOT EXISTS roots (
+        root TEXT PRIMARY KEY,
+        refreshed_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS removed_files (
+        root TEXT NOT NULL,
+        path TEXT NOT NULL,
+        version INTEGER NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_removed_files_version ON removed_files(version);
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+    INSERT OR IGNORE INTO meta (key, value) VALUES ('delta_floor', 0);
+    """
+
+    def __init__(self, db_path, refresh_interval=5, walker=None):
+        self.db_path = db_path
+        self.refresh_interval = refresh_interval
+        self.walker = walker or ScandirWalker(max_workers=1)
+        self._local = threading.local()
+        self._refresh_lock = threading.Lock()
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        conn = self._connect()
+        conn.executescript(self.SCHEMA)
+        self._migrate(conn)
+
+    def _migrate(self, conn):
+        """Add the row versions to a catalog created before deltas were supported"""
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(files)')]
+        if 'version' not in columns:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                columns = [row[1] for row in conn.execute('PRAGMA table_info(files)')]
+                if 'version' not in columns:
+                    conn.execute('ALTER TABLE files ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+                    # Changes before now were not recorded
+                    conn.execute(
+                        "UPDATE meta SET value = (SELECT value FROM meta WHERE key = 'version') "
+                        "WHERE key = 'delta_floor'"
+                    )
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_files_version ON files(root, version)')
+
+    def _connect(self):
+        """Get the SQLite connection of the current thread"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _stale_roots(self, conn, roots, now):
+        """Return the roots whose last refresh is older than the refresh interval"""
+        stale = []
+        for root in roots:
+            row = conn.execute('SELECT refreshed_at FROM roots WHERE root = ?', (root,)).fetchone()
+            if row is None or now - row[0] >= self.refresh_interval:
+                stale.append(root)
+        return stale
+
+    def refresh(self, roots, force=False):
+        """
+        Bring the catalog up to date for the given root directories
+
+        Args:
+            roots (list): Root directories to refresh
+            force (bool, optional): Ignore the refresh interval
+
+        Returns:
+            int: Number of directories that were re-listed
+        """
+        now = time.time()
+        conn = self._connect()
+        if not force and not self._stale_roots(conn, roots, now):
+            return 0
+
+        rescanned = 0
+        with self._refresh_lock:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                # Another worker may have refreshed while we waited for the lock
+                stale = roots if force else self._stale_roots(conn, roots, now)
+                # Rows changed by this refresh are stamped with the next version
+                version = self.version() + 1
+                for root in stale:
+                    rescanned += self._refresh_root(conn, root, version)
+                    conn.execute(
+                        'INSERT OR REPLACE INTO roots (root, refreshed_at) VALUES (?, ?)',
+                        (root, time.time())
+                    )
+                if rescanned:
+                    conn.execute("UPDATE meta SET value = ? WHERE key = 'version'", (version,))
+                    self._prune_tombstones(conn, version)
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        return rescanned
+
+    def _refresh_root(self, conn, root, version):
+        """Re-list the directories of a root whose mtime changed since the last scan"""
+        known = {}
+        children = defaultdict(list)
+        for path, parent, mtime_ns in conn.execute(
+                'SELECT path, parent, mtime_ns FROM directories WHERE root = ?', (root,)):
+            known[path] = mtime_ns
+            if parent is not None:
+                children[parent].append(path)
+
+        rescanned = 0
+        for change in self.walker.scan_changes(root, None, known, children):
+            if change[0] == 'removed':
+                self._remove_tree(conn, root, change[1], version)
+                continue
+
+            _, dir_path, parent, mtime_ns, files, _ = change
+            self._replace_directory(conn, root, dir_path, files, version)
+            conn.execute(
+                'INSERT OR REPLACE INTO directories (root, path, parent, mtime_ns) VALUES (?, ?, ?, ?)',
+                (root, dir_path, parent, mtime_ns)
+            )
+            rescanned += 1
+        return rescanned
+
+    def _replace_directory(self, conn, root, dir_path, files, version):
+        """Write the listing of one directory, only touching the rows of changed files"""
+        known = {
+            path: (size, mtime)
+            for path, size, mtime in conn.execute(
+                'SELECT path, size, mtime FROM files WHERE root = ? AND parent = ?', (root, dir_path))
+        }
+        changed = []
+        for path, name, extension, size, mtime in files:
+            if known.pop(path, None) != (size, mtime):
+                changed.append((root, path, name, extension, size, mtime, dir_path, version))
+        if known:
+            conn.executemany('DELETE FROM files WHERE root = ? AND path = ?', [(root, path) for path in known])
+            conn.executemany(
+                'INSERT INTO removed_files (root, path, version) VALUES (?, ?, ?)',
+                [(root, path, version) for path in known]
+            )
+        conn.executemany(
+            'INSERT OR REPLACE INTO files (root, path, name, extension, size, mtime, parent, version) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            changed
+        )
+
+    def _remove_tree(self, conn, root, dir_path, version):
+        """Remove a directory and everything below it"""
+        low, high = subtree_bounds(dir_path)
+        conn.execute(
+            'DELETE FROM directories WHERE root = ? AND (path = ? OR (path >= ? AND path < ?))',
+            (root, dir_path, low, high)
+        )
+        conn.execute(
+            'INSERT INTO removed_files (root, path, version) '
+            'SELECT root, path, ? FROM files WHERE root = ? AND (parent = ? OR (parent >= ? AND parent < ?))',
+            (version, root, dir_path, low, high)
+        )
+        conn.execute(
+            'DELETE FROM files WHERE root = ? AND (parent = ? OR (parent >= ? AND parent < ?))',
+            (root, dir_path, low, high)
+        )
+
+    def _prune_tombstones(self, conn, version):
+        """Drop tombstones older than the retained versions and raise the delta floor"""
+        floor = version - self.TOMBSTONE_VERSIONS
+        if floor <= 0:
+            return
+        conn.execute('DELETE FROM removed_files WHERE version <= ?', (floor,))
+        conn.execute("UPDATE meta SET value = MAX(value, ?) WHERE key = 'delta_floor'", (floor,))
+
+    def version(self):
+        """Get the catalog version, which changes whenever a refresh modified the catalog"""
+        return self._connect().execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    def delta_floor(self):
+        """Get the oldest version the changes since which can be listed"""
+        return self._connect().execute("SELECT value FROM meta WHERE key = 'delta_floor'").fetchone()[0]
+
+    def get_directories(self, root):
+        """
+        Get the catalogued directories of a root
+
+        Returns:
+            list: (path, parent, mtime_ns) tuples
+        """
+        return self._connect().execute(
+            'SELECT path, parent, mtime_ns FROM directories WHERE root = ?', (root,)
+        ).fetchall()
+
+    def get_files(self, roots, extensions=None, max_size=None):
+        """
+        Query catalogued files
+
+        Args:
+            roots (list): Root directories to include
+            extensions (list, optional): Extensions (without dot) to match
+            max_size (int, optional): Maximum file size in bytes
+
+        Returns:
+            list: File dictionaries in the same format as FileService.get_files
+        """
+        conn = self._connect()
+        files = []
+        for root in roots:
+            sql = 'SELECT name, path, extension, size, mtime FROM files WHERE root = ?'
+            params = [root]
+            if extensions is not None:
+                sql += f" AND extension IN ({','.join('?' * len(extensions))})"
+                params.extend(extensions)
+            if max_size is not None:
+                sql += ' AND size <= ?'
+                params.append(max_size)
+            sql += ' ORDER BY path'
+            for name, path, extension, size, mtime in conn.execute(sql, params):
+                files.append({
+                    'name': name,
+                    'path': path,
+                    'type': extension,
+                    'size': size,
+                    'mtime': mtime,
+                    'directory': root
+                })
+        return files
+
+    def count_files(self, roots, extensions=None, max_size=None):
+        """Count catalogued files with the same filters as get_files, without loading them"""
+        conn = self._connect()
+        total = 0
+        for root in roots:
+            sql = 'SELECT COUNT(*) FROM files WHERE root = ?'
+            params = [root]
+            if extensions is not None:
+                sql += f" AND extension IN ({','.join('?' * len(extensions))})"
+                params.extend(extensions)
+            if max_size is not None:
+                sql += ' AND size <= ?'
+                params.append(max_size)
+            total += conn.execute(sql, params).fetchone()[0]
+        return total
+
+    def list_files(self, roots, extensions=None, max_size=None, since=None, after=None, limit=1000):
+        """
+        Page through catalogued files in (root, path) order
+
+        Args:
+            roots (list): Root directories to include, in listing order
+            extensions (list, optional): Extensions (without dot) to match
+            max_size (int, optional): Maximum file size in bytes
+            since (int, optional): Only files changed after this version
+            after (tuple, optional): (root index, path) of the last file of
+                the previous page
+            limit (int, optional): Maximum number of files
+
+        Returns:
+            list: (root index, path, extension, size, mtime) tuples
+        """
+        conn = self._connect()
+        rows = []
+        start_index, after_path = after if after else (0, None)
+        for index in range(start_index, len(roots)):
+            if len(rows) >= limit:
+                break
+            sql = 'SELECT path, extension, size, mtime FROM files WHERE root = ?'
+            params = [roots[index]]
+            if index == start_index and after_path is not None:
+                sql += ' AND path > ?'
+                params.append(after_path)
+            if since is not None:
+                sql += ' AND version > ?'
+                params.append(since)
+            if extensions is not None:
+                sql += f" AND extension IN ({','.join('?' * len(extensions))})"
+                params.extend(extensions)
+            if max_size is not None:
+                sql += ' AND size <= ?'
+                params.append(max_size)
+            sql += ' ORDER BY path LIMIT ?'
+            params.append(limit - len(rows))
+            rows.extend((index,) + row for row in conn.execute(sql, params))
+        return rows
+
+    def removed_since(self, roots, since):
+        """
+        Get the files removed after a version
+
+        Returns:
+            list: (root index, path) tuples; a file may be listed although it
+            was re-created later, in which case it is also among the changed files
+        """
+        conn = self._connect()
+        removed = []
+        for index, root in enumerate(roots):
+            removed.extend(
+                (index, path) for (path,) in conn.execute(
+                    'SELECT DISTINCT path FROM removed_files WHERE root = ? AND version > ? ORDER BY path',
+                    (root, since))
+            )
+        return removed
+
+    def iter_directory_files(self, root):
+        """
+        Iterate the catalogued files of a root grouped by directory
+
+        Yields:
+            tuple: (directory path, list of file tuples as returned by ScandirWalker.scan_directory)
+        """
+        rows = self._connect().execute(
+            'SELECT parent, path, name, extension, size, mtime FROM files '
+            'WHERE root = ? ORDER BY parent', (root,)
+        )
+        current, files = None, []
+        for parent, path, name, extension, size, mtime in rows:
+            if parent != current:
+                if current is not None:
+                    yield current, files
+                current, files = parent, []
+            files.append((path, name, extension, size, mtime))
+        if current is not None:
+            yield current, files
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(db_path, refresh_interval=5, walker=None):
+    """Get the process-wide catalog for a database path"""
+    with _catalogs_lock:
+        catalog = _catalogs.get(db_path)
+        if catalog is None:
+            catalog = FileCatalog(db_path, refresh_interval, walker)
+            _catalogs[db_path] = catalog
+        catalog.refresh_interval = refresh_interval
+        if walker is not None:
+            catalog.walker = walker
+        return catalog
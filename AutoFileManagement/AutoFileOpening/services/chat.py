@@ -1,4 +1,5 @@
 import os
+from flask import current_app
 from .openai_client import OpenAIClient
 
 class ChatService:
@@ -22,4 +23,48 @@ class ChatService:
         
         except Exception as e:
             print(f"Error in ChatService: {str(e)}")
-            return "Sorry, I encountered an error. Please try again."
\ No newline at end of file
+            return "Sorry, I encountered an error. Please try again."
+    
+    def stream_response(self, prompt, max_tokens=None, stop=None):
+        """
+        Get response from ChatGPT as it is generated
+        
+        Args:
+            prompt (str): Complete prompt text
+            max_tokens (int, optional): Maximum completion tokens
+            stop (list, optional): Stop sequences
+            
+        Yields:
+            str: Pieces of the response text
+            
+        Raises:
+            Exception: The model call failed; nothing of the error is yielded
+            as response text
+        """
+        try:
+            yield from self.client.stream_chat_completion(prompt, max_tokens=max_tokens, stop=stop)
+        
+        except Exception as e:
+            current_app.logger.error(f"Error in ChatService: {str(e)}", exc_info=True)
+            raise
+    
+    async def get_response_async(self, prompt):
+        """
+        Get response from ChatGPT without blocking the event loop
+        
+        Args:
+            prompt (str): Complete prompt text
+            
+        Returns:
+            str: ChatGPT response text
+        """
+        try:
+            return await self.client.create_chat_completion_async(prompt)
+        
+        except Exception as e:
+            current_app.logger.error(f"Error in ChatService: {str(e)}", exc_info=True)
+            return "Sorry, I encountered an error. Please try again."
+    
+    def close(self):
+        """Release the client connections once the service is replaced"""
+        self.client.close()
\ No newline at end of file
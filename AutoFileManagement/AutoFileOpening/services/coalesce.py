@@ -0,0 +1,209 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from prometheus_client import Counter
+from interface.tracing import span
+
+try:
+    import fcntl
+except ImportError:  # Windows: calls are only coalesced within a process
+    fcntl = None
+
+COALESCED_CALLS = Counter(
+    'coalesced_calls_total',
+    'Calls of single-flight sections: leaders did the work, followers shared '
+    'an in-flight result, waiters queued behind another worker',
+    ['name', 'role']
+)
+
+# Byte ranges of the lock file that keys are hashed onto; two keys sharing a
+# slot only wait for each other, they never share results
+LOCK_SLOTS = 1 << 16
+LOCK_POLL_INTERVAL = 0.02
+
+
+class _Call:
+    """An in-flight call and, once it is done, its outcome"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    De-duplicate concurrent calls with the same key
+
+    The first caller of a key (the leader) runs the function; callers of
+    the same key arriving while it runs (followers) wait for it and get
+    the same result, or the same exception. Nothing is cached: a call
+    arriving after the leader finished runs again.
+
+    With a ``lock_path``, leaders of other processes sharing the file are
+    serialized per key as well. A waiting worker cannot receive the
+    result, it runs the function after the other leader finished, which is
+    then answered from the shared caches (catalog, on-disk response cache).
+    """
+
+    def __init__(self, name, lock_path=None, wait_timeout=30):
+        self.name = name
+        self.lock_path = lock_path if fcntl is not None else None
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._async_calls = {}
+        self._fd = None
+        self._fd_pid = None
+        # Record locks are held by the process, so threads of one process
+        # are serialized per slot by these before taking the file lock
+        self._slot_locks = {}
+
+        if self.lock_path:
+            lock_dir = os.path.dirname(self.lock_path)
+            if lock_dir:
+                os.makedirs(lock_dir, exist_ok=True)
+
+    def do(self, key, func):
+        """
+        Run func() unless a call with the same key is in flight, then share its outcome
+
+        Returns:
+            The result of the leader's call; followers get the same object
+            and must not modify it
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            COALESCED_CALLS.labels(name=self.name, role='follower').inc()
+            with span('coalesce_wait'):
+                call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        COALESCED_CALLS.labels(name=self.name, role='leader').inc()
+        try:
+            slot = self._acquire(key)
+            try:
+                call.result = func()
+            finally:
+                self._release(slot)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def do_async(self, key, func):
+        """
+        Async variant of do: await func() unless a call with the same key is in flight
+
+        Followers await the leader's task, so waiting does not block the
+        event loop. Keys are shared by the coroutines of one event loop.
+        """
+        call = self._async_calls.get(key)
+        if call is not None:
+            COALESCED_CALLS.labels(name=self.name, role='follower').inc()
+            with span('coalesce_wait'):
+                # Shielded: a cancelled follower must not cancel the leader
+                return await asyncio.shield(call)
+
+        COALESCED_CALLS.labels(name=self.name, role='leader').inc()
+        call = asyncio.ensure_future(self._lead_async(key, func))
+        self._async_calls[key] = call
+        return await asyncio.shield(call)
+
+    async def _lead_async(self, key, func):
+        try:
+            slot = await asyncio.to_thread(self._acquire, key) if self.lock_path else None
+            try:
+                return await func()
+            finally:
+                self._release(slot)
+        finally:
+            if self._async_calls.get(key) is asyncio.current_task():
+                del self._async_calls[key]
+
+    def _lock_fd(self):
+        """Open the lock file once per process; record locks are not inherited by forked workers"""
+        with self._lock:
+            if self._fd is None or self._fd_pid != os.getpid():
+                self._fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+                self._fd_pid = os.getpid()
+                self._slot_locks = {}
+            return self._fd
+
+    def _slot_lock(self, slot):
+        with self._lock:
+            lock = self._slot_locks.get(slot)
+            if lock is None:
+                lock = threading.Lock()
+                self._slot_locks[slot] = lock
+            return lock
+
+    def _acquire(self, key):
+        """
+        Lock the key's slot in the lock file, waiting while another worker holds it
+
+        Returns:
+            int: Locked slot, or None when not locking across processes or
+            the wait timed out
+        """
+        if not self.lock_path:
+            return None
+        digest = hashlib.sha1(repr((self.name, key)).encode('utf-8')).digest()
+        slot = int.from_bytes(digest[:4], 'big') % LOCK_SLOTS
+        fd = self._lock_fd()
+        slot_lock = self._slot_lock(slot)
+        deadline = time.monotonic() + self.wait_timeout
+        waited = False
+        if not slot_lock.acquire(blocking=False):
+            waited = True
+            COALESCED_CALLS.labels(name=self.name, role='waiter').inc()
+            # Never stall a request on a stuck worker, do the work instead
+            if not slot_lock.acquire(timeout=max(deadline - time.monotonic(), 0)):
+                return None
+        while True:
+            try:
+                fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, slot)
+                break
+            except OSError:
+                if not waited:
+                    waited = True
+                    COALESCED_CALLS.labels(name=self.name, role='waiter').inc()
+                if time.monotonic() >= deadline:
+                    slot_lock.release()
+                    return None
+                time.sleep(LOCK_POLL_INTERVAL)
+        return slot
+
+    def _release(self, slot):
+        if slot is not None:
+            fcntl.lockf(self._lock_fd(), fcntl.LOCK_UN, 1, slot)
+            self._slot_lock(slot).release()
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def get_single_flight(name, lock_path=None, wait_timeout=30):
+    """Get the process-wide single-flight group of a section"""
+    key = (name, lock_path, wait_timeout)
+    with _flights_lock:
+        flight = _flights.get(key)
+        if flight is None:
+            flight = SingleFlight(name, lock_path, wait_timeout)
+            _flights[key] = flight
+        return flight
@@ -1,19 +1,58 @@
 from .chat import ChatService
 from .prompt import PromptService
 from .file import FileService
+from .cache import get_response_cache, make_key, normalize_query
+from .coalesce import get_single_flight
+from .openai_client import PROMPT_TOO_LONG
 from flask import current_app
+import asyncio
+import json
 import os
+import time
 from datetime import datetime
 from interface.test_logger import TestLogger
+from interface.tracing import observe_stage, span, traced
 
 class CommandService:
-    def __init__(self):
-        self.chat_service = ChatService()
-        self.prompt_service = PromptService()
-        self.file_service = FileService()
-        self.test_logger = TestLogger()
+    def __init__(self, chat_service=None, prompt_service=None, file_service=None, test_logger=None):
+        # Shared services are injected by the application's ServiceContainer
+        self.chat_service = chat_service or ChatService()
+        self.prompt_service = prompt_service or PromptService()
+        self.file_service = file_service or FileService()
+        self.test_logger = test_logger or TestLogger()
         # Maximum number of files to include in prompt
         self.max_files_in_prompt = current_app.config.get('MAX_FILES_IN_PROMPT', 5)
+        # Rank the catalog against the message instead of taking the first files
+        self.ranking_enabled = current_app.config.get('RANKING_ENABLED', True)
+        # Resolve confident matches from the embedding index without an LLM call
+        self.embedding_enabled = current_app.config.get('EMBEDDING_ENABLED', False)
+        # Shortlist files by their text content as well as by name
+        self.content_search_enabled = current_app.config.get('CONTENT_INDEX_ENABLED', False)
+        # Streamed answers are one file name: stop at the first line break
+        self.stream_max_tokens = current_app.config.get('OPENAI_STREAM_MAX_TOKENS', 64)
+        # Cache of file resolution results, keyed by query, candidates and model
+        self.response_cache = None
+        if current_app.config.get('RESPONSE_CACHE_ENABLED', True):
+            disk_path = None
+            if current_app.config.get('RESPONSE_CACHE_DISK_ENABLED', False):
+                disk_path = current_app.config.get('RESPONSE_CACHE_PATH') or \
+                    os.path.join(current_app.config['LOG_DIR'], 'response_cache.db')
+            self.response_cache = get_response_cache(
+                current_app.config.get('RESPONSE_CACHE_MAX_ENTRIES', 1024),
+                current_app.config.get('RESPONSE_CACHE_TTL', 3600),
+                disk_path,
+                current_app.config.get('RESPONSE_CACHE_DISK_MAX_ENTRIES', 10000)
+            )
+        # Concurrent identical messages share one pipeline run
+        self.single_flight = None
+        if current_app.config.get('COALESCING_ENABLED', True):
+            lock_path = None
+            if current_app.config.get('COALESCING_CROSS_PROCESS', False):
+                lock_path = current_app.config.get('COALESCING_LOCK_PATH') or \
+                    os.path.join(current_app.config['LOG_DIR'], 'coalesce.lock')
+            self.single_flight = get_single_flight(
+                'process_command', lock_path, current_app.config.get('COALESCING_WAIT_TIMEOUT', 30)
+            )
     
     def _format_file_info(self, file_path):
         """Format file information for display"""
@@ -40,105 +79,334 @@ class CommandService:
             current_app.logger.warning(f"Error getting file info: {str(e)}")
             return None
     
-    def process_command(self, user_message):
+    @traced('open_file')
+    def _open_file(self, file_path):
+        """Open a file and describe it for the chat response"""
+        try:
+            # Verify the file exists
+            if not os.path.exists(file_path):
+                raise FileNotFoundError(f"File not found: {os.path.basename(file_path)}")
+                
+            self.file_service.open_file(file_path)
+            # Get detailed file information
+            file_info = self._format_file_info(file_path)
+            if file_info:
+                # Log file information
+                self.test_logger.log_file_info(file_info)
+                return f"Opening file:<br>" + \
+                       f"Name: {file_info['name']}<br>" + \
+                       f"Type: {file_info['type']}<br>" + \
+                       f"Size: {file_info['size']}<br>" + \
+                       f"Modified: {file_info['modified']}<br>" + \
+                       f"Path: {file_info['path']}"
+            return f"Opening file: {file_path}"
+        except Exception as e:
+            current_app.logger.warning(f"Failed to open file: {str(e)}")
+            return f"Failed to open file: {str(e)}"
+    
+    @traced('response_cache')
+    def _lookup_response(self, user_message, files):
         """
-        Process user command and execute corresponding actions
+        Look up a cached file resolution result
+
+        Returns:
+            tuple: (cache key, catalog version, cached file name or None)
         """
-        try:
-            # Start test execution logging
-            self.test_logger.start_execution(f"Processing command: {user_message[:50]}...")
-            
-            # Get list of available files
-            all_files = self.file_service.get_files()
-            
-            # Log directory and file information
-            self.test_logger.log_directory_info({
-                'white_directories': self.file_service.white_dirs,
-                'total_files': len(all_files)
-            })
-            
-            # Check if we have any files
-            if not all_files:
-                self.test_logger.end_execution()
-                return {
-                    'response': "No files available in the allowed directories.",
-                    'files': []
-                }
-            
-            # Limit the number of files in prompt
-            files = all_files[:self.max_files_in_prompt]
-            if len(all_files) > self.max_files_in_prompt:
+        if not self.response_cache:
+            return None, None, None
+        client = self.chat_service.client
+        cache_key = make_key(user_message, files, client.model, client.temperature)
+        # The catalog version is shared by all workers, unlike the per-process watcher
+        # index version; without a catalog the candidate files in the key keep entries valid
+        version = self.file_service.get_listing_version()
+        file_name = self.response_cache.get(cache_key, version)
+        if file_name is not None:
+            self.test_logger.log_llm_response(file_name)
+        return cache_key, version, file_name
+    
+    def _store_response(self, cache_key, version, files, file_name):
+        """Log and clean up the model response, caching actual resolution results"""
+        # Log LLM response
+        self.test_logger.log_llm_response(file_name)
+
+        # Clean up the response to get just the file name
+        file_name = file_name.strip().strip('"').strip("'")
+        
+        # Only actual resolution results are cached, never errors or mock responses
+        if cache_key and (file_name == "No matching files found." or
+                          any(f.get('name') == file_name for f in files)):
+            self.response_cache.set(cache_key, file_name, version)
+        return file_name
+    
+    def _get_file_name(self, user_message, files, prompt):
+        """
+        Ask the model which candidate file the message refers to, using the response cache
+
+        Returns:
+            tuple: (file name, catalog version read for the cache lookup or None)
+        """
+        cache_key, version, file_name = self._lookup_response(user_message, files)
+        if file_name is not None:
+            return file_name, version
+        return self._store_response(cache_key, version, files, self.chat_service.get_response(prompt)), version
+    
+    async def _get_file_name_async(self, user_message, files, prompt):
+        """Async variant of _get_file_name, awaiting the model instead of blocking a thread"""
+        cache_key, version, file_name = await asyncio.to_thread(self._lookup_response, user_message, files)
+        if file_name is not None:
+            return file_name, version
+        response = await self.chat_service.get_response_async(prompt)
+        return await asyncio.to_thread(self._store_response, cache_key, version, files, response), version
+    
+    def _prepare(self, user_message):
+        """
+        Collect the files and build the prompt for a message
+
+        Returns:
+            dict: Either {'result': response} when the request is answered
+            without the model, or the files, base_dir and prompt
+            of the model request
+        """
+        # Count the available files, the listing itself is only loaded when ranking is off
+        total_files = self.file_service.count_files()
+        
+        # Log directory and file information
+        self.test_logger.log_directory_info({
+            'white_directories': self.file_service.white_dirs,
+            'total_files': total_files
+        })
+        
+        # Check if we have any files
+        if not total_files:
+            return {'result': {
+                'response': "No files available in the allowed directories.",
+                'files_version': self.file_service.get_listing_version()
+            }}
+        
+        # Confident local matches are opened without asking the model
+        match = self.file_service.resolve_file(user_message) if self.embedding_enabled else None
+        if match:
+            similarity, file = match
+            current_app.logger.info(f"Resolved {file['name']} locally (similarity {similarity:.2f})")
+            return {'result': {
+                'response': self._open_file(file['path']),
+                'files_version': self.file_service.get_listing_version()
+            }}
+        
+        # Only the candidates most relevant to the message go into the prompt
+        if self.ranking_enabled:
+            files = self.file_service.rank_files(user_message, self.max_files_in_prompt)
+            if self.content_search_enabled:
+                files = self._merge_candidates(
+                    files, self.file_service.search_content(user_message, self.max_files_in_prompt)
+                )
+            files = files or self.file_service.get_files()[:self.max_files_in_prompt]
+        else:
+            files = self.file_service.get_files()[:self.max_files_in_prompt]
+            if total_files > self.max_files_in_prompt:
                 current_app.logger.warning(
-                    f"Number of files ({len(all_files)}) exceeds maximum allowed in prompt ({self.max_files_in_prompt}). "
-                    "Only first 5 files will be included."
+                    f"Number of files ({total_files}) exceeds maximum allowed in prompt ({self.max_files_in_prompt}). "
+                    f"Only first {self.max_files_in_prompt} files will be included."
                 )
-            
-            # Get base directory from the first file's path
-            base_dir = os.path.dirname(files[0]['path']) if 'path' in files[0] else self.file_service.white_dirs[0]
-            
-            # Combine everything into the prompt
-            prompt = self.prompt_service.combine_prompt(user_message, files)
-            
-            # Log prompt information
-            self.test_logger.log_prompt(prompt, {
-                'user_message': user_message,
-                'files_in_prompt': len(files)
-            })
-            
-            # Get response from ChatGPT
-            file_name = self.chat_service.get_response(prompt)
-            
-            # Log LLM response
-            self.test_logger.log_llm_response(file_name)
+        
+        # Files removed since they were counted
+        if not files:
+            return {'result': {
+                'response': "No files available in the allowed directories.",
+                'files_version': self.file_service.get_listing_version()
+            }}
+        
+        # Get base directory from the first file's path
+        base_dir = os.path.dirname(files[0]['path']) if 'path' in files[0] else self.file_service.white_dirs[0]
+        
+        # Combine everything into the prompt, trimming candidates to the token budget
+        prompt, files = self.prompt_service.combine_prompt_within_budget(
+            user_message, files, self.chat_service.client.fit_lines
+        )
+        
+        # Not even one file fits, the model would have nothing to choose from
+        if not files:
+            return {'result': {
+                'response': PROMPT_TOO_LONG,
+                'files_version': self.file_service.get_listing_version()
+            }}
+        
+        # Log prompt information
+        self.test_logger.log_prompt(prompt, {
+            'user_message': user_message,
+            'files_in_prompt': len(files)
+        })
+        
+        return {'files': files, 'base_dir': base_dir, 'prompt': prompt}
+    
+    def _merge_candidates(self, *rankings):
+        """Interleave candidate lists best first, without duplicates, up to max_files_in_prompt"""
+        files, seen = [], set()
+        for rank in range(max((len(r) for r in rankings), default=0)):
+            for ranking in rankings:
+                if rank < len(ranking) and ranking[rank]['path'] not in seen:
+                    seen.add(ranking[rank]['path'])
+                    files.append(ranking[rank])
+        return files[:self.max_files_in_prompt]
+    
+    def _finish(self, state, file_name, version=None):
+        """
+        Open the file chosen by the model and build the chat response
 
-            response = None
-            try:
-                # Clean up the response to get just the file name
-                file_name = file_name.strip().strip('"').strip("'")
-                if file_name != "No matching files found.":
-                    # Convert file name to full path
-                    file_path = os.path.join(base_dir, file_name)
-                    
-                    # Verify the file exists
-                    if not os.path.exists(file_path):
-                        raise FileNotFoundError(f"File not found: {file_name}")
-                        
-                    self.file_service.open_file(file_path)
-                    # Get detailed file information
-                    file_info = self._format_file_info(file_path)
-                    if file_info:
-                        # Log file information
-                        self.test_logger.log_file_info(file_info)
-                        response = f"Opening file:<br>" + \
-                                 f"Name: {file_info['name']}<br>" + \
-                                 f"Type: {file_info['type']}<br>" + \
-                                 f"Size: {file_info['size']}<br>" + \
-                                 f"Modified: {file_info['modified']}<br>" + \
-                                 f"Path: {file_info['path']}"
-                    else:
-                        response = f"Opening file: {file_path}"
-                else:
-                    response = file_name
-            except Exception as e:
-                current_app.logger.warning(f"Failed to open file: {str(e)}")
-                response = f"Failed to open file: {str(e)}"
+        ``version`` is the catalog version already read for this request, if any.
+        """
+        if file_name != "No matching files found.":
+            # Convert file name to full path, candidates may come from different directories
+            candidate = next((f for f in state['files'] if f.get('name') == file_name), None)
+            response = self._open_file(candidate['path'] if candidate else os.path.join(state['base_dir'], file_name))
+        else:
+            response = file_name
 
-            # End test execution logging
+        return {
+            'response': response,
+            # Clients fetch the listing from /api/files when this version changed
+            'files_version': version if version is not None else self.file_service.get_listing_version()
+        }
+    
+    def _error_result(self, e):
+        # Handle errors appropriately
+        current_app.logger.error(f"Error in CommandService: {str(e)}", exc_info=True)
+        return {
+            'error': str(e),
+            'response': "Sorry, I encountered an error processing your command.",
+            'files_version': None
+        }
+    
+    def process_command(self, user_message):
+        """
+        Process user command and execute corresponding actions
+
+        While the same message (after normalization) is being processed for
+        another request, wait for that run and return its result instead.
+        """
+        if self.single_flight is None:
+            return self._process_command(user_message)
+        return self.single_flight.do(self._flight_key(user_message), lambda: self._process_command(user_message))
+    
+    def _flight_key(self, user_message):
+        """
+        Key of a message for coalescing: the normalized message, the white
+        list scope and the settings the answer depends on, so runs under a
+        different configuration never share a result
+        """
+        client = self.chat_service.client
+        return (
+            normalize_query(user_message),
+            tuple(self.file_service.white_dirs),
+            json.dumps(self.file_service.white_types, sort_keys=True),
+            self.file_service.max_file_size,
+            client.model,
+            client.temperature,
+            self.max_files_in_prompt,
+            self.ranking_enabled,
+            self.embedding_enabled,
+            self.content_search_enabled
+        )
+    
+    def _process_command(self, user_message):
+        # Start test execution logging
+        self.test_logger.start_execution(f"Processing command: {user_message[:50]}...")
+        try:
+            with span('process_command'):
+                state = self._prepare(user_message)
+                if 'result' in state:
+                    return state['result']
+                
+                # Get response from ChatGPT, unless the same request was answered before
+                file_name, version = self._get_file_name(user_message, state['files'], state['prompt'])
+                return self._finish(state, file_name, version)
+        except Exception as e:
+            return self._error_result(e)
+        finally:
+            # End test execution logging, also on error
             self.test_logger.end_execution()
+    
+    async def process_command_async(self, user_message):
+        """
+        Process user command without blocking the event loop
 
-            return {
-                'response': response,
-                'files': all_files  # Return all files to frontend
-            }
+        File system, catalog and logging work runs in worker threads while the
+        model request is awaited, so one process can serve many chats at once.
+        Results are identical to process_command, including the sharing
+        of in-flight runs of the same message.
+        """
+        if self.single_flight is None:
+            return await self._process_command_async(user_message)
+        return await self.single_flight.do_async(
+            self._flight_key(user_message), lambda: self._process_command_async(user_message)
+        )
+    
+    async def _process_command_async(self, user_message):
+        self.test_logger.start_execution(f"Processing command: {user_message[:50]}...")
+        try:
+            with span('process_command'):
+                state = await asyncio.to_thread(self._prepare, user_message)
+                if 'result' in state:
+                    return state['result']
+                
+                file_name, version = await self._get_file_name_async(user_message, state['files'], state['prompt'])
+                return await asyncio.to_thread(self._finish, state, file_name, version)
+        except Exception as e:
+            return self._error_result(e)
+        finally:
+            self.test_logger.end_execution()
+    
+    def _stream_file_name(self, prompt):
+        """
+        Stream the model answer, stopping as soon as its first line is complete
+        
+        Yields:
+            tuple: ('token', {'text': piece}) events as the answer arrives;
+            the generator's return value is the first line of the answer
+        """
+        answer = ''
+        tokens = self.chat_service.stream_response(prompt, self.stream_max_tokens, ['\n'])
+        try:
+            for text in tokens:
+                answer += text
+                yield 'token', {'text': text}
+                if '\n' in answer.lstrip():
+                    break
+        finally:
+            # Closing the stream ends the generation early
+            tokens.close()
+        return answer.lstrip().split('\n', 1)[0]
+    
+    def process_command_stream(self, user_message):
+        """
+        Process user command, reporting progress while it runs
+        
+        Yields:
+            tuple: (event, data) pairs: ``status`` when a stage starts,
+            ``token`` for each piece of the model answer as it arrives,
+            ``error`` when the command failed, and finally ``result`` with
+            the same payload as process_command
+        """
+        self.test_logger.start_execution(f"Processing command: {user_message[:50]}...")
+        start = time.perf_counter()
+        try:
+            yield 'status', {'stage': 'files'}
+            state = self._prepare(user_message)
+            if 'result' in state:
+                yield 'result', state['result']
+                return
             
+            yield 'status', {'stage': 'model', 'candidates': len(state['files'])}
+            cache_key, version, file_name = self._lookup_response(user_message, state['files'])
+            if file_name is None:
+                answer = yield from self._stream_file_name(state['prompt'])
+                file_name = self._store_response(cache_key, version, state['files'], answer)
+            yield 'result', self._finish(state, file_name, version)
         except Exception as e:
-            # Handle errors appropriately
-            current_app.logger.error(f"Error in CommandService: {str(e)}", exc_info=True)
-            # Make sure to end execution logging even on error
-            if hasattr(self, 'test_logger'):
-                self.test_logger.end_execution()
-            return {
-                'error': str(e),
-                'response': "Sorry, I encountered an error processing your command.",
-                'files': []
-            } 
\ No newline at end of file
+            result = self._error_result(e)
+            # Tokens streamed so far are not part of an answer
+            yield 'error', {'error': result['error']}
+            yield 'result', result
+        finally:
+            observe_stage('process_command', start)
+            self.test_logger.end_execution()
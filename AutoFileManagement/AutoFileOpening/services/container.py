@@ -0,0 +1,116 @@
+import threading
+from interface.test_logger import TestLogger
+from .chat import ChatService
+from .prompt import PromptService
+from .file import FileService
+from .command import CommandService
+from .preview import PreviewService
+
+
+class ServiceContainer:
+    """
+    Application-scoped registry of the chat pipeline services
+
+    Services are built once per process inside an application context and
+    shared by all request threads, so the OpenAI HTTP client (and its
+    connection pool), the white list checks and the prebuilt configuration
+    are reused across requests. ``reload()`` rebuilds them after a
+    configuration change; requests in flight keep the services they started
+    with.
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        self._services = None
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['services'] = self
+
+    def _build(self):
+        with self.app.app_context():
+            chat_service = ChatService()
+            prompt_service = PromptService()
+            file_service = FileService()
+            test_logger = TestLogger()
+            command_service = CommandService(
+                chat_service=chat_service,
+                prompt_service=prompt_service,
+                file_service=file_service,
+                test_logger=test_logger
+            )
+            preview_service = PreviewService(file_service)
+        return {
+            'chat': chat_service,
+            'prompt': prompt_service,
+            'file': file_service,
+            'test_logger': test_logger,
+            'command': command_service,
+            'preview': preview_service
+        }
+
+    def _get(self, name):
+        services = self._services
+        if services is None:
+            with self._lock:
+                if self._services is None:
+                    self._services = self._build()
+                services = self._services
+        return services[name]
+
+    @property
+    def command_service(self):
+        return self._get('command')
+
+    @property
+    def file_service(self):
+        return self._get('file')
+
+    @property
+    def prompt_service(self):
+        return self._get('prompt')
+
+    @property
+    def chat_service(self):
+        return self._get('chat')
+
+    @property
+    def preview_service(self):
+        return self._get('preview')
+
+    @property
+    def test_logger(self):
+        return self._get('test_logger')
+
+    def reload(self, reload_config=True):
+        """
+        Rebuild all services, optionally re-reading the configuration first
+
+        The new services are built before they replace the current ones, and
+        a failing rebuild restores the previous configuration, so the running
+        services never end up paired with a configuration they were not
+        built from.
+        """
+        with self._lock:
+            previous_config = dict(self.app.config)
+            try:
+                if reload_config:
+                    from interface.config import Config
+                    Config(reload_env=True).init_app(self.app)
+                services = self._build()
+            except Exception:
+                self.app.config.clear()
+                self.app.config.update(previous_config)
+                raise
+            previous, self._services = self._services, services
+        if previous is not None:
+            previous['chat'].close()
+        self.app.logger.info('Services reloaded')
+
+
+def get_services(app):
+    """Get the service container of an application"""
+    return app.extensions['services']
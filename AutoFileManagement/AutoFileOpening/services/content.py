@@ -0,0 +1,392 @@
+import codecs
+import collections
+import math
+import multiprocessing
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from prometheus_client import Counter
+from .ranking import STOPWORDS, tokenize
+
+try:
+    import fcntl
+except ImportError:  # Windows: workers may index concurrently, SQLite still serializes the writes
+    fcntl = None
+
+CONTENT_INDEX_FILES = Counter(
+    'content_index_files_total',
+    'Files processed by the content indexer',
+    ['outcome']
+)
+
+READ_CHUNK = 64 * 1024
+# Distinct terms kept per file, the most frequent first
+MAX_TERMS = 2000
+# A word running over a chunk boundary is carried into the next chunk, up to this length
+MAX_CARRY = 256
+# Terms in more documents than this are too common to narrow down a query
+MAX_POSTINGS = 50000
+
+_TRAILING_WORD = re.compile(r'\w+$')
+
+
+def iter_text_chunks(path, max_bytes, encoding='utf-8'):
+    """
+    Read a text file chunk by chunk
+
+    Only ``max_bytes`` are read and at most one chunk is held at a time, so
+    large files are never loaded whole. Undecodable bytes are skipped.
+
+    Yields:
+        str: Decoded text of the next chunk
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors='ignore')
+    remaining = max_bytes
+    with open(path, 'rb') as f:
+        while remaining > 0:
+            data = f.read(min(READ_CHUNK, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield decoder.decode(data)
+    yield decoder.decode(b'', final=True)
+
+
+EXTRACTORS = {}
+
+
+def register_extractor(extensions, extractor):
+    """
+    Register a text extractor for file extensions
+
+    An extractor is called as ``extractor(path, max_bytes)`` and yields the
+    text of the file in chunks, reading at most ``max_bytes``. Extraction
+    runs in worker processes, so extractors must be module-level functions
+    registered when their module is imported.
+    """
+    for extension in extensions:
+        EXTRACTORS[extension.lower().lstrip('.')] = extractor
+
+
+# Punctuation of CSV, JSON and markup is dropped by the tokenizer, so these are read as plain text
+register_extractor(
+    ['txt', 'md', 'markdown', 'rst', 'log', 'csv', 'tsv', 'json', 'yaml', 'yml', 'ini', 'xml', 'html', 'htm'],
+    iter_text_chunks
+)
+
+
+def _tokens(text):
+    return [token for token in tokenize(text) if token not in STOPWORDS and len(token) <= 64]
+
+
+def extract_terms(path, extension, max_bytes, max_terms=MAX_TERMS):
+    """
+    Extract the term frequencies of one file (runs in a worker process)
+
+    Returns:
+        tuple: (path, {term: frequency}, number of tokens); the frequencies
+        are None when the file could not be read
+    """
+    extractor = EXTRACTORS.get(extension)
+    if extractor is None:
+        return path, {}, 0
+    counts = collections.Counter()
+    length = 0
+    carry = ''
+    try:
+        for chunk in extractor(path, max_bytes):
+            text = carry + chunk
+            match = _TRAILING_WORD.search(text)
+            if match and len(text) - match.start() <= MAX_CARRY:
+                text, carry = text[:match.start()], text[match.start():]
+            else:
+                carry = ''
+            tokens = _tokens(text)
+            counts.update(tokens)
+            length += len(tokens)
+        tokens = _tokens(carry)
+        counts.update(tokens)
+        length += len(tokens)
+    except (OSError, ValueError):
+        return path, None, 0
+    return path, dict(counts.most_common(max_terms)), length
+
+
+class ContentIndex:
+    """
+    Persistent inverted index of the text content of files
+
+    Documents are keyed by path and re-extracted only when their size or
+    mtime changed. Extraction runs in a process pool (``workers``; 0
+    extracts on the indexing thread), and reads at most ``max_file_size``
+    bytes of each file. Syncs run on a background thread, so requests never
+    wait for extraction and search whatever is indexed so far. Only one
+    worker process indexes at a time; the SQLite database is shared by all.
+    Queries are scored with BM25.
+    """
+
+    K1 = 1.2
+    B = 0.75
+    STATS_TTL = 30
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS documents (
+        id INTEGER PRIMARY KEY,
+        path TEXT NOT NULL UNIQUE,
+        root TEXT NOT NULL,
+        name TEXT NOT NULL,
+        extension TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        mtime REAL NOT NULL,
+        length INTEGER NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS postings (
+        term TEXT NOT NULL,
+        doc_id INTEGER NOT NULL,
+        tf INTEGER NOT NULL,
+        PRIMARY KEY (term, doc_id)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_postings_doc ON postings(doc_id);
+    """
+
+    def __init__(self, db_path, extensions=None, max_file_size=10 * 1024 * 1024, workers=2,
+                 batch_size=200, logger=None):
+        self.db_path = db_path
+        if extensions is None:
+            self.extensions = set(EXTRACTORS)
+        else:
+            self.extensions = {extension.lower().lstrip('.') for extension in extensions} & set(EXTRACTORS)
+        self.max_file_size = max_file_size
+        self.workers = workers
+        self.batch_size = batch_size
+        self.logger = logger
+        self.version = None
+        self._local = threading.local()
+        self._pool = None
+        self._pending = None
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._stats = None
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._connect().executescript(self.SCHEMA)
+
+    def _connect(self):
+        """Get the SQLite connection of the current thread"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def refresh(self, version, load_files):
+        """
+        Ask the background indexer to sync with load_files() unless the index is at that version
+
+        Returns immediately; the sync runs on the indexing thread.
+        """
+        if version is not None and version == self.version:
+            return
+        self._pending = (version, load_files)
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='content-indexer', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            pending, self._pending = self._pending, None
+            if pending is None:
+                continue
+            version, load_files = pending
+            try:
+                if self.sync(load_files()):
+                    self.version = version
+            except Exception as e:
+                if self.logger:
+                    self.logger.warning(f"Content indexing failed: {e}")
+
+    def sync(self, files):
+        """
+        Bring the index in line with a full file list
+
+        Returns:
+            bool: False when another process is indexing and nothing was done
+        """
+        lock_fd = os.open(self.db_path + '.lock', os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return False
+            self._sync(files)
+            return True
+        finally:
+            os.close(lock_fd)
+
+    def _sync(self, files):
+        conn = self._connect()
+        known = {path: (doc_id, size, mtime)
+                 for doc_id, path, size, mtime in conn.execute('SELECT id, path, size, mtime FROM documents')}
+        current = {f['path']: f for f in files if f['type'] in self.extensions}
+
+        removed = [known[path][0] for path in known if path not in current]
+        if removed:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.executemany('DELETE FROM postings WHERE doc_id = ?', [(doc_id,) for doc_id in removed])
+                conn.executemany('DELETE FROM documents WHERE id = ?', [(doc_id,) for doc_id in removed])
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            CONTENT_INDEX_FILES.labels(outcome='removed').inc(len(removed))
+
+        changed = [f for path, f in current.items()
+                   if path not in known or known[path][1:] != (f['size'], f.get('mtime'))]
+        for start in range(0, len(changed), self.batch_size):
+            batch = changed[start:start + self.batch_size]
+            self._write(conn, batch, self._extract(batch), known)
+        if removed or changed:
+            self._stats = None
+
+    def _extract(self, files):
+        """Extract the term frequencies of files, in the process pool when there is one"""
+        args = [(f['path'], f['type'], self.max_file_size) for f in files]
+        if self.workers <= 0:
+            return [extract_terms(*a) for a in args]
+        if self._pool is None:
+            # Forking this multi-threaded process could copy locks held by other threads. Workers come
+            # from a fork server (a fresh interpreter) instead; like spawned ones they import the main
+            # module, so the entry points only create the application when run as scripts
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context(method))
+        try:
+            return list(self._pool.map(extract_terms, *zip(*args), chunksize=8))
+        except BrokenProcessPool:
+            self._pool = None
+            raise
+
+    def _write(self, conn, files, results, known):
+        """Replace the documents and postings of a batch of extracted files"""
+        records = {f['path']: f for f in files}
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for path, terms, length in results:
+                record = records[path]
+                doc = known.get(path)
+                if doc is not None:
+                    conn.execute('DELETE FROM postings WHERE doc_id = ?', (doc[0],))
+                # Unreadable files are kept with no terms until they change again
+                cursor = conn.execute(
+                    'INSERT INTO documents (path, root, name, extension, size, mtime, length) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(path) DO UPDATE SET '
+                    'root = excluded.root, name = excluded.name, extension = excluded.extension, '
+                    'size = excluded.size, mtime = excluded.mtime, length = excluded.length',
+                    (path, record['directory'], record['name'], record['type'], record['size'],
+                     record.get('mtime', 0), length)
+                )
+                doc_id = doc[0] if doc is not None else cursor.lastrowid
+                if terms:
+                    conn.executemany(
+                        'INSERT INTO postings (term, doc_id, tf) VALUES (?, ?, ?)',
+                        [(term, doc_id, tf) for term, tf in terms.items()]
+                    )
+                CONTENT_INDEX_FILES.labels(
+                    outcome='failed' if terms is None else 'indexed' if terms else 'empty').inc()
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _collection_stats(self, conn):
+        """Document count and average length, recomputed at most every STATS_TTL seconds"""
+        stats = self._stats
+        if stats is None or time.monotonic() - stats[2] > self.STATS_TTL:
+            count, average = conn.execute('SELECT COUNT(*), AVG(length) FROM documents WHERE length > 0').fetchone()
+            stats = self._stats = (count, average or 0.0, time.monotonic())
+        return stats[0], stats[1]
+
+    def search(self, text, roots=None, limit=10):
+        """
+        Get the files whose content best matches a text
+
+        Returns:
+            list: (BM25 score, file dictionary) tuples, best first
+        """
+        terms = set(_tokens(text))
+        if not terms:
+            return []
+        conn = self._connect()
+        count, average_length = self._collection_stats(conn)
+        if not count:
+            return []
+
+        frequencies = collections.defaultdict(list)
+        for term in terms:
+            rows = conn.execute(
+                'SELECT doc_id, tf FROM postings WHERE term = ? LIMIT ?', (term, MAX_POSTINGS + 1)
+            ).fetchall()
+            if not rows or len(rows) > MAX_POSTINGS:
+                continue
+            idf = math.log(1 + (count - len(rows) + 0.5) / (len(rows) + 0.5))
+            for doc_id, tf in rows:
+                frequencies[doc_id].append((idf, tf))
+        if not frequencies:
+            return []
+
+        documents = {}
+        doc_ids = list(frequencies)
+        for start in range(0, len(doc_ids), 500):
+            chunk = doc_ids[start:start + 500]
+            for row in conn.execute(
+                    f"SELECT id, path, root, name, extension, size, mtime, length FROM documents "
+                    f"WHERE id IN ({','.join('?' * len(chunk))})", chunk):
+                documents[row[0]] = row
+
+        roots = set(roots) if roots is not None else None
+        scored = []
+        for doc_id, matches in frequencies.items():
+            row = documents.get(doc_id)
+            if row is None or (roots is not None and row[2] not in roots):
+                continue
+            norm = self.K1 * (1 - self.B + self.B * row[7] / average_length) if average_length else self.K1
+            score = sum(idf * tf * (self.K1 + 1) / (tf + norm) for idf, tf in matches)
+            scored.append((score, row))
+        scored.sort(key=lambda item: (-item[0], item[1][1]))
+        return [(score, {
+            'name': name,
+            'path': path,
+            'type': extension,
+            'size': size,
+            'mtime': mtime,
+            'directory': root
+        }) for score, (_, path, root, name, extension, size, mtime, _) in scored[:limit]]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_content_index(db_path, extensions=None, max_file_size=10 * 1024 * 1024, workers=2,
+                      batch_size=200, logger=None):
+    """Get the process-wide content index for a database path"""
+    with _indexes_lock:
+        index = _indexes.get(db_path)
+        if index is None:
+            index = ContentIndex(db_path, extensions, max_file_size, workers, batch_size, logger)
+            _indexes[db_path] = index
+        return index
@@ -0,0 +1,321 @@
+import json
+import os
+import threading
+import time
+import uuid
+import zlib
+import numpy as np
+from .ranking import STOPWORDS, tokenize
+
+# Extensions whose first bytes are embedded along with the name when snippets are enabled
+SNIPPET_EXTENSIONS = {'txt', 'md', 'csv', 'json', 'py', 'log', 'ini', 'yaml', 'yml', 'html', 'xml'}
+
+
+class HashingEmbedder:
+    """
+    Dependency-free embedder using signed feature hashing
+
+    Word tokens and their character trigrams are hashed into a fixed number
+    of dimensions, so similar names ("budget_2024" / "budgets") land close
+    together without any model download.
+    """
+
+    def __init__(self, dimensions=512):
+        self.dimensions = dimensions
+        self.name = f'hashing-{dimensions}'
+
+    def _features(self, text):
+        for token in tokenize(text):
+            if token in STOPWORDS:
+                continue
+            yield token, 1.0
+            padded = f'<{token}>'
+            for i in range(len(padded) - 2):
+                yield padded[i:i + 3], 0.5
+
+    def embed(self, texts):
+        """
+        Embed texts
+
+        Returns:
+            numpy.ndarray: float32 matrix of L2-normalised rows
+        """
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, weight in self._features(text):
+                digest = zlib.crc32(feature.encode('utf-8'))
+                sign = 1.0 if digest & 0x80000000 else -1.0
+                matrix[row, digest % self.dimensions] += sign * weight
+        return _normalize(matrix)
+
+
+class SentenceTransformerEmbedder:
+    """Embedder backed by a local sentence-transformers model (runs on CPU)"""
+
+    def __init__(self, model_name):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name, device='cpu')
+        self.name = model_name
+
+    def embed(self, texts):
+        vectors = self.model.encode(list(texts), batch_size=64, show_progress_bar=False)
+        return _normalize(np.asarray(vectors, dtype=np.float32))
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def get_embedder(model='hashing', dimensions=512, logger=None):
+    """Get an embedder, falling back to feature hashing when the model is unavailable"""
+    if model and model != 'hashing':
+        try:
+            return SentenceTransformerEmbedder(model)
+        except Exception as e:
+            if logger:
+                logger.warning(f"Embedding model {model} unavailable, using hashing vectorizer: {e}")
+    return HashingEmbedder(dimensions)
+
+
+class EmbeddingIndex:
+    """
+    Vector index of the files in the white list directories
+
+    Each file is embedded from its name, its path below the white list
+    directory and, optionally, a short snippet of its content. Vectors are
+    kept in a NumPy matrix persisted next to the file catalog and loaded
+    memory-mapped, so restarts and sibling workers share the pages instead
+    of re-embedding. Re-syncing only embeds new or modified files; the
+    matrix is written back to disk by a background thread.
+    """
+
+    # Seconds an unreferenced matrix file is kept for workers still loading it
+    STALE_MATRIX_AGE = 60
+
+    def __init__(self, directory, embedder, snippet_bytes=0, logger=None):
+        self.directory = directory
+        self.embedder = embedder
+        self.snippet_bytes = snippet_bytes
+        self.logger = logger
+        self.version = None
+        self._lock = threading.RLock()
+        self._records = []
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._dirty = False
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    @property
+    def _meta_path(self):
+        return os.path.join(self.directory, 'files.json')
+
+    def _load(self):
+        """Load the persisted index if it was built with the same embedder"""
+        try:
+            with open(self._meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta.get('embedder') != self.embedder.name or meta.get('snippet_bytes') != self.snippet_bytes:
+                return
+            # Every save writes a new matrix file, so the one named here is the one the file list was saved with
+            matrix = np.load(os.path.join(self.directory, meta['matrix']), mmap_mode='r')
+            if list(matrix.shape) != meta['shape'] or matrix.shape[0] != len(meta['files']):
+                return
+        except (OSError, ValueError, KeyError, TypeError):
+            return
+        # The source version is not restored: watcher versions are per-process counters, so a new
+        # process always diffs against the files once, re-using the vectors of unchanged files
+        self._records = meta['files']
+        self._matrix = matrix
+
+    def _schedule_save(self):
+        """Ask the background writer to persist the index"""
+        self._dirty = True
+        with self._thread_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='embedding-writer', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            try:
+                self.save()
+            except Exception as e:
+                if self.logger:
+                    self.logger.warning(f"Could not save the embedding index: {e}")
+
+    def save(self):
+        """
+        Persist the index if it changed since the last save
+
+        The matrix goes to a new file named in the file list, so readers never
+        pair a file list with another worker's matrix, and is re-opened
+        memory-mapped once written.
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+            self._dirty = False
+            records, matrix = self._records, self._matrix
+        matrix_name = f'vectors-{uuid.uuid4().hex}.npy'
+        matrix_path = os.path.join(self.directory, matrix_name)
+        tmp_meta = f'{self._meta_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            np.save(matrix_path, np.ascontiguousarray(matrix))
+            mapped = np.load(matrix_path, mmap_mode='r')
+            with open(tmp_meta, 'w', encoding='utf-8') as f:
+                json.dump({
+                    'embedder': self.embedder.name,
+                    'snippet_bytes': self.snippet_bytes,
+                    'matrix': matrix_name,
+                    'shape': list(matrix.shape),
+                    'files': records
+                }, f)
+            os.replace(tmp_meta, self._meta_path)
+        except Exception:
+            with self._lock:
+                self._dirty = True
+            for path in (matrix_path, tmp_meta):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            raise
+        with self._lock:
+            # Swap the in-memory matrix for the shared pages unless a newer sync replaced it meanwhile
+            if self._matrix is matrix:
+                self._matrix = mapped
+        self._remove_stale_matrices(matrix_name)
+
+    def _remove_stale_matrices(self, current):
+        """Remove matrix files of earlier saves (open memory maps stay valid)"""
+        cutoff = time.time() - self.STALE_MATRIX_AGE
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if entry.name == current or not entry.name.startswith('vectors'):
+                        continue
+                    try:
+                        if entry.stat().st_mtime < cutoff:
+                            os.remove(entry.path)
+                    except OSError:
+                        pass
+        except OSError:
+            pass
+
+    def _document_text(self, record):
+        relative = os.path.relpath(record['path'], record['directory'])
+        text = f"{os.path.splitext(relative)[0]} {record['type']}"
+        if self.snippet_bytes and record['type'] in SNIPPET_EXTENSIONS:
+            try:
+                with open(record['path'], 'rb') as f:
+                    text += ' ' + f.read(self.snippet_bytes).decode('utf-8', errors='ignore')
+            except OSError:
+                pass
+        return text
+
+    def refresh(self, version, load_files):
+        """
+        Sync the index with load_files() unless it is already at the given version
+
+        Returns:
+            bool: Whether the index was synced
+        """
+        with self._lock:
+            if version is not None and version == self.version:
+                return False
+            self.sync(load_files(), version)
+            return True
+
+    def sync(self, files, version=None):
+        """Bring the index in line with a full file list, embedding only new or modified files"""
+        with self._lock:
+            previous = {(r['path'], r['size'], r.get('mtime')): row for row, r in enumerate(self._records)}
+            records = []
+            kept_rows = []
+            new_records = []
+            for record in files:
+                record = {key: record.get(key) for key in ('name', 'path', 'type', 'size', 'mtime', 'directory')}
+                row = previous.get((record['path'], record['size'], record['mtime']))
+                if row is None:
+                    new_records.append(record)
+                else:
+                    records.append(record)
+                    kept_rows.append(row)
+
+            parts = []
+            if kept_rows:
+                parts.append(np.asarray(self._matrix[kept_rows], dtype=np.float32))
+            if new_records:
+                parts.append(self.embedder.embed([self._document_text(r) for r in new_records]))
+            records.extend(new_records)
+
+            changed = bool(new_records) or len(kept_rows) != len(self._records)
+            self.version = version
+            if changed:
+                self._records = records
+                self._matrix = np.vstack(parts) if parts else np.zeros((0, 0), dtype=np.float32)
+                self._schedule_save()
+
+    def query(self, text, roots=None, limit=2):
+        """
+        Get the files closest to a text
+
+        Returns:
+            list: (cosine similarity, file dictionary) tuples, best first
+        """
+        with self._lock:
+            if not self._records:
+                return []
+            matrix, records = self._matrix, self._records
+        vector = self.embedder.embed([text])[0]
+        if not vector.any():
+            return []
+        scores = np.asarray(matrix @ vector)
+        if roots is not None:
+            roots = set(roots)
+            mask = np.fromiter((r['directory'] in roots for r in records), dtype=bool, count=len(records))
+            scores = np.where(mask, scores, -1.0)
+        limit = min(limit, len(records))
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[row]), records[row]) for row in top if scores[row] > -1.0]
+
+    def resolve(self, text, roots=None, threshold=0.6, margin=0.15):
+        """
+        Get the single file a text refers to, if the match is confident
+
+        The best match must reach ``threshold`` and beat the runner-up by
+        ``margin``; otherwise None is returned and the caller should ask the LLM.
+
+        Returns:
+            tuple: (cosine similarity, file dictionary) or None
+        """
+        matches = self.query(text, roots, limit=2)
+        if not matches or matches[0][0] < threshold:
+            return None
+        if len(matches) > 1 and matches[0][0] - matches[1][0] < margin:
+            return None
+        return matches[0]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_embedding_index(directory, model='hashing', dimensions=512, snippet_bytes=0, logger=None):
+    """Get the process-wide embedding index stored in a directory"""
+    key = (directory, model, dimensions, snippet_bytes)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = EmbeddingIndex(directory, get_embedder(model, dimensions, logger), snippet_bytes, logger)
+            _indexes[key] = index
+        return index
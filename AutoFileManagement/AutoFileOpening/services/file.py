@@ -1,13 +1,39 @@
+import base64
+import json
 import os
 from pathlib import Path
 from flask import current_app
 import fnmatch
+from .catalog import get_catalog
+from .watcher import get_watcher
+from .walker import get_walker
+from .search import SearchQuery, get_search_index
+from .ranking import CandidateRanker, get_ranker
+from .coalesce import get_single_flight
+from interface.tracing import FILES_SCANNED, traced
+
+
+def _encode_cursor(state):
+    return base64.urlsafe_b64encode(json.dumps(state, separators=(',', ':')).encode('utf-8')).decode('ascii')
+
+
+def _decode_cursor(cursor):
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, UnicodeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(state, dict):
+        raise ValueError("Invalid cursor")
+    return state
+
 
 class FileService:
     def __init__(self):
         self.white_dirs = current_app.config['WHITE_DIRECTORIES']
         self.white_types = current_app.config.get('WHITE_FILE_TYPES', {})
         self.max_file_size = current_app.config.get('MAX_FILE_SIZE', float('inf'))
+        # Type categories used by the search index
+        self.file_categories = current_app.config.get('ALLOWED_FILE_TYPES') or self.white_types
         
         # Validate and expand all directory paths
         self.white_dirs = [os.path.expanduser(os.path.expandvars(d)) for d in self.white_dirs]
@@ -16,7 +42,54 @@ class FileService:
         
         if not self.white_dirs:
             current_app.logger.warning("No valid directories found in whitelist")
+
+        # scandir walker shared by the catalog, the watcher and the fallback walk
+        self.walker_engine = current_app.config.get('WALKER_ENGINE', 'scandir')
+        self.walker = get_walker(
+            current_app.config.get('WALKER_MAX_WORKERS', 8),
+            current_app.config.get('WALKER_EXCLUDE', [])
+        )
+
+        # Persistent file catalog replaces the per-request directory walk
+        self.catalog = None
+        if current_app.config.get('CATALOG_ENABLED', True):
+            try:
+                self.catalog = get_catalog(
+                    current_app.config.get('CATALOG_PATH') or
+                    os.path.join(current_app.config['LOG_DIR'], 'file_catalog.db'),
+                    current_app.config.get('CATALOG_REFRESH_INTERVAL', 5),
+                    walker=self.walker
+                )
+            except Exception as e:
+                current_app.logger.warning(f"File catalog unavailable, falling back to directory walk: {e}")
+
+        # Background watcher keeps an in-memory index so requests don't touch the disk
+        self.watcher = None
+        if current_app.config.get('WATCHER_ENABLED', False) and self.white_dirs:
+            self.watcher = get_watcher(
+                self.white_dirs,
+                current_app.logger,
+                catalog=self.catalog,
+                mode=current_app.config.get('WATCHER_MODE', 'auto'),
+                poll_interval=current_app.config.get('WATCHER_POLL_INTERVAL', 10),
+                coalesce_window=current_app.config.get('WATCHER_COALESCE_WINDOW', 0.2),
+                walker=self.walker
+            )
+        # Watcher index version the catalog was last refreshed at
+        self._catalog_watch_version = None
+
+        # Concurrent listings of the same directories share one scan
+        self.single_flight = None
+        if current_app.config.get('COALESCING_ENABLED', True):
+            lock_path = None
+            if current_app.config.get('COALESCING_CROSS_PROCESS', False):
+                lock_path = current_app.config.get('COALESCING_LOCK_PATH') or \
+                    os.path.join(current_app.config['LOG_DIR'], 'coalesce.lock')
+            self.single_flight = get_single_flight(
+                'get_files', lock_path, current_app.config.get('COALESCING_WAIT_TIMEOUT', 30)
+            )
     
+    @traced('get_files')
     def get_files(self, directory=None, file_type=None):
         """
         Get list of files from white list directories
@@ -32,17 +105,114 @@ class FileService:
                 - path: Full path to the file
                 - type: File extension (without dot)
                 - size: File size in bytes
+                - mtime: Last modification time (timestamp)
                 - directory: Base directory containing the file
+            Concurrent calls for the same directories and type share one
+            list, which must not be modified.
         """
+        search_dirs = self._search_dirs(directory)
+        if self.single_flight is None:
+            return self._get_files(search_dirs, file_type)
+        return self.single_flight.do(
+            (tuple(search_dirs), file_type), lambda: self._get_files(search_dirs, file_type)
+        )
+
+    def _get_files(self, search_dirs, file_type=None):
+        """List files from the watcher index, the catalog or a directory walk"""
+        if self.watcher and self.watcher.ready.is_set():
+            source, files = 'watcher', self.watcher.index.get_files(search_dirs, *self._file_filters(file_type))
+        else:
+            source, files = None, None
+            if self.catalog:
+                try:
+                    source, files = 'catalog', self._get_catalog_files(search_dirs, file_type)
+                except Exception as e:
+                    current_app.logger.warning(f"File catalog query failed, falling back to directory walk: {e}")
+            if files is None:
+                source, files = 'walk', self._walk_files(search_dirs, file_type)
+
+        FILES_SCANNED.labels(source=source).inc(len(files))
+        return files
+
+    def count_files(self, directory=None, file_type=None):
+        """
+        Count the files get_files() would list, without building the list
+
+        Returns:
+            int: Number of files in the white list directories
+        """
+        search_dirs = self._search_dirs(directory)
+        if self.watcher and self.watcher.ready.is_set():
+            return self.watcher.index.count_files(search_dirs, *self._file_filters(file_type))
+        if self.catalog:
+            try:
+                if not self.watcher:
+                    self.catalog.refresh(search_dirs)
+                return self.catalog.count_files(search_dirs, *self._file_filters(file_type))
+            except Exception as e:
+                current_app.logger.warning(f"File catalog count failed, falling back to directory walk: {e}")
+        return len(self.get_files(directory, file_type))
+
+    def _search_dirs(self, directory=None):
+        """Resolve the white list directories to look in"""
+        if directory:
+            directory = os.path.expanduser(os.path.expandvars(directory))
+            return [directory] if directory in self.white_dirs else []
+        return self.white_dirs
+
+    def _get_catalog_files(self, search_dirs, file_type=None):
+        """Get files from the persistent catalog after an incremental refresh"""
+        if not self.watcher:
+            # While the watcher is warming up it owns the catalog refreshes
+            self.catalog.refresh(search_dirs)
+        return self.catalog.get_files(search_dirs, *self._file_filters(file_type))
+
+    def _file_filters(self, file_type=None):
+        """Translate the file type and size limit into (extensions, max_size) index filters"""
+        extensions = None
+        if file_type:
+            extensions = [ext.lower().lstrip('.') for ext in self.white_types.get(file_type, [])]
+        max_size = None if self.max_file_size == float('inf') else self.max_file_size
+        return extensions, max_size
+
+    def _walk_files(self, search_dirs, file_type=None):
+        """Get files by walking the directories with the configured walker engine"""
+        if self.walker_engine == 'os_walk':
+            return self._os_walk_files(search_dirs, file_type)
+
+        for base_dir in search_dirs:
+            if not os.path.exists(base_dir):
+                current_app.logger.warning(f"Directory not found: {base_dir}")
+
+        extensions, max_size = self._file_filters(file_type)
+        extensions = set(extensions) if extensions is not None else None
         files = []
-        
         try:
-            if directory:
-                directory = os.path.expanduser(os.path.expandvars(directory))
-                search_dirs = [directory] if directory in self.white_dirs else []
-            else:
-                search_dirs = self.white_dirs
+            for base_dir, _, entries in self.walker.walk(search_dirs):
+                for path, name, extension, size, mtime in entries:
+                    if extensions is not None and extension not in extensions:
+                        continue
+                    if max_size is not None and size > max_size:
+                        continue
+                    files.append({
+                        'name': name,
+                        'path': path,
+                        'type': extension,
+                        'size': size,
+                        'mtime': mtime,
+                        'directory': base_dir
+                    })
+        except Exception as e:
+            current_app.logger.error(f"Error in get_files: {e}")
+            return []
+
+        return files
 
+    def _os_walk_files(self, search_dirs, file_type=None):
+        """Get files with os.walk (legacy walker engine)"""
+        files = []
+
+        try:
             for base_dir in search_dirs:
                 if not os.path.exists(base_dir):
                     current_app.logger.warning(f"Directory not found: {base_dir}")
@@ -149,9 +319,354 @@ class FileService:
             list: List of matching files
         """
         try:
+            index = self._get_search_index()
+            if index is not None:
+                _, max_size = self._file_filters()
+                return index.search(pattern, self._search_dirs(directory), max_size=max_size,
+                                    limit=None, whole_name=True)[1]
             all_files = self.get_files(directory)
             return [f for f in all_files 
                     if fnmatch.fnmatch(f['name'].lower(), pattern.lower())]
         except Exception as e:
             current_app.logger.error(f"Error in search_files: {e}")
-            return []
\ No newline at end of file
+            return []
+
+    def find_files(self, pattern, directory=None, file_type=None, min_size=None, max_size=None,
+                     modified_after=None, modified_before=None, page=1, page_size=50):
+        """
+        Find files by name in white list directories, one ranked page at a time
+        
+        Args:
+            pattern (str): Search pattern, a substring or a wildcard pattern
+            directory (str, optional): Specific directory to search in
+            file_type (str, optional): Type category from ALLOWED_FILE_TYPES
+            min_size (int, optional): Minimum file size in bytes
+            max_size (int, optional): Maximum file size in bytes
+            modified_after (float, optional): Minimum modification timestamp
+            modified_before (float, optional): Maximum modification timestamp
+            page (int, optional): Page number, starting at 1
+            page_size (int, optional): Number of files per page
+            
+        Returns:
+            dict: Ranked matching files of the page ('files'), the total number
+            of matches ('total'), 'page' and 'page_size'
+        """
+        page = max(page, 1)
+        if self.max_file_size != float('inf'):
+            max_size = self.max_file_size if max_size is None else min(max_size, self.max_file_size)
+        filters = {
+            'category': file_type,
+            'min_size': min_size,
+            'max_size': max_size,
+            'modified_after': modified_after,
+            'modified_before': modified_before
+        }
+        try:
+            search_dirs = self._search_dirs(directory)
+            index = self._get_search_index()
+            if index is not None:
+                total, files = index.search(pattern, search_dirs, offset=(page - 1) * page_size,
+                                            limit=page_size, **filters)
+            else:
+                total, files = self._scan_search(pattern, search_dirs, (page - 1) * page_size,
+                                                 page_size, **filters)
+        except Exception as e:
+            current_app.logger.error(f"Error in find_files: {e}")
+            total, files = 0, []
+        return {'files': files, 'total': total, 'page': page, 'page_size': page_size}
+
+    def _file_source(self):
+        """
+        Get the file source backing the in-memory indexes
+
+        Returns:
+            tuple: (key, version, load_files) for the watcher index or the
+            catalog, or None when neither is available
+        """
+        if self.watcher and self.watcher.ready.is_set():
+            key = ('watcher',) + tuple(self.watcher.roots)
+            return key, self.watcher.index.version, self.watcher.index.get_files
+        if self.catalog:
+            if not self.watcher:
+                self.catalog.refresh(self.white_dirs)
+            key = ('catalog', self.catalog.db_path) + tuple(self.white_dirs)
+            return key, self.catalog.version(), self.catalog.get_files
+        return None
+
+    def get_version(self):
+        """
+        Get the version of the file index, which changes whenever files change
+
+        Returns:
+            The watcher index or catalog version, None when neither is available
+        """
+        try:
+            source = self._file_source()
+        except Exception as e:
+            current_app.logger.warning(f"Could not read file index version: {e}")
+            return None
+        return source[1] if source else None
+
+    def get_listing_version(self, directory=None):
+        """
+        Get the catalog version the file listing is served from
+
+        Unlike get_version this is the same in all workers, so clients can
+        compare it across requests. While the watcher runs, the catalog is
+        only refreshed after the watcher saw a change.
+
+        Returns:
+            int: Catalog version, None without a catalog
+        """
+        if not self.catalog:
+            return None
+        try:
+            if self.watcher and self.watcher.ready.is_set():
+                watch_version = self.watcher.index.version
+                if watch_version != self._catalog_watch_version:
+                    self.catalog.refresh(self.white_dirs, force=True)
+                    self._catalog_watch_version = watch_version
+            else:
+                self.catalog.refresh(self._search_dirs(directory))
+            return self.catalog.version()
+        except Exception as e:
+            current_app.logger.warning(f"Could not read catalog version: {e}")
+            return None
+
+    @traced('list_files')
+    def list_files(self, cursor=None, limit=1000, since=None, directory=None, file_type=None):
+        """
+        Get one page of the file listing in a compact columnar form
+
+        Files are listed in (root, path) order and paged with a cursor. With
+        ``since``, only files changed after that catalog version are listed,
+        together with the files removed since. Pages following the first
+        keep its version, so asking for the changes since the returned
+        version after the last page also catches changes made while paging.
+
+        Args:
+            cursor (str, optional): ``next_cursor`` of the previous page
+            limit (int, optional): Maximum number of files in the page
+            since (int, optional): Catalog version the client already has
+            directory (str, optional): Specific directory to list
+            file_type (str, optional): Type of files to list
+
+        Returns:
+            dict: ``version``, ``delta`` (only changes are listed), ``reset``
+            (``since`` is too old, the full listing follows), ``roots``,
+            ``files`` as columns (``root`` index, ``path`` relative to the
+            root, ``type``, ``size``, ``mtime``), ``removed`` as columns
+            (``root``, ``path``) and ``next_cursor`` (None on the last page)
+        """
+        search_dirs = self._search_dirs(directory)
+        extensions, max_size = self._file_filters(file_type)
+        state = _decode_cursor(cursor) if cursor else None
+        reset = False
+        removed = []
+
+        if not self.catalog:
+            # Without a catalog there are no versions: page through a full listing
+            offset = int(state.get('o', 0)) if state else 0
+            files = sorted(self.get_files(directory, file_type),
+                           key=lambda f: (search_dirs.index(f['directory']), f['path']))
+            rows = [(search_dirs.index(f['directory']), f['path'], f['type'], f['size'], f.get('mtime'))
+                    for f in files[offset:offset + limit]]
+            next_cursor = _encode_cursor({'o': offset + limit}) if offset + limit < len(files) else None
+            return self._listing_page(None, False, since is not None, search_dirs, rows, removed, next_cursor)
+
+        if state is None:
+            version = self.get_listing_version(directory)
+            if since is not None and not self.catalog.delta_floor() <= since <= version:
+                # Changes that old are no longer recorded, or the catalog was rebuilt
+                since, reset = None, True
+            if since is not None:
+                removed = self.catalog.removed_since(search_dirs, since)
+            after = None
+        else:
+            try:
+                version, since = state['v'], state.get('s')
+                after = (int(state['r']), state['p'])
+            except (KeyError, TypeError, ValueError):
+                raise ValueError("Invalid cursor")
+            if not 0 <= after[0] < len(search_dirs):
+                raise ValueError("Cursor does not match the listed directories")
+
+        rows = self.catalog.list_files(search_dirs, extensions, max_size, since, after, limit + 1)
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor({'v': version, 's': since, 'r': rows[-1][0], 'p': rows[-1][1]})
+        return self._listing_page(version, since is not None, reset, search_dirs, rows, removed, next_cursor)
+
+    @staticmethod
+    def _listing_page(version, delta, reset, roots, rows, removed, next_cursor):
+        """Encode listing rows as columns, with paths relative to their root"""
+        def relative(index, path):
+            prefix = roots[index].rstrip(os.sep) + os.sep
+            return path[len(prefix):] if path.startswith(prefix) else path
+
+        return {
+            'version': version,
+            'delta': delta,
+            'reset': reset,
+            'roots': roots,
+            'files': {
+                'root': [row[0] for row in rows],
+                'path': [relative(row[0], row[1]) for row in rows],
+                'type': [row[2] for row in rows],
+                'size': [row[3] for row in rows],
+                'mtime': [row[4] for row in rows]
+            },
+            'removed': {
+                'root': [index for index, _ in removed],
+                'path': [relative(index, path) for index, path in removed]
+            },
+            'next_cursor': next_cursor
+        }
+
+    def _get_search_index(self):
+        """Get the search index kept in sync with the watcher index or the catalog"""
+        source = self._file_source()
+        if source is None:
+            return None
+        key, version, load_files = source
+        index = get_search_index(key, self.file_categories)
+        index.refresh(version, lambda: load_files(self.white_dirs))
+        return index
+
+    @traced('rank_files')
+    def rank_files(self, message, limit=5, directory=None):
+        """
+        Get the files most relevant to a chat message
+
+        Args:
+            message (str): User chat message
+            limit (int, optional): Number of candidates to return
+            directory (str, optional): Specific directory to rank files in
+
+        Returns:
+            list: Up to ``limit`` file dictionaries, best match first
+        """
+        search_dirs = self._search_dirs(directory)
+        options = {
+            'hint_boost': current_app.config.get('RANKING_HINT_BOOST', 2.0),
+            'recency_weight': current_app.config.get('RANKING_RECENCY_WEIGHT', 0.5),
+            'recency_half_life': current_app.config.get('RANKING_RECENCY_HALF_LIFE_DAYS', 30) * 86400
+        }
+        try:
+            source = self._file_source()
+        except Exception as e:
+            current_app.logger.warning(f"File index unavailable for ranking, ranking a directory walk: {e}")
+            source = None
+
+        if source is None:
+            ranker = CandidateRanker(self.file_categories, **options)
+            ranker.sync(self._walk_files(search_dirs))
+        else:
+            key, version, load_files = source
+            ranker = get_ranker(key, self.file_categories, **options)
+            ranker.refresh(version, lambda: load_files(self.white_dirs))
+
+        return ranker.rank(message, search_dirs, limit, max_size=self._file_filters()[1])
+
+    @traced('content_search')
+    def search_content(self, message, limit=5, directory=None):
+        """
+        Get the files whose text content best matches a chat message
+
+        Args:
+            message (str): User chat message
+            limit (int, optional): Number of files to return
+            directory (str, optional): Specific directory to look in
+
+        Returns:
+            list: Up to ``limit`` file dictionaries, best match first. Files
+            still waiting for extraction are not found yet.
+        """
+        # Imported on first use, the content index is only needed when enabled
+        from .content import get_content_index
+        try:
+            source = self._file_source()
+            if source is None:
+                return []
+            key, version, load_files = source
+            extensions = None
+            if self.file_categories:
+                extensions = [ext for extensions in self.file_categories.values() for ext in extensions]
+            index = get_content_index(
+                current_app.config.get('CONTENT_INDEX_PATH') or
+                os.path.join(current_app.config['LOG_DIR'], 'content_index.db'),
+                extensions,
+                current_app.config.get('MAX_PROCESSABLE_FILE_SIZE', 10 * 1024 * 1024),
+                current_app.config.get('CONTENT_INDEX_WORKERS', 2),
+                current_app.config.get('CONTENT_INDEX_BATCH_SIZE', 200),
+                current_app.logger
+            )
+            index.refresh(version, lambda: load_files(self.white_dirs))
+            return [file for _, file in index.search(message, self._search_dirs(directory), limit)]
+        except Exception as e:
+            current_app.logger.warning(f"Content search failed: {e}")
+            return []
+
+    @traced('resolve_file')
+    def resolve_file(self, message, directory=None):
+        """
+        Find the file a chat message refers to from the embedding index
+
+        Args:
+            message (str): User chat message
+            directory (str, optional): Specific directory to look in
+
+        Returns:
+            tuple: (similarity, file dictionary) for a confident match, None
+            when the match is ambiguous or no file index is available
+        """
+        # Imported on first use, NumPy is only needed with the embedding index enabled
+        from .embedding import get_embedding_index
+        try:
+            source = self._file_source()
+            if source is None:
+                return None
+            key, version, load_files = source
+            index = get_embedding_index(
+                current_app.config.get('EMBEDDING_PATH') or
+                os.path.join(current_app.config['LOG_DIR'], 'embeddings'),
+                current_app.config.get('EMBEDDING_MODEL', 'hashing'),
+                current_app.config.get('EMBEDDING_DIMENSIONS', 512),
+                current_app.config.get('EMBEDDING_SNIPPET_BYTES', 0),
+                current_app.logger
+            )
+            # Versions of different sources are not comparable, the index may outlive a switch of source
+            index.refresh((key, version), lambda: load_files(self.white_dirs, *self._file_filters()))
+            return index.resolve(
+                message,
+                self._search_dirs(directory),
+                current_app.config.get('EMBEDDING_THRESHOLD', 0.6),
+                current_app.config.get('EMBEDDING_MARGIN', 0.15)
+            )
+        except Exception as e:
+            current_app.logger.warning(f"Embedding lookup failed, falling back to the LLM: {e}")
+            return None
+
+    def _scan_search(self, pattern, search_dirs, offset, limit, category=None, min_size=None, max_size=None,
+                     modified_after=None, modified_before=None):
+        """Search by scanning a full directory walk, used without a catalog or watcher"""
+        query = SearchQuery(pattern or '')
+        extensions = None
+        if category:
+            extensions = {ext.strip().lower().lstrip('.') for ext in self.file_categories.get(category, [])}
+        matches = []
+        for f in self._walk_files(search_dirs):
+            if extensions is not None and f['type'] not in extensions:
+                continue
+            if (min_size is not None and f['size'] < min_size) or (max_size is not None and f['size'] > max_size):
+                continue
+            mtime = f.get('mtime', 0)
+            if ((modified_after is not None and mtime < modified_after) or
+                    (modified_before is not None and mtime > modified_before)):
+                continue
+            name = f['name'].lower()
+            if query.matches(name):
+                matches.append((query.rank(f, name), f))
+        matches.sort(key=lambda match: match[0])
+        return len(matches), [f for _, f in matches[offset:offset + limit]]
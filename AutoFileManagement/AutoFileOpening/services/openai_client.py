@@ -1,19 +1,118 @@
+import asyncio
 import os
-from openai import OpenAI
+import threading
+import time
+from functools import lru_cache
 from flask import current_app
-import tiktoken
-from dotenv import load_dotenv
+from interface.config import load_env
+from interface.tracing import PROMPT_TOKENS, observe_stage, span, traced
+from .resilience import get_call_policy
+
+PROMPT_TOO_LONG = "Sorry, the prompt is too long. Please try with fewer files or a shorter message."
+
+# Share of the prompt budget fit_lines keeps free: tokens can merge across the
+# line boundaries, so counting lines one by one may undercount the joined prompt
+FIT_MARGIN = 0.02
+
+# Encodings by model, None for a model whose encoding could not be loaded
+_encodings = {}
+_encoding_errors = {}
+_encodings_lock = threading.Lock()
+
+
+def get_encoding(model):
+    """
+    Get the process-wide tiktoken encoding for a model (cl100k_base for unknown models)
+
+    Loading may download the BPE ranks. A failure (e.g. offline) is cached
+    too, so it is tried once per process and token counts fall back to an
+    estimate instead of retrying the download on every prompt.
+
+    Returns:
+        The encoding, or None when it could not be loaded
+    """
+    if model not in _encodings:
+        with _encodings_lock:
+            if model not in _encodings:
+                try:
+                    # Imported on first use: loading tiktoken is slow and not needed to start serving
+                    import tiktoken
+                    try:
+                        encoding = tiktoken.encoding_for_model(model)
+                    except KeyError:
+                        encoding = tiktoken.get_encoding('cl100k_base')
+                except Exception as e:
+                    encoding = None
+                    _encoding_errors[model] = e
+                _encodings[model] = encoding
+    return _encodings[model]
+
+
+def estimate_tokens(text):
+    """Rough token count without a tokenizer (1 token ≈ 4 characters)"""
+    return len(text) // 4
+
+
+@lru_cache(maxsize=65536)
+def _count_line_tokens(model, line):
+    encoding = get_encoding(model)
+    if encoding is None:
+        return estimate_tokens(line) + 1
+    return len(encoding.encode(line))
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_openai_client(api_key, base_url=None, pool_size=20):
+    """
+    Get the process-wide OpenAI client for an API key and endpoint
+
+    All requests share one keep-alive connection pool. SDK retries are
+    disabled, retries are done by the call policy.
+    """
+    key = (api_key, base_url, pool_size)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            import httpx
+            from openai import OpenAI
+            client = OpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                max_retries=0,
+                http_client=httpx.Client(limits=httpx.Limits(
+                    max_connections=pool_size, max_keepalive_connections=pool_size))
+            )
+            _clients[key] = client
+        return client
+
 
 class OpenAIClient:
     def __init__(self):
-        # Force reload environment variables
-        load_dotenv(override=True)
+        # .env is read once per process (and again on a configuration reload)
+        load_env()
         
         self.api_key = os.getenv('OPENAI_API_KEY')
         self.enabled = current_app.config.get('OPENAI_ENABLED', False)
         self.model = current_app.config.get('OPENAI_MODEL', 'gpt-3.5-turbo')
         self.temperature = current_app.config.get('OPENAI_TEMPERATURE', 0.7)
         self.max_tokens = current_app.config.get('MAX_PROMPT_TOKENS', 2000)
+        # Custom endpoint, e.g. a proxy or a local stub server for tests
+        self.base_url = current_app.config.get('OPENAI_BASE_URL') or None
+        self.pool_size = current_app.config.get('OPENAI_POOL_SIZE', 20)
+        # Deadlines, retries, limits and hedging of every model call
+        self.policy = get_call_policy(
+            timeout=current_app.config.get('OPENAI_TIMEOUT', 30.0),
+            request_timeout=current_app.config.get('OPENAI_REQUEST_TIMEOUT', 15.0),
+            max_retries=current_app.config.get('OPENAI_MAX_RETRIES', 3),
+            max_concurrency=current_app.config.get('OPENAI_MAX_CONCURRENCY', 8),
+            requests_per_minute=current_app.config.get('OPENAI_REQUESTS_PER_MINUTE', 0),
+            tokens_per_minute=current_app.config.get('OPENAI_TOKENS_PER_MINUTE', 0),
+            hedge_after=current_app.config.get('OPENAI_HEDGE_AFTER', 0.0),
+            logger=current_app.logger
+        )
         
         # Log API key status (first few characters only)
         if self.api_key:
@@ -21,21 +120,96 @@ class OpenAIClient:
         else:
             current_app.logger.warning('No API key found in environment variables')
         
+        self.async_client = None
+        self._async_loop = None
+        self._async_lock = threading.Lock()
         if self.enabled:
             if not self.api_key:
                 current_app.logger.error('OpenAI API key not found in environment variables')
                 raise ValueError("OpenAI API key not found in environment variables")
-            self.client = OpenAI(api_key=self.api_key)
+            self.client = get_openai_client(self.api_key, self.base_url, self.pool_size)
+        
+        # Load the encoder now rather than on the first request
+        if get_encoding(self.model) is None:
+            current_app.logger.warning(
+                f"Could not load tokenizer for {self.model}, estimating token counts: "
+                f"{_encoding_errors.get(self.model)}"
+            )
     
     def _count_tokens(self, text):
         """Count the number of tokens in the text"""
+        encoding = get_encoding(self.model)
+        if encoding is None:
+            return estimate_tokens(text)
         try:
-            encoding = tiktoken.encoding_for_model(self.model)
             return len(encoding.encode(text))
         except Exception as e:
             current_app.logger.warning(f"Error counting tokens: {e}")
-            # Fallback: rough estimate (1 token ≈ 4 characters)
-            return len(text) // 4
+            return estimate_tokens(text)
+    
+    def _count_line_tokens(self, line):
+        """Count the tokens of one line (including its line break), cached across requests"""
+        try:
+            return _count_line_tokens(self.model, line + '\n')
+        except Exception:
+            return estimate_tokens(line) + 1
+    
+    @traced('count_tokens')
+    def fit_lines(self, fixed_text, lines, max_tokens=None):
+        """
+        Get how many of the given lines fit into the token budget
+        
+        The fixed part of the prompt is encoded once and each line is counted
+        separately, so trimming a list does not re-encode the whole prompt.
+        FIT_MARGIN of the budget is kept free for the difference to the
+        encoded prompt.
+        
+        Args:
+            fixed_text (str): Prompt text without the lines
+            lines (list): Lines in priority order
+            max_tokens (int, optional): Token budget, defaults to MAX_PROMPT_TOKENS
+            
+        Returns:
+            int: Number of leading lines that fit
+        """
+        max_tokens = max_tokens or self.max_tokens
+        budget = max_tokens - int(max_tokens * FIT_MARGIN) - self._count_tokens(fixed_text)
+        for count, line in enumerate(lines):
+            budget -= self._count_line_tokens(line)
+            if budget < 0:
+                return count
+        return len(lines)
+    
+    def _check_prompt(self, prompt):
+        """
+        Handle prompts that must not reach the API
+        
+        Returns:
+            tuple: (response to return instead of calling the API or None,
+            prompt token count)
+        """
+        # Check token count
+        with span('count_tokens'):
+            token_count = self._count_tokens(prompt)
+        if token_count > self.max_tokens:
+            current_app.logger.warning(
+                f"Prompt size ({token_count} tokens) exceeds maximum ({self.max_tokens}). "
+                "Consider reducing the number of files or prompt length."
+            )
+            return PROMPT_TOO_LONG, token_count
+        
+        if not self.enabled:
+            # MOCK: Return test response
+            mock_response = f"This is a test response<br>Received prompt: {prompt[:100]}...<br>commands: open [filename], list files, help"
+            current_app.logger.info('Generated mock response (OpenAI API is disabled)')
+            return mock_response, token_count
+        return None, token_count
+    
+    @staticmethod
+    def _count_prompt_tokens(response, model, token_count):
+        """Count the prompt tokens sent, as billed by the API when it reports usage"""
+        usage = getattr(response, 'usage', None)
+        PROMPT_TOKENS.labels(model=model).inc(getattr(usage, 'prompt_tokens', None) or token_count)
     
     def create_chat_completion(self, prompt, model=None):
         """
@@ -49,30 +223,163 @@ class OpenAIClient:
             str: API response text
         """
         try:
-            # Check token count
-            token_count = self._count_tokens(prompt)
-            if token_count > self.max_tokens:
-                current_app.logger.warning(
-                    f"Prompt size ({token_count} tokens) exceeds maximum ({self.max_tokens}). "
-                    "Consider reducing the number of files or prompt length."
-                )
-                return "Sorry, the prompt is too long. Please try with fewer files or a shorter message."
-            
-            if not self.enabled:
-                # MOCK: Return test response
-                mock_response = f"This is a test response<br>Received prompt: {prompt[:100]}...<br>commands: open [filename], list files, help"
-                current_app.logger.info('Generated mock response (OpenAI API is disabled)')
-                return mock_response
+            early_response, token_count = self._check_prompt(prompt)
+            if early_response is not None:
+                return early_response
             
             # Real API call
             current_app.logger.info(f'Calling OpenAI API with model {model or self.model}')
-            response = self.client.chat.completions.create(
-                model=model or self.model,
+            def request(timeout):
+                return self.client.chat.completions.create(
+                    model=model or self.model,
+                    messages=[
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=self.temperature,
+                    timeout=timeout
+                )
+            
+            with span('llm_request'):
+                response = self.policy.call(request, token_count)
+            self._count_prompt_tokens(response, model or self.model, token_count)
+            
+            current_app.logger.info('Successfully received response from OpenAI API')
+            return response.choices[0].message.content
+        
+        except Exception as e:
+            current_app.logger.error(f"OpenAI API error: {str(e)}", exc_info=True)
+            raise
+    
+    def stream_chat_completion(self, prompt, model=None, max_tokens=None, stop=None):
+        """
+        Call OpenAI API and yield the response text as it is generated
+        
+        Only opening the stream is retried. Closing the generator closes the
+        connection, which stops the generation.
+        
+        Args:
+            prompt (str): Complete prompt text
+            model (str, optional): Model name to use
+            max_tokens (int, optional): Maximum completion tokens
+            stop (list, optional): Stop sequences
+            
+        Yields:
+            str: Pieces of the response text
+        """
+        early_response, token_count = self._check_prompt(prompt)
+        if early_response is not None:
+            yield early_response
+            return
+        
+        model = model or self.model
+        current_app.logger.info(f'Calling OpenAI API (streaming) with model {model}')
+        def request(timeout):
+            return self.client.chat.completions.create(
+                model=model,
                 messages=[
                     {"role": "user", "content": prompt}
                 ],
-                temperature=self.temperature
+                temperature=self.temperature,
+                max_tokens=max_tokens,
+                stop=stop,
+                stream=True,
+                timeout=timeout
             )
+        
+        start = time.perf_counter()
+        try:
+            # Not hedged: a losing stream would keep generating tokens nobody reads
+            stream = self.policy.call(request, token_count, hedge=False)
+        except Exception as e:
+            current_app.logger.error(f"OpenAI API error: {str(e)}", exc_info=True)
+            raise
+        PROMPT_TOKENS.labels(model=model).inc(token_count)
+        
+        first_token = True
+        try:
+            for chunk in stream:
+                text = chunk.choices[0].delta.content if chunk.choices else None
+                if text:
+                    if first_token:
+                        observe_stage('llm_first_token', start)
+                        first_token = False
+                    yield text
+        finally:
+            stream.close()
+            observe_stage('llm_request', start)
+    
+    def _get_async_client(self):
+        """Get the async OpenAI client, created on first use so sync deployments never build it"""
+        if self.async_client is None:
+            with self._async_lock:
+                if self.async_client is None:
+                    import httpx
+                    from openai import AsyncOpenAI
+                    self._async_loop = asyncio.get_running_loop()
+                    self.async_client = AsyncOpenAI(
+                        api_key=self.api_key,
+                        base_url=self.base_url,
+                        max_retries=0,
+                        http_client=httpx.AsyncClient(limits=httpx.Limits(
+                            max_connections=self.pool_size, max_keepalive_connections=self.pool_size))
+                    )
+        return self.async_client
+    
+    def close(self):
+        """
+        Close the async client once the requests still using it are done
+        
+        Called when the services are rebuilt; the sync client is shared by
+        the process and stays open.
+        """
+        with self._async_lock:
+            client, loop = self.async_client, self._async_loop
+            self.async_client = self._async_loop = None
+        if client is None or loop.is_closed():
+            return
+        
+        async def close_later():
+            # Requests started before the rebuild may run until the call deadline
+            await asyncio.sleep(self.policy.timeout or 0)
+            await client.close()
+        
+        try:
+            asyncio.run_coroutine_threadsafe(close_later(), loop)
+        except RuntimeError:
+            pass
+    
+    async def create_chat_completion_async(self, prompt, model=None):
+        """
+        Call OpenAI API without blocking the event loop
+        
+        Args:
+            prompt (str): Complete prompt text
+            model (str, optional): Model name to use
+            
+        Returns:
+            str: API response text
+        """
+        try:
+            early_response, token_count = self._check_prompt(prompt)
+            if early_response is not None:
+                return early_response
+            
+            current_app.logger.info(f'Calling OpenAI API (async) with model {model or self.model}')
+            client = self._get_async_client()
+            
+            async def request(timeout):
+                return await client.chat.completions.create(
+                    model=model or self.model,
+                    messages=[
+                        {"role": "user", "content": prompt}
+                    ],
+                    temperature=self.temperature,
+                    timeout=timeout
+                )
+            
+            with span('llm_request'):
+                response = await self.policy.call_async(request, token_count)
+            self._count_prompt_tokens(response, model or self.model, token_count)
             
             current_app.logger.info('Successfully received response from OpenAI API')
             return response.choices[0].message.content
@@ -0,0 +1,356 @@
+import codecs
+import hashlib
+import io
+import mmap
+import os
+import sqlite3
+import threading
+import time
+from flask import current_app
+from prometheus_client import Counter
+from .coalesce import get_single_flight
+from interface.tracing import traced
+
+THUMBNAIL_REQUESTS = Counter(
+    'preview_thumbnail_requests_total',
+    'Thumbnail lookups by outcome',
+    ['outcome']
+)
+THUMBNAIL_EVICTIONS = Counter(
+    'preview_thumbnail_evictions_total',
+    'Thumbnails removed from the cache to stay within its size'
+)
+
+IMAGE_TYPES = {'png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp', 'tif', 'tiff'}
+# Bytes of the head checked for NUL bytes to tell text from binary files
+BINARY_SNIFF = 8192
+# Last-used times are only written back when older than this, so hits rarely write
+TOUCH_INTERVAL = 60
+
+
+def read_head(path, max_bytes):
+    """
+    Read the first bytes of a file
+
+    Only the first ``max_bytes`` of the file are memory-mapped, so only the
+    pages holding them are read, however large the file is. Files that can't
+    be mapped (empty files, some special and network files) are read with a
+    single bounded read instead.
+
+    Returns:
+        bytes: Up to ``max_bytes`` bytes from the start of the file
+    """
+    with open(path, 'rb') as f:
+        length = min(os.fstat(f.fileno()).st_size, max_bytes)
+        if length <= 0:
+            return f.read(max_bytes)
+        try:
+            with mmap.mmap(f.fileno(), length, access=mmap.ACCESS_READ) as mapped:
+                return mapped[:length]
+        except (OSError, ValueError):
+            return f.read(max_bytes)
+
+
+def decode_head(data):
+    """Decode UTF-8 text cut at an arbitrary byte, dropping a trailing partial character"""
+    return codecs.getincrementaldecoder('utf-8')(errors='replace').decode(data, final=False)
+
+
+class ThumbnailCache:
+    """
+    Content-addressed on-disk cache of image thumbnails
+
+    Thumbnails are stored under the SHA-256 of the source image and the
+    thumbnail settings, so copies of an image share one thumbnail, and
+    looked up by path, size and mtime, so an unchanged image is never read
+    again. The cache is shared by all workers through an SQLite index and
+    stays within ``max_bytes`` by evicting the least recently used
+    thumbnails. Thumbnails are generated with Pillow; without it, no
+    thumbnail is available.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS thumbnails (
+        digest TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        bytes INTEGER NOT NULL,
+        used REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_thumbnails_used ON thumbnails(used);
+    CREATE TABLE IF NOT EXISTS sources (
+        path TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        mtime REAL NOT NULL,
+        digest TEXT NOT NULL
+    );
+    """
+
+    def __init__(self, directory, max_bytes=100 * 1024 * 1024, size=256, max_source_size=50 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = size
+        self.max_source_size = max_source_size
+        self._local = threading.local()
+        os.makedirs(directory, exist_ok=True)
+        self._connect().executescript(self.SCHEMA)
+
+    def _connect(self):
+        """Get the SQLite connection of the current thread"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.directory, 'index.db'), timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _file(self, name):
+        return os.path.join(self.directory, name[:2], name)
+
+    def get(self, path, size, mtime):
+        """
+        Get the thumbnail of an image, generating it on a miss
+
+        Returns:
+            str: Path of the cached thumbnail, None when the image can't be
+            thumbnailed
+        """
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute(
+            'SELECT t.digest, t.name, t.used FROM sources s JOIN thumbnails t ON t.digest = s.digest '
+            'WHERE s.path = ? AND s.size = ? AND s.mtime = ?', (path, size, mtime)
+        ).fetchone()
+        if row is not None and os.path.exists(self._file(row[1])):
+            if now - row[2] > TOUCH_INTERVAL:
+                conn.execute('UPDATE thumbnails SET used = ? WHERE digest = ?', (now, row[0]))
+            THUMBNAIL_REQUESTS.labels(outcome='hit').inc()
+            return self._file(row[1])
+
+        if size > self.max_source_size:
+            THUMBNAIL_REQUESTS.labels(outcome='too_large').inc()
+            return None
+        with open(path, 'rb') as f:
+            data = f.read(self.max_source_size + 1)
+        digest = hashlib.sha256(data + f'|{self.size}'.encode('ascii')).hexdigest()
+
+        # Same content under another path or mtime
+        existing = conn.execute('SELECT name FROM thumbnails WHERE digest = ?', (digest,)).fetchone()
+        if existing is not None and os.path.exists(self._file(existing[0])):
+            name = existing[0]
+            THUMBNAIL_REQUESTS.labels(outcome='shared').inc()
+        else:
+            thumbnail = self._render(data)
+            if thumbnail is None:
+                THUMBNAIL_REQUESTS.labels(outcome='failed').inc()
+                return None
+            content, extension = thumbnail
+            name = f'{digest}.{extension}'
+            target = self._file(name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            temp = f'{target}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(temp, 'wb') as f:
+                f.write(content)
+            os.replace(temp, target)
+            THUMBNAIL_REQUESTS.labels(outcome='generated').inc()
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                'INSERT OR REPLACE INTO thumbnails (digest, name, bytes, used) VALUES (?, ?, ?, ?)',
+                (digest, name, os.path.getsize(self._file(name)), now)
+            )
+            conn.execute(
+                'INSERT OR REPLACE INTO sources (path, size, mtime, digest) VALUES (?, ?, ?, ?)',
+                (path, size, mtime, digest)
+            )
+            evicted = self._evict(conn, digest)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        for evicted_name in evicted:
+            try:
+                os.remove(self._file(evicted_name))
+            except OSError:
+                pass
+        return self._file(name)
+
+    def _evict(self, conn, keep):
+        """Drop the least recently used thumbnails beyond max_bytes except ``keep``, returning their file names"""
+        evicted = [row[0] for row in conn.execute(
+            'SELECT name FROM thumbnails WHERE digest != ? AND digest IN (SELECT digest FROM ('
+            'SELECT digest, SUM(bytes) OVER (ORDER BY digest = ? DESC, used DESC, digest) AS total FROM thumbnails'
+            ') WHERE total > ?)', (keep, keep, self.max_bytes)
+        )]
+        if evicted:
+            conn.execute(
+                'DELETE FROM sources WHERE digest IN (SELECT digest FROM thumbnails WHERE name IN '
+                f"({','.join('?' * len(evicted))}))", evicted
+            )
+            conn.execute(f"DELETE FROM thumbnails WHERE name IN ({','.join('?' * len(evicted))})", evicted)
+            THUMBNAIL_EVICTIONS.inc(len(evicted))
+        return evicted
+
+    def _render(self, data):
+        """
+        Render a thumbnail with Pillow
+
+        Returns:
+            tuple: (encoded thumbnail, file extension), None when Pillow is not
+            installed or the image can't be decoded
+        """
+        try:
+            from PIL import Image, ImageOps
+        except ImportError:
+            return None
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                # JPEG images are decoded at reduced scale straight away
+                image.draft('RGB', (self.size, self.size))
+                image = ImageOps.exif_transpose(image)
+                image.thumbnail((self.size, self.size))
+                output = io.BytesIO()
+                if image.mode in ('RGBA', 'LA', 'P'):
+                    image.save(output, 'PNG', optimize=True)
+                    return output.getvalue(), 'png'
+                image.convert('RGB').save(output, 'JPEG', quality=85, optimize=True)
+                return output.getvalue(), 'jpg'
+        except Exception:
+            return None
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_thumbnail_cache(directory, max_bytes=100 * 1024 * 1024, size=256, max_source_size=50 * 1024 * 1024):
+    """Get the process-wide thumbnail cache for a directory"""
+    key = (directory, max_bytes, size, max_source_size)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = ThumbnailCache(directory, max_bytes, size, max_source_size)
+            _caches[key] = cache
+        return cache
+
+
+class PreviewService:
+    def __init__(self, file_service):
+        self.file_service = file_service
+        self.enabled = current_app.config.get('PREVIEW_ENABLED', True)
+        # Bytes read from the start of a file for a text preview
+        self.max_preview_size = current_app.config.get('MAX_PREVIEW_SIZE', 64 * 1024)
+        self.thumbnails = None
+        if self.enabled:
+            try:
+                self.thumbnails = get_thumbnail_cache(
+                    current_app.config.get('THUMBNAIL_CACHE_PATH') or
+                    os.path.join(current_app.config['LOG_DIR'], 'thumbnails'),
+                    current_app.config.get('THUMBNAIL_CACHE_MAX_BYTES', 100 * 1024 * 1024),
+                    current_app.config.get('THUMBNAIL_SIZE', 256),
+                    current_app.config.get('MAX_PROCESSABLE_FILE_SIZE', 50 * 1024 * 1024)
+                )
+            except Exception as e:
+                current_app.logger.warning(f"Thumbnail cache unavailable, serving images unscaled: {e}")
+        # Concurrent requests for the same thumbnail share one rendering
+        self.single_flight = get_single_flight('thumbnail')
+
+    def resolve_path(self, file_path):
+        """
+        Resolve a file path requested for preview
+
+        Only files the catalog would list can be previewed: the path must be
+        in a white list directory, both as requested and once symlinks are
+        resolved, without hidden or excluded components below it.
+
+        Returns:
+            str: Real path of the file
+
+        Raises:
+            ValueError: The file is not a listed file of a white list directory
+            FileNotFoundError: The file does not exist
+            PermissionError: The file is not readable
+        """
+        if not file_path:
+            raise ValueError("Missing file path")
+        requested = os.path.abspath(os.path.expanduser(file_path))
+        file_path = os.path.realpath(requested)
+        white_dirs = [os.path.abspath(d) for d in self.file_service.white_dirs]
+        if not (self._is_listed(requested, white_dirs) and
+                self._is_listed(file_path, [os.path.realpath(d) for d in white_dirs])):
+            raise ValueError("File path is not in white list directories")
+        if not os.path.isfile(file_path):
+            raise FileNotFoundError(f"File not found: {file_path}")
+        if not os.access(file_path, os.R_OK):
+            raise PermissionError(f"No permission to read file: {file_path}")
+        return file_path
+
+    def _is_listed(self, file_path, white_dirs):
+        """Check that a path is below a white list directory with no hidden or excluded component, like the walker"""
+        for white_dir in white_dirs:
+            if os.path.commonpath([file_path, white_dir]) != white_dir or file_path == white_dir:
+                continue
+            parts = os.path.relpath(file_path, white_dir).split(os.sep)
+            if not any(self.file_service.walker.is_excluded(part) for part in parts):
+                return True
+        return False
+
+    @traced('preview')
+    def get_preview(self, file_path):
+        """
+        Get a preview of a file without reading all of it
+
+        Args:
+            file_path (str): Path to the file, in a white list directory
+
+        Returns:
+            dict: File information (name, path, type, size, mtime) and the
+            preview ``kind``: ``text`` with the decoded ``text`` of the first
+            MAX_PREVIEW_SIZE bytes and whether it is ``truncated``, ``image``
+            (fetch the thumbnail) or ``binary`` (no content preview)
+        """
+        file_path = self.resolve_path(file_path)
+        stat = os.stat(file_path)
+        extension = os.path.splitext(file_path)[1].lower().lstrip('.')
+        preview = {
+            'name': os.path.basename(file_path),
+            'path': file_path,
+            'type': extension,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime
+        }
+        if extension in IMAGE_TYPES:
+            preview['kind'] = 'image'
+            return preview
+
+        head = read_head(file_path, self.max_preview_size)
+        if b'\x00' in head[:BINARY_SNIFF]:
+            preview['kind'] = 'binary'
+            return preview
+        preview['kind'] = 'text'
+        preview['text'] = decode_head(head)
+        preview['truncated'] = stat.st_size > len(head)
+        return preview
+
+    @traced('thumbnail')
+    def get_thumbnail(self, file_path):
+        """
+        Get the cached thumbnail of an image
+
+        Returns:
+            str: Path of the thumbnail, None when no thumbnail can be made
+            (not an image, thumbnails unavailable or the image is too large)
+        """
+        file_path = self.resolve_path(file_path)
+        if self.thumbnails is None or os.path.splitext(file_path)[1].lower().lstrip('.') not in IMAGE_TYPES:
+            return None
+        stat = os.stat(file_path)
+        try:
+            return self.single_flight.do(
+                (file_path, stat.st_size, stat.st_mtime),
+                lambda: self.thumbnails.get(file_path, stat.st_size, stat.st_mtime)
+            )
+        except (OSError, sqlite3.Error) as e:
+            current_app.logger.warning(f"Thumbnail of {file_path} unavailable: {e}")
+            return None
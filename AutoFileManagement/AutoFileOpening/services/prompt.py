@@ -1,6 +1,7 @@
 from typing import List, Dict, Optional
 import os
 from flask import current_app
+from interface.tracing import traced
 
 class PromptTemplate:
     """Prompt templates for file assistant"""
@@ -36,6 +37,16 @@ class PromptService:
         }
         self.current_template = 'file_assistant'
     
+    def format_file_lines(self, files):
+        """Format one prompt line per file"""
+        file_list = []
+        for file in files:
+            if 'path' in file:
+                name = os.path.basename(file['path'])
+                ext = os.path.splitext(name)[1][1:] or 'unknown'
+                file_list.append(f"- {name} ({ext})")
+        return file_list
+    
     def format_file_list(self, files):
         """Format file list in a concise way"""
         # Get base directory from the first file
@@ -45,14 +56,7 @@ class PromptService:
         base_dir = os.path.dirname(files[0]['path']) if 'path' in files[0] else ""
         
         # Just list file names
-        file_list = []
-        for file in files:
-            if 'path' in file:
-                name = os.path.basename(file['path'])
-                ext = os.path.splitext(name)[1][1:] or 'unknown'
-                file_list.append(f"- {name} ({ext})")
-        
-        return base_dir, '\n'.join(file_list)
+        return base_dir, '\n'.join(self.format_file_lines(files))
     
     def get_file_types(self):
         """Get file type categories from config"""
@@ -63,6 +67,35 @@ class PromptService:
             'data_types': ', '.join(config.get('data', []))
         }
     
+    @traced('build_prompt')
+    def combine_prompt_within_budget(self, user_query, files, fit_lines):
+        """
+        Combine user query and as many files as fit the token budget into a prompt
+        
+        Args:
+            user_query (str): User message
+            files (list): Candidate files, most relevant first
+            fit_lines (callable): fit_lines(fixed_text, lines) returning how many
+                lines fit, e.g. OpenAIClient.fit_lines
+            
+        Returns:
+            tuple: (prompt, files included in the prompt)
+        """
+        files = [file for file in files if 'path' in file]
+        base_dir = os.path.dirname(files[0]['path']) if files else ""
+        fixed_text = self.templates[self.current_template].format(
+            query=user_query,
+            base_dir=base_dir,
+            files='',
+            **self.get_file_types()
+        )
+        count = fit_lines(fixed_text, self.format_file_lines(files))
+        if count < len(files):
+            current_app.logger.info(f"Token budget allows {count} of {len(files)} candidate files in the prompt")
+        files = files[:count]
+        return self.combine_prompt(user_query, files), files
+    
+    @traced('format_prompt')
     def combine_prompt(self, user_query, files):
         """Combine user query and file list into a prompt"""
         base_dir, files_str = self.format_file_list(files)
@@ -0,0 +1,217 @@
+import heapq
+import math
+import os
+import re
+import threading
+import time
+
+_WORD = re.compile(r'[^\W_]+')
+_CAMEL = re.compile(r'[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+|[^\x00-\x7f]+')
+
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'at', 'be', 'can', 'could', 'do', 'file', 'files', 'find', 'for', 'from',
+    'get', 'give', 'i', 'in', 'is', 'it', 'me', 'my', 'of', 'on', 'open', 'please', 'show', 'that',
+    'the', 'this', 'to', 'up', 'want', 'was', 'we', 'what', 'where', 'which', 'with', 'you'
+}
+
+
+def tokenize(text):
+    """
+    Split text into lower-case search tokens
+
+    Words are split on punctuation, underscores and camelCase boundaries.
+    Runs of non-ASCII characters (e.g. CJK text without spaces) also yield
+    their character bigrams so partial matches still score.
+    """
+    tokens = []
+    for word in _WORD.findall(text):
+        for part in _CAMEL.findall(word):
+            part = part.lower()
+            tokens.append(part)
+            if not part.isascii() and len(part) > 2:
+                tokens.extend(part[i:i + 2] for i in range(len(part) - 1))
+    return tokens
+
+
+class CandidateRanker:
+    """
+    BM25 ranking of file records against a chat message
+
+    File names and the directories below their white list root are indexed
+    (name tokens count twice). The BM25 score is combined with a boost for
+    files whose extension or type category is mentioned in the message and
+    a small recency bonus, and only the top candidates are returned.
+    """
+
+    K1 = 1.2
+    B = 0.75
+    NAME_WEIGHT = 2
+
+    def __init__(self, file_types=None, hint_boost=2.0, recency_weight=0.5, recency_half_life=30 * 86400):
+        self._lock = threading.RLock()
+        self.version = None
+        self.hint_boost = hint_boost
+        self.recency_weight = recency_weight
+        self.recency_half_life = recency_half_life
+
+        self._records = []
+        self._lengths = []
+        self._free = []
+        self._ids = {}
+        self._postings = {}
+        self._total_length = 0
+
+        # Category names (and their plurals) -> extensions without dot
+        self._hints = {}
+        for category, extensions in (file_types or {}).items():
+            extensions = {ext.strip().lower().lstrip('.') for ext in extensions}
+            for word in (category.lower(), category.lower() + 's'):
+                self._hints.setdefault(word, set()).update(extensions)
+
+    def refresh(self, version, load_files):
+        """
+        Sync the ranker with load_files() unless it is already at the given version
+
+        Returns:
+            bool: Whether the ranker was synced
+        """
+        with self._lock:
+            if version is not None and version == self.version:
+                return False
+            self.sync(load_files(), version)
+            return True
+
+    def sync(self, files, version=None):
+        """Bring the ranker in line with a full file list, only re-indexing changed files"""
+        with self._lock:
+            current = {record['path']: record for record in files}
+            for path in [path for path in self._ids if path not in current]:
+                self._remove(path)
+            for path, record in current.items():
+                doc_id = self._ids.get(path)
+                if doc_id is not None:
+                    existing = self._records[doc_id]
+                    if existing.get('mtime') == record.get('mtime') and existing['size'] == record['size']:
+                        continue
+                    self._remove(path)
+                self._add(record)
+            self.version = version
+
+    def _document_tokens(self, record):
+        relative = os.path.relpath(os.path.dirname(record['path']), record['directory'])
+        tokens = tokenize(os.path.splitext(record['name'])[0]) * self.NAME_WEIGHT
+        if relative != os.curdir:
+            tokens.extend(tokenize(relative))
+        if record['type']:
+            tokens.append(record['type'])
+        return tokens
+
+    def _add(self, record):
+        tokens = self._document_tokens(record)
+        if self._free:
+            doc_id = self._free.pop()
+            self._records[doc_id] = record
+            self._lengths[doc_id] = len(tokens)
+        else:
+            doc_id = len(self._records)
+            self._records.append(record)
+            self._lengths.append(len(tokens))
+        self._ids[record['path']] = doc_id
+        self._total_length += len(tokens)
+
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for token, count in counts.items():
+            self._postings.setdefault(token, {})[doc_id] = count
+
+    def _remove(self, path):
+        doc_id = self._ids.pop(path)
+        for token in set(self._document_tokens(self._records[doc_id])):
+            postings = self._postings.get(token)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[token]
+        self._total_length -= self._lengths[doc_id]
+        self._records[doc_id] = None
+        self._lengths[doc_id] = 0
+        self._free.append(doc_id)
+
+    def _hinted_extensions(self, tokens):
+        extensions = set()
+        for token in tokens:
+            if token in self._hints:
+                extensions |= self._hints[token]
+            elif any(token in exts for exts in self._hints.values()):
+                extensions.add(token)
+        return extensions
+
+    def rank(self, message, roots=None, limit=5, max_size=None, now=None):
+        """
+        Get the files most relevant to a message
+
+        Args:
+            message (str): User chat message
+            roots (list, optional): Root directories to include
+            limit (int, optional): Number of candidates to return
+            max_size (int, optional): Maximum file size in bytes
+            now (float, optional): Reference timestamp for the recency bonus
+
+        Returns:
+            list: Up to ``limit`` file dictionaries, best match first
+        """
+        now = time.time() if now is None else now
+        tokens = [token for token in tokenize(message) if token not in STOPWORDS]
+        roots = set(roots) if roots is not None else None
+
+        with self._lock:
+            count = len(self._ids)
+            if not count:
+                return []
+            average_length = self._total_length / count
+            records = self._records
+
+            scores = {}
+            for token in set(tokens):
+                postings = self._postings.get(token)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    norm = tf + self.K1 * (1 - self.B + self.B * self._lengths[doc_id] / average_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.K1 + 1) / norm
+
+            hinted = self._hinted_extensions(tokens)
+            if hinted:
+                for extension in hinted:
+                    for doc_id in self._postings.get(extension, ()):
+                        if records[doc_id]['type'] == extension:
+                            scores[doc_id] = scores.get(doc_id, 0.0) + self.hint_boost
+            if not scores:
+                # Nothing in the message matches: fall back to the most recent files
+                scores = {doc_id: 0.0 for doc_id in self._ids.values()}
+
+            def score(doc_id):
+                age = max(now - (records[doc_id].get('mtime') or 0), 0)
+                return scores[doc_id] + self.recency_weight * 0.5 ** (age / self.recency_half_life)
+
+            candidates = (doc_id for doc_id in scores
+                          if (roots is None or records[doc_id]['directory'] in roots) and
+                          (max_size is None or records[doc_id]['size'] <= max_size))
+            top = heapq.nlargest(limit, candidates, key=lambda doc_id: (score(doc_id), records[doc_id]['path']))
+            return [records[doc_id] for doc_id in top]
+
+
+_rankers = {}
+_rankers_lock = threading.Lock()
+
+
+def get_ranker(key, file_types=None, **options):
+    """Get the process-wide candidate ranker for a file source"""
+    with _rankers_lock:
+        ranker = _rankers.get(key)
+        if ranker is None:
+            ranker = CandidateRanker(file_types, **options)
+            _rankers[key] = ranker
+        return ranker
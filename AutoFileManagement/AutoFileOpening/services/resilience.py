@@ -0,0 +1,394 @@
+import asyncio
+import random
+import re
+import threading
+import time
+import weakref
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from email.utils import parsedate_to_datetime
+from prometheus_client import Counter
+from interface.tracing import span
+
+LLM_RETRIES = Counter(
+    'llm_request_retries_total',
+    'OpenAI requests retried after a transient error',
+    ['reason']
+)
+LLM_HEDGES = Counter(
+    'llm_hedged_requests_total',
+    'Hedged OpenAI requests launched, and how many of them answered first',
+    ['outcome']
+)
+
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+_DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+
+class DeadlineExceeded(Exception):
+    """The call could not complete before its deadline"""
+
+
+def parse_duration(value):
+    """
+    Parse a rate limit header duration: seconds ("1.5"), an HTTP date or
+    the OpenAI reset format ("20ms", "1s", "6m0s")
+
+    Returns:
+        float: Seconds, or None if the value cannot be parsed
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if parts and ''.join(n + u for n, u in parts) == value:
+        return sum(float(n) * _DURATION_UNITS[u] for n, u in parts)
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_after(error):
+    """Get the wait the server asked for in the headers of an error response, or None"""
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    if not headers:
+        return None
+    ms = parse_duration(headers.get('retry-after-ms'))
+    if ms is not None:
+        return ms / 1000
+    seconds = parse_duration(headers.get('retry-after'))
+    if seconds is not None:
+        return seconds
+    resets = [parse_duration(headers.get(name))
+              for name in ('x-ratelimit-reset-requests', 'x-ratelimit-reset-tokens')]
+    resets = [r for r in resets if r is not None]
+    return max(resets) if resets else None
+
+
+def retry_reason(error):
+    """Get why a failed request may be retried, or None if it must not be"""
+    # The SDK is already loaded once a request has failed
+    import openai
+    if isinstance(error, openai.RateLimitError):
+        return 'rate_limit'
+    if isinstance(error, openai.APITimeoutError):
+        return 'timeout'
+    if isinstance(error, openai.APIConnectionError):
+        return 'connection'
+    if isinstance(error, openai.APIStatusError) and (error.status_code >= 500 or error.status_code in (408, 409)):
+        return 'server_error'
+    return None
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, never shorter than the wait the server asked for"""
+
+    def __init__(self, max_retries=3, base_delay=0.5, max_delay=20.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt, error=None):
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        hinted = retry_after(error) if error is not None else None
+        return max(hinted, backoff) if hinted is not None else backoff
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at ``per_minute`` tokens per minute
+
+    Callers reserve tokens up front and are told how long to wait for them,
+    so waiting callers are served in order without polling.
+    """
+
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount):
+        """Take tokens, returning the seconds to wait until they are available"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens -= min(amount, self.capacity)
+            return max(0.0, -self.tokens / self.rate)
+
+    def refund(self, amount):
+        with self._lock:
+            self.tokens = min(self.capacity, self.tokens + min(amount, self.capacity))
+
+
+class RateLimiter:
+    """Requests and tokens per minute limits, paused while the server reports a rate limit"""
+
+    def __init__(self, requests_per_minute=0, tokens_per_minute=0):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self._paused_until = 0.0
+
+    def pause(self, seconds):
+        """Hold back all new requests, e.g. for the retry-after of a 429 response"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _reserve(self, tokens, deadline):
+        now = time.monotonic()
+        delay = max(self._paused_until - now, 0.0)
+        if self.requests:
+            delay = max(delay, self.requests.reserve(1))
+        if self.tokens:
+            delay = max(delay, self.tokens.reserve(tokens))
+        if now + delay > deadline:
+            self._refund(tokens)
+            raise DeadlineExceeded(f"Rate limit wait of {delay:.1f}s exceeds the request deadline")
+        return delay
+
+    def _refund(self, tokens):
+        if self.requests:
+            self.requests.refund(1)
+        if self.tokens:
+            self.tokens.refund(tokens)
+
+    def try_reserve(self, tokens):
+        """Take a request of ``tokens`` prompt tokens only if it may be sent right away"""
+        if self._reserve(tokens, float('inf')):
+            self._refund(tokens)
+            return False
+        return True
+
+    def wait(self, tokens, deadline):
+        """Block until a request of ``tokens`` prompt tokens may be sent"""
+        delay = self._reserve(tokens, deadline)
+        if delay:
+            time.sleep(delay)
+
+    async def wait_async(self, tokens, deadline):
+        delay = self._reserve(tokens, deadline)
+        if delay:
+            await asyncio.sleep(delay)
+
+
+class CallPolicy:
+    """
+    Deadline, concurrency limit, rate limits, retries and hedging around one model call
+
+    The call is a function taking the timeout of one attempt in seconds.
+    Each call gets ``timeout`` seconds in total (rate limit waits, attempts
+    and backoff included); an attempt is cut off after ``request_timeout``.
+    At most ``max_concurrency`` calls are in flight per process (sync and
+    async calls are counted separately). With ``hedge_after`` set, an
+    attempt still running after that many seconds is duplicated and the
+    first answer wins. Every attempt, retries and hedges included, is
+    counted against the rate limits; a hedge is only sent when the limits
+    allow it right away.
+    """
+
+    def __init__(self, timeout=30.0, request_timeout=15.0, retry=None, limiter=None,
+                 max_concurrency=8, hedge_after=0.0, logger=None):
+        self.timeout = timeout
+        self.request_timeout = request_timeout
+        self.retry = retry or RetryPolicy()
+        self.limiter = limiter or RateLimiter()
+        self.max_concurrency = max_concurrency
+        self.hedge_after = hedge_after
+        self.logger = logger
+        self._slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        self._async_slots = weakref.WeakKeyDictionary()
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _remaining(self, deadline):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"Model call exceeded its {self.timeout:.0f}s deadline")
+        return remaining
+
+    def _backoff(self, attempt, error, deadline):
+        """Get the delay before the next attempt, or re-raise the error if it must not be retried"""
+        reason = retry_reason(error)
+        if reason is None or attempt >= self.retry.max_retries:
+            raise error
+        delay = self.retry.delay(attempt, error)
+        if reason == 'rate_limit':
+            self.limiter.pause(delay)
+        if time.monotonic() + delay >= deadline:
+            raise error
+        LLM_RETRIES.labels(reason=reason).inc()
+        if self.logger:
+            self.logger.warning(f"Model call failed ({reason}: {error}), retry {attempt + 1} in {delay:.2f}s")
+        return delay
+
+    # Sync calls
+
+    def call(self, func, tokens=0, hedge=True):
+        """
+        Run a model call under the policy
+
+        Args:
+            func (callable): func(timeout) making one attempt
+            tokens (int): Prompt tokens, counted against the tokens per minute limit
+            hedge (bool): Whether slow attempts may be hedged; off for calls
+                whose result holds a resource, like a response stream
+
+        Returns:
+            The result of the first successful attempt
+        """
+        deadline = time.monotonic() + self.timeout
+        with span('llm_rate_limit'):
+            self.limiter.wait(tokens, deadline)
+        if self._slots and not self._slots.acquire(timeout=self._remaining(deadline)):
+            raise DeadlineExceeded("No model call slot became free before the deadline")
+        try:
+            attempt = 0
+            while True:
+                timeout = min(self.request_timeout, self._remaining(deadline))
+                try:
+                    if hedge:
+                        return self._hedged(func, timeout, tokens)
+                    return func(timeout)
+                except Exception as e:
+                    time.sleep(self._backoff(attempt, e, deadline))
+                    attempt += 1
+                with span('llm_rate_limit'):
+                    self.limiter.wait(tokens, deadline)
+        finally:
+            if self._slots:
+                self._slots.release()
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=max(2 * (self.max_concurrency or 8), 2), thread_name_prefix='llm-hedge')
+        return self._executor
+
+    def _hedged(self, func, timeout, tokens):
+        if not self.hedge_after or self.hedge_after >= timeout:
+            return func(timeout)
+
+        executor = self._get_executor()
+        first = executor.submit(func, timeout)
+        done, _ = wait([first], timeout=self.hedge_after)
+        if done or not self.limiter.try_reserve(tokens):
+            return first.result()
+
+        # The first attempt is slow: race a second one against it
+        LLM_HEDGES.labels(outcome='launched').inc()
+        hedge = executor.submit(func, timeout - self.hedge_after)
+        pending, error = {first, hedge}, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        LLM_HEDGES.labels(outcome='won').inc()
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    # Async calls
+
+    def _get_async_slots(self):
+        """Concurrency limit of the running event loop (asyncio primitives belong to one loop)"""
+        loop = asyncio.get_running_loop()
+        slots = self._async_slots.get(loop)
+        if slots is None:
+            slots = asyncio.Semaphore(self.max_concurrency)
+            self._async_slots[loop] = slots
+        return slots
+
+    async def call_async(self, func, tokens=0, hedge=True):
+        """
+        Run an async model call under the policy
+
+        Args:
+            func (callable): async func(timeout) making one attempt
+            tokens (int): Prompt tokens, counted against the tokens per minute limit
+            hedge (bool): Whether slow attempts may be hedged
+        """
+        deadline = time.monotonic() + self.timeout
+        with span('llm_rate_limit'):
+            await self.limiter.wait_async(tokens, deadline)
+        slots = self._get_async_slots() if self.max_concurrency else None
+        if slots:
+            try:
+                await asyncio.wait_for(slots.acquire(), self._remaining(deadline))
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded("No model call slot became free before the deadline")
+        try:
+            attempt = 0
+            while True:
+                timeout = min(self.request_timeout, self._remaining(deadline))
+                try:
+                    if hedge:
+                        return await self._hedged_async(func, timeout, tokens)
+                    return await func(timeout)
+                except Exception as e:
+                    await asyncio.sleep(self._backoff(attempt, e, deadline))
+                    attempt += 1
+                with span('llm_rate_limit'):
+                    await self.limiter.wait_async(tokens, deadline)
+        finally:
+            if slots:
+                slots.release()
+
+    async def _hedged_async(self, func, timeout, tokens):
+        if not self.hedge_after or self.hedge_after >= timeout:
+            return await func(timeout)
+
+        first = asyncio.ensure_future(func(timeout))
+        done, _ = await asyncio.wait({first}, timeout=self.hedge_after)
+        if done:
+            return first.result()
+        if not self.limiter.try_reserve(tokens):
+            return await first
+
+        LLM_HEDGES.labels(outcome='launched').inc()
+        hedge = asyncio.ensure_future(func(timeout - self.hedge_after))
+        pending, error = {first, hedge}, None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            LLM_HEDGES.labels(outcome='won').inc()
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # The losing attempt is cancelled instead of running to completion
+            for task in pending:
+                task.cancel()
+
+
+_policies = {}
+_policies_lock = threading.Lock()
+
+
+def get_call_policy(timeout=30.0, request_timeout=15.0, max_retries=3, max_concurrency=8,
+                    requests_per_minute=0, tokens_per_minute=0, hedge_after=0.0, logger=None):
+    """Get the process-wide call policy for a configuration, so limits are shared by all requests"""
+    key = (timeout, request_timeout, max_retries, max_concurrency,
+           requests_per_minute, tokens_per_minute, hedge_after)
+    with _policies_lock:
+        policy = _policies.get(key)
+        if policy is None:
+            policy = CallPolicy(
+                timeout, request_timeout, RetryPolicy(max_retries),
+                RateLimiter(requests_per_minute, tokens_per_minute),
+                max_concurrency, hedge_after, logger
+            )
+            _policies[key] = policy
+        return policy
@@ -0,0 +1,317 @@
+import bisect
+import fnmatch
+import heapq
+import os
+import re
+import threading
+
+WILDCARD_CHARS = '*?['
+
+
+def trigrams(text):
+    """Return the set of 3-character substrings of a string"""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def literal_runs(pattern):
+    """
+    Split a wildcard pattern into the literal text between its wildcards
+
+    Character classes (``[...]``) are treated as wildcards.
+    """
+    runs = []
+    current = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char in '*?':
+            runs.append(''.join(current))
+            current = []
+        elif char == '[':
+            end = pattern.find(']', i + 2)
+            if end == -1:
+                # fnmatch treats an unclosed '[' as a literal
+                current.append(char)
+            else:
+                runs.append(''.join(current))
+                current = []
+                i = end
+        else:
+            current.append(char)
+        i += 1
+    runs.append(''.join(current))
+    return [run for run in runs if run]
+
+
+class SearchQuery:
+    """
+    Parsed file name query
+
+    A pattern without wildcards matches any name containing it; a pattern
+    with wildcards (``*``, ``?``, ``[...]``) must match the whole name, as
+    with fnmatch. With ``whole_name``, every pattern must match the whole
+    name. Matching is case-insensitive.
+    """
+
+    def __init__(self, pattern, whole_name=False):
+        self.pattern = pattern.lower()
+        self.is_wildcard = whole_name or any(char in self.pattern for char in WILDCARD_CHARS)
+        if self.is_wildcard:
+            self.runs = literal_runs(self.pattern)
+            self._regex = re.compile(fnmatch.translate(self.pattern))
+        else:
+            self.runs = [self.pattern] if self.pattern else []
+            self._regex = None
+        # Longest literal run drives the ranking of matches
+        self.literal = max(self.runs, key=len, default='')
+
+    def trigrams(self):
+        grams = set()
+        for run in self.runs:
+            grams |= trigrams(run)
+        return grams
+
+    def matches(self, name):
+        if self._regex is not None:
+            return self._regex.match(name) is not None
+        return self.pattern in name
+
+    def rank(self, record, name):
+        """Sort key of a matching record, lower is better"""
+        literal = self.literal
+        stem = os.path.splitext(name)[0]
+        position = name.find(literal) if literal else 0
+        if literal and name == literal:
+            match_class = 0
+        elif literal and stem == literal:
+            match_class = 1
+        elif position == 0:
+            match_class = 2
+        elif position > 0 and not name[position - 1].isalnum():
+            # Match starts a word, e.g. "report" in "q3_report.pdf"
+            match_class = 3
+        else:
+            match_class = 4
+        return match_class, max(position, 0), len(name), -record.get('mtime', 0), record['path']
+
+
+class SearchIndex:
+    """
+    In-memory search index over file records
+
+    Keeps trigram postings of the lower-cased file names for substring and
+    wildcard matching, hash indexes by root directory, extension and type
+    category, and mtime/size indexes sorted on demand for range filters.
+    Candidates are narrowed with the postings and verified against the full
+    pattern, so queries never scan the whole file list unless the pattern
+    has no literal of three or more characters.
+    """
+
+    def __init__(self, file_types=None):
+        self._lock = threading.RLock()
+        self.version = None
+        self._records = []
+        self._names = []
+        self._free = []
+        self._ids = {}
+        self._grams = {}
+        self._roots = {}
+        self._extensions = {}
+        self._categories = {}
+        self._by_mtime = None
+        self._by_size = None
+        self.set_file_types(file_types or {})
+
+    def set_file_types(self, file_types):
+        """Set the type categories as category -> extensions (with or without dot)"""
+        with self._lock:
+            self._extension_categories = {}
+            for category, extensions in file_types.items():
+                for extension in extensions:
+                    self._extension_categories.setdefault(
+                        extension.strip().lower().lstrip('.'), set()).add(category.lower())
+            self._categories = {}
+            for doc_id, record in enumerate(self._records):
+                if record is not None:
+                    for category in self._extension_categories.get(record['type'], ()):
+                        self._categories.setdefault(category, set()).add(doc_id)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def refresh(self, version, load_files):
+        """
+        Sync the index with load_files() unless it is already at the given version
+
+        Returns:
+            bool: Whether the index was synced
+        """
+        with self._lock:
+            if version is not None and version == self.version:
+                return False
+            self.sync(load_files(), version)
+            return True
+
+    def sync(self, files, version=None):
+        """
+        Bring the index in line with a full file list
+
+        Only added, removed and modified files (by size and mtime) touch the
+        postings, so re-syncing after a small change is cheap.
+
+        Returns:
+            tuple: (added, removed) file counts
+        """
+        with self._lock:
+            current = {record['path']: record for record in files}
+            removed = 0
+            for path in [path for path in self._ids if path not in current]:
+                self._remove(path)
+                removed += 1
+
+            added = 0
+            for path, record in current.items():
+                doc_id = self._ids.get(path)
+                if doc_id is not None:
+                    existing = self._records[doc_id]
+                    if (existing['size'] == record['size'] and existing.get('mtime') == record.get('mtime')
+                            and existing['directory'] == record['directory']):
+                        continue
+                    self._remove(path)
+                    removed += 1
+                self._add(record)
+                added += 1
+
+            if added or removed:
+                self._by_mtime = self._by_size = None
+            self.version = version
+            return added, removed
+
+    def _add(self, record):
+        name = record['name'].lower()
+        if self._free:
+            doc_id = self._free.pop()
+            self._records[doc_id] = record
+            self._names[doc_id] = name
+        else:
+            doc_id = len(self._records)
+            self._records.append(record)
+            self._names.append(name)
+        self._ids[record['path']] = doc_id
+
+        for gram in trigrams(name):
+            self._grams.setdefault(gram, set()).add(doc_id)
+        self._roots.setdefault(record['directory'], set()).add(doc_id)
+        self._extensions.setdefault(record['type'], set()).add(doc_id)
+        for category in self._extension_categories.get(record['type'], ()):
+            self._categories.setdefault(category, set()).add(doc_id)
+
+    def _remove(self, path):
+        doc_id = self._ids.pop(path)
+        record = self._records[doc_id]
+        for gram in trigrams(self._names[doc_id]):
+            _discard(self._grams, gram, doc_id)
+        _discard(self._roots, record['directory'], doc_id)
+        _discard(self._extensions, record['type'], doc_id)
+        for category in self._extension_categories.get(record['type'], ()):
+            _discard(self._categories, category, doc_id)
+        self._records[doc_id] = None
+        self._names[doc_id] = None
+        self._free.append(doc_id)
+
+    def _sorted(self, field):
+        """Get (value, doc id) pairs sorted by a numeric field"""
+        attr = '_by_' + field
+        index = getattr(self, attr)
+        if index is None:
+            index = sorted((record.get(field, 0), doc_id)
+                           for doc_id, record in enumerate(self._records) if record is not None)
+            setattr(self, attr, index)
+        return index
+
+    def _range(self, field, low, high):
+        index = self._sorted(field)
+        start = 0 if low is None else bisect.bisect_left(index, (low, -1))
+        end = len(index) if high is None else bisect.bisect_right(index, (high, float('inf')))
+        return {doc_id for _, doc_id in index[start:end]}
+
+    def search(self, pattern, roots=None, extensions=None, category=None, min_size=None, max_size=None,
+               modified_after=None, modified_before=None, offset=0, limit=50, whole_name=False):
+        """
+        Search file names
+
+        Args:
+            pattern (str): Substring or wildcard pattern (empty matches everything)
+            roots (list, optional): Root directories to include
+            extensions (list, optional): Extensions (without dot) to match
+            category (str, optional): Type category from ALLOWED_FILE_TYPES
+            min_size (int, optional): Minimum file size in bytes
+            max_size (int, optional): Maximum file size in bytes
+            modified_after (float, optional): Minimum mtime timestamp
+            modified_before (float, optional): Maximum mtime timestamp
+            offset (int, optional): Number of ranked results to skip
+            limit (int, optional): Maximum number of results to return, None for all
+            whole_name (bool, optional): Match the pattern against the whole
+                name as with fnmatch, instead of as a substring
+
+        Returns:
+            tuple: (total number of matches, ranked file dictionaries for the page)
+        """
+        query = SearchQuery(pattern or '', whole_name)
+        with self._lock:
+            candidate_sets = []
+            grams = query.trigrams()
+            if grams:
+                candidate_sets.extend(self._grams.get(gram, set()) for gram in grams)
+            if roots is not None:
+                candidate_sets.append(_union(self._roots, roots))
+            if extensions is not None:
+                candidate_sets.append(_union(self._extensions, [ext.lower().lstrip('.') for ext in extensions]))
+            if category is not None:
+                candidate_sets.append(self._categories.get(category.lower(), set()))
+            if min_size is not None or max_size is not None:
+                candidate_sets.append(self._range('size', min_size, max_size))
+            if modified_after is not None or modified_before is not None:
+                candidate_sets.append(self._range('mtime', modified_after, modified_before))
+
+            if candidate_sets:
+                candidate_sets.sort(key=len)
+                candidates = candidate_sets[0].intersection(*candidate_sets[1:])
+            else:
+                candidates = self._ids.values()
+
+            names = self._names
+            records = self._records
+            matches = [doc_id for doc_id in candidates if query.matches(names[doc_id])]
+            rank = lambda doc_id: query.rank(records[doc_id], names[doc_id])
+            top = sorted(matches, key=rank) if limit is None else heapq.nsmallest(offset + limit, matches, key=rank)
+            return len(matches), [records[doc_id] for doc_id in top[offset:]]
+
+
+def _discard(postings, key, doc_id):
+    ids = postings.get(key)
+    if ids is not None:
+        ids.discard(doc_id)
+        if not ids:
+            del postings[key]
+
+
+def _union(postings, keys):
+    result = set()
+    for key in keys:
+        result |= postings.get(key, set())
+    return result
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_search_index(key, file_types=None):
+    """Get the process-wide search index for a file source"""
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = SearchIndex(file_types)
+            _indexes[key] = index
+        return index
@@ -0,0 +1,192 @@
+import fnmatch
+import os
+import stat as stat_module
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+def subtree_bounds(dir_path):
+    """Return the (low, high) string range covering every path below a directory"""
+    prefix = dir_path.rstrip(os.sep) + os.sep
+    return prefix, prefix[:-1] + chr(ord(os.sep) + 1)
+
+
+if hasattr(os, 'getuid'):
+    _UID = os.getuid()
+    _GIDS = set(os.getgroups()) | {os.getgid()}
+
+    def is_readable(st):
+        """Check read permission from an existing stat result instead of calling os.access"""
+        if _UID == 0:
+            return True
+        if st.st_uid == _UID:
+            return bool(st.st_mode & stat_module.S_IRUSR)
+        if st.st_gid in _GIDS:
+            return bool(st.st_mode & stat_module.S_IRGRP)
+        return bool(st.st_mode & stat_module.S_IROTH)
+else:
+    def is_readable(st):
+        """Check read permission from an existing stat result instead of calling os.access"""
+        return True
+
+
+class ScandirWalker:
+    """
+    Directory walker built on os.scandir
+
+    Hidden and excluded directories are pruned before they are entered, each
+    file is stat'ed once through DirEntry.stat(), and directories are listed
+    concurrently on a thread pool (one task per directory, so every white list
+    root and sub-directory fans out across the pool).
+    """
+
+    def __init__(self, max_workers=8, exclude=None):
+        self.max_workers = max_workers
+        self.exclude = list(exclude or [])
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix='walker')
+            return self._pool
+
+    def is_excluded(self, name):
+        """Check whether a file or directory name is hidden or matches an exclude pattern"""
+        return name.startswith('.') or any(fnmatch.fnmatch(name, pattern) for pattern in self.exclude)
+
+    def scan_directory(self, dir_path):
+        """
+        List one directory, skipping hidden, excluded and unreadable entries
+
+        Returns:
+            tuple: (files, subdirs) where files are (path, name, extension, size, mtime)
+            tuples and subdirs are the paths of non-symlinked sub-directories
+        """
+        files = []
+        subdirs = []
+        try:
+            with os.scandir(dir_path) as entries:
+                for entry in entries:
+                    if self.is_excluded(entry.name):
+                        continue
+                    try:
+                        if entry.is_dir():
+                            if not entry.is_symlink():
+                                subdirs.append(entry.path)
+                            continue
+                        if not entry.is_file():
+                            continue
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    if not is_readable(st):
+                        continue
+                    extension = os.path.splitext(entry.name)[1][1:].lower()
+                    files.append((entry.path, entry.name, extension, st.st_size, st.st_mtime))
+        except OSError:
+            pass
+        return files, subdirs
+
+    def _fan_out(self, items, work):
+        """
+        Run work(item) for every item and for the follow-up items it returns
+
+        Yields the results of each call as they complete. With one worker the
+        calls run depth-first in the calling thread.
+        """
+        if self.max_workers <= 1:
+            stack = list(items)
+            while stack:
+                results, more = work(stack.pop())
+                stack.extend(more)
+                yield from results
+            return
+
+        pool = self._get_pool()
+        pending = {pool.submit(work, item) for item in items}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                results, more = future.result()
+                pending.update(pool.submit(work, item) for item in more)
+                yield from results
+
+    def walk(self, roots):
+        """
+        List every file below the given roots
+
+        Yields:
+            tuple: (root, directory path, files) for each directory
+        """
+        def work(item):
+            root, dir_path = item
+            files, subdirs = self.scan_directory(dir_path)
+            return [(root, dir_path, files)], [(root, subdir) for subdir in subdirs]
+
+        yield from self._fan_out([(root, root) for root in roots if os.path.isdir(root)], work)
+
+    def scan_changes(self, start, parent, known, children, descend_unchanged=True, before_listing=None):
+        """
+        Compare a directory tree against known directory mtimes
+
+        Directories whose mtime differs from ``known`` (or that are not known at
+        all) are listed again; unchanged directories are only stat'ed.
+
+        Args:
+            start (str): Directory to start from
+            parent (str): Parent of the start directory (None for a root)
+            known (dict): Directory path -> mtime_ns from the previous scan
+            children (dict): Directory path -> known sub-directory paths
+            descend_unchanged (bool, optional): Also check the sub-directories
+                of unchanged directories
+            before_listing (callable, optional): Called with the path of each
+                directory right before it is listed (possibly from a worker thread)
+
+        Yields:
+            tuple: ('changed', path, parent, mtime_ns, files, subdirs) for listed
+            directories and ('removed', path) for directories that disappeared,
+            which covers their whole subtree
+        """
+        def work(item):
+            # known/children values are captured when the task is queued
+            dir_path, parent, known_mtime, known_children = item
+            try:
+                mtime_ns = os.stat(dir_path).st_mtime_ns
+            except OSError:
+                return [('removed', dir_path)], []
+
+            if known_mtime == mtime_ns:
+                # Unchanged directory: its entries are still valid
+                if not descend_unchanged:
+                    return [], []
+                return [], [self._task(child, dir_path, known, children) for child in known_children]
+
+            if before_listing is not None:
+                before_listing(dir_path)
+            files, subdirs = self.scan_directory(dir_path)
+            results = [('removed', gone) for gone in set(known_children).difference(subdirs)]
+            results.append(('changed', dir_path, parent, mtime_ns, files, subdirs))
+            return results, [self._task(child, dir_path, known, children) for child in subdirs]
+
+        yield from self._fan_out([self._task(start, parent, known, children)], work)
+
+    @staticmethod
+    def _task(dir_path, parent, known, children):
+        return dir_path, parent, known.get(dir_path), list(children.get(dir_path, ()))
+
+
+_walkers = {}
+_walkers_lock = threading.Lock()
+
+
+def get_walker(max_workers=8, exclude=None):
+    """Get the process-wide walker for a worker count and exclude list"""
+    key = (max_workers, tuple(exclude or ()))
+    with _walkers_lock:
+        walker = _walkers.get(key)
+        if walker is None:
+            walker = ScandirWalker(max_workers, exclude)
+            _walkers[key] = walker
+        return walker
@@ -0,0 +1,474 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+from collections import defaultdict
+from prometheus_client import Gauge
+from interface.metrics import MULTIPROCESS
+from .walker import ScandirWalker, is_readable, subtree_bounds
+
+FILE_INDEX_STALENESS = Gauge(
+    'file_index_staleness_seconds',
+    'Age of the oldest file system change not yet applied to the in-memory file index',
+    multiprocess_mode='livemax'
+)
+# Seconds between staleness updates in multiprocess mode, where the gauge
+# cannot be computed at scrape time
+STALENESS_PUBLISH_INTERVAL = 1.0
+
+# inotify event masks (see inotify(7))
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+STRUCTURE_MASK = IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+CONTENT_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE
+
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+class Inotify:
+    """Minimal ctypes binding for Linux inotify"""
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        return wd
+
+    def rm_watch(self, wd):
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self):
+        """
+        Read all pending events
+
+        Returns:
+            list: (wd, mask, name) tuples
+        """
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                events.append((wd, mask, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FileIndex:
+    """Thread-safe in-memory index of the files in the white list directories"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        # (root, directory) -> {path: file record}
+        self._directories = {}
+        self.version = 0
+
+    def replace_directory(self, root, dir_path, files):
+        """Replace the files of one directory with (path, name, extension, size, mtime) tuples"""
+        records = {}
+        for path, name, extension, size, mtime in files:
+            records[path] = {
+                'name': name,
+                'path': path,
+                'type': extension,
+                'size': size,
+                'mtime': mtime,
+                'directory': root
+            }
+        with self._lock:
+            self._directories[(root, dir_path)] = records
+            self.version += 1
+
+    def update_file(self, root, path, name, extension, size, mtime):
+        """Update the record of a single file"""
+        with self._lock:
+            records = self._directories.setdefault((root, os.path.dirname(path)), {})
+            records[path] = {
+                'name': name,
+                'path': path,
+                'type': extension,
+                'size': size,
+                'mtime': mtime,
+                'directory': root
+            }
+            self.version += 1
+
+    def remove_tree(self, root, dir_path):
+        """Remove a directory and everything below it"""
+        low, high = subtree_bounds(dir_path)
+        with self._lock:
+            for key in [key for key in self._directories
+                        if key[0] == root and (key[1] == dir_path or low <= key[1] < high)]:
+                del self._directories[key]
+            self.version += 1
+
+    def get_files(self, roots, extensions=None, max_size=None):
+        """
+        Get indexed files
+
+        Args:
+            roots (list): Root directories to include
+            extensions (list, optional): Extensions (without dot) to match
+            max_size (int, optional): Maximum file size in bytes
+
+        Returns:
+            list: File dictionaries in the same format as FileService.get_files
+        """
+        extensions = set(extensions) if extensions is not None else None
+        files = []
+        with self._lock:
+            for (root, _), records in self._directories.items():
+                if root not in roots:
+                    continue
+                for record in records.values():
+                    if extensions is not None and record['type'] not in extensions:
+                        continue
+                    if max_size is not None and record['size'] > max_size:
+                        continue
+                    files.append(record)
+        return files
+
+    def count_files(self, roots, extensions=None, max_size=None):
+        """Count indexed files with the same filters as get_files"""
+        if extensions is None and max_size is None:
+            with self._lock:
+                return sum(len(records) for (root, _), records in self._directories.items() if root in roots)
+        return len(self.get_files(roots, extensions, max_size))
+
+
+class FileWatcher(threading.Thread):
+    """
+    Background watcher keeping a FileIndex in sync with the white list directories
+
+    Uses inotify on Linux and falls back to polling directory mtimes elsewhere
+    (or when inotify is unavailable). Events are coalesced per directory and
+    applied in batches; an inotify queue overflow triggers an incremental
+    rescan that only re-lists directories whose mtime changed.
+    """
+
+    def __init__(self, roots, logger, catalog=None, mode='auto', poll_interval=10, coalesce_window=0.2,
+                 walker=None):
+        super().__init__(name='file-watcher', daemon=True)
+        self.roots = list(roots)
+        self.logger = logger
+        self.catalog = catalog
+        self.walker = walker or ScandirWalker(max_workers=1)
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.coalesce_window = coalesce_window
+        # Upper bound on how long a continuous event stream can delay a batch
+        self.max_delay = max(coalesce_window * 10, 1.0)
+
+        self.index = FileIndex()
+        self.ready = threading.Event()
+        self._stop_event = threading.Event()
+        self._started_at = time.time()
+        self._last_sync = None
+
+        # Per root directory state: mtimes and sub-directories seen at the last listing
+        self._known = {root: {} for root in self.roots}
+        self._children = {root: defaultdict(list) for root in self.roots}
+
+        # inotify state
+        self._inotify = None
+        # Watches are added from the walker threads while directories are listed
+        self._watch_lock = threading.Lock()
+        self._wd_paths = {}
+        self._path_wds = {}
+        self._watch_limit_hit = False
+        self._pending_dirs = {}
+        self._pending_files = {}
+        self._overflow = False
+
+    def stop(self):
+        self._stop_event.set()
+
+    def staleness(self):
+        """Seconds since the oldest change not yet reflected in the index"""
+        now = time.time()
+        if not self.ready.is_set():
+            return now - self._started_at
+        pending = list(self._pending_dirs.values()) + list(self._pending_files.values())
+        if pending:
+            return now - min(pending)
+        if self._inotify is None or self._watch_limit_hit:
+            # Polling: anything may have changed since the last completed sync
+            return now - self._last_sync
+        return 0.0
+
+    def run(self):
+        try:
+            if self.mode in ('auto', 'inotify'):
+                try:
+                    self._inotify = Inotify()
+                except (OSError, AttributeError) as e:
+                    if self.mode == 'inotify':
+                        self.logger.error(f"inotify unavailable: {e}")
+                    self.logger.warning(f"File watcher falling back to polling: {e}")
+
+            self._load()
+            self.ready.set()
+            self.logger.info(
+                f"File watcher ready ({'inotify' if self._inotify else 'polling'}) "
+                f"for {len(self.roots)} directories"
+            )
+
+            if self._inotify:
+                self._run_inotify()
+            else:
+                self._run_polling()
+        except Exception as e:
+            self.logger.error(f"File watcher stopped: {e}", exc_info=True)
+        finally:
+            if self._inotify:
+                self._inotify.close()
+
+    def _load(self):
+        """Build the initial index from the catalog (if any), then catch up with the disk"""
+        if self.catalog:
+            try:
+                self.catalog.refresh(self.roots)
+                for root in self.roots:
+                    for path, parent, mtime_ns in self.catalog.get_directories(root):
+                        self._known[root][path] = mtime_ns
+                        if parent is not None:
+                            self._children[root][parent].append(path)
+                    for dir_path, files in self.catalog.iter_directory_files(root):
+                        self.index.replace_directory(root, dir_path, files)
+            except Exception as e:
+                self.logger.warning(f"Could not load file index from catalog: {e}")
+
+        if self._inotify:
+            for root in self.roots:
+                for dir_path in list(self._known[root]):
+                    self._add_watch(dir_path)
+        # Changes made before the watches were in place are picked up here
+        self._sync()
+
+    def _sync(self):
+        """Incrementally rescan every root"""
+        for root in self.roots:
+            self._rescan(root, root, None, descend_unchanged=True)
+        self._last_sync = time.time()
+
+    def _rescan(self, root, start, parent, descend_unchanged):
+        """Apply the directory changes below start to the index"""
+        known = self._known[root]
+        children = self._children[root]
+        # The watch goes in before the listing, so files created meanwhile raise an event
+        before_listing = self._add_watch if self._inotify else None
+        for change in self.walker.scan_changes(start, parent, known, children, descend_unchanged,
+                                               before_listing):
+            if change[0] == 'removed':
+                self._remove_tree(root, change[1])
+                continue
+            _, dir_path, dir_parent, mtime_ns, files, subdirs = change
+            known[dir_path] = mtime_ns
+            children[dir_path] = subdirs
+            self.index.replace_directory(root, dir_path, files)
+
+    def _remove_tree(self, root, dir_path):
+        low, high = subtree_bounds(dir_path)
+        known = self._known[root]
+        children = self._children[root]
+        for path in [p for p in known if p == dir_path or low <= p < high]:
+            del known[path]
+            children.pop(path, None)
+            self._remove_watch(path)
+        self.index.remove_tree(root, dir_path)
+
+    def _add_watch(self, dir_path):
+        with self._watch_lock:
+            if dir_path in self._path_wds or self._watch_limit_hit:
+                return
+            try:
+                wd = self._inotify.add_watch(dir_path)
+            except OSError as e:
+                if e.errno == 28:  # ENOSPC: fs.inotify.max_user_watches reached
+                    self._watch_limit_hit = True
+                    self.logger.warning("inotify watch limit reached, also polling for changes")
+                return
+            # A directory moved inside the tree keeps its watch descriptor
+            previous = self._wd_paths.get(wd)
+            if previous is not None and previous != dir_path:
+                self._path_wds.pop(previous, None)
+            self._wd_paths[wd] = dir_path
+            self._path_wds[dir_path] = wd
+
+    def _remove_watch(self, dir_path):
+        with self._watch_lock:
+            wd = self._path_wds.pop(dir_path, None)
+            if wd is not None and self._wd_paths.get(wd) == dir_path:
+                del self._wd_paths[wd]
+                self._inotify.rm_watch(wd)
+
+    def _roots_of(self, path):
+        return [root for root in self.roots
+                if path == root or path.startswith(root.rstrip(os.sep) + os.sep)]
+
+    def _run_polling(self):
+        if not MULTIPROCESS:
+            while not self._stop_event.wait(self.poll_interval):
+                self._sync()
+            return
+
+        next_sync = time.time() + self.poll_interval
+        while not self._stop_event.wait(min(self.poll_interval, STALENESS_PUBLISH_INTERVAL)):
+            if time.time() >= next_sync:
+                self._sync()
+                next_sync = time.time() + self.poll_interval
+            _publish_staleness()
+
+    def _run_inotify(self):
+        last_event = 0.0
+        last_poll = time.time()
+        last_publish = 0.0
+        while not self._stop_event.is_set():
+            pending = self._pending_dirs or self._pending_files or self._overflow
+            ready, _, _ = select.select([self._inotify.fd], [], [],
+                                        self.coalesce_window if pending else 1.0)
+            now = time.time()
+            if ready:
+                self._queue_events(self._inotify.read_events(), now)
+                last_event = now
+
+            if self._overflow:
+                self.logger.warning("inotify queue overflow, rescanning changed directories")
+                self._overflow = False
+                self._pending_dirs.clear()
+                pending_files, self._pending_files = self._pending_files, {}
+                self._sync()
+                # Content changes don't touch the directory mtime, the rescan misses them
+                self._update_files(pending_files)
+            elif self._pending_dirs or self._pending_files:
+                oldest = min(list(self._pending_dirs.values()) + list(self._pending_files.values()))
+                # Coalesce bursts, but never hold changes back longer than max_delay
+                if now - last_event >= self.coalesce_window or now - oldest >= self.max_delay:
+                    self._apply_pending()
+
+            if self._watch_limit_hit and now - last_poll >= self.poll_interval:
+                self._sync()
+                last_poll = now
+
+            if MULTIPROCESS and now - last_publish >= STALENESS_PUBLISH_INTERVAL:
+                _publish_staleness()
+                last_publish = now
+
+    def _queue_events(self, events, now):
+        for wd, mask, name in events:
+            if mask & IN_Q_OVERFLOW:
+                self._overflow = True
+                continue
+            dir_path = self._wd_paths.get(wd)
+            if mask & IN_IGNORED:
+                if dir_path is not None:
+                    self._wd_paths.pop(wd, None)
+                    self._path_wds.pop(dir_path, None)
+                continue
+            if dir_path is None:
+                continue
+
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                # Let the parent listing decide whether the directory is gone
+                parent = os.path.dirname(dir_path)
+                self._pending_dirs.setdefault(parent if parent in self._path_wds else dir_path, now)
+            elif mask & STRUCTURE_MASK:
+                self._pending_dirs.setdefault(dir_path, now)
+            elif mask & CONTENT_MASK and name and not self.walker.is_excluded(name) and not mask & IN_ISDIR:
+                self._pending_files.setdefault(os.path.join(dir_path, name), now)
+
+    def _apply_pending(self):
+        pending_dirs, self._pending_dirs = self._pending_dirs, {}
+        pending_files, self._pending_files = self._pending_files, {}
+
+        for dir_path in pending_dirs:
+            for root in self._roots_of(dir_path):
+                known = self._known[root]
+                if dir_path not in known:
+                    continue
+                # Force the directory to be listed again, new sub-directories are scanned in full
+                known[dir_path] = None
+                parent = os.path.dirname(dir_path) if dir_path != root else None
+                self._rescan(root, dir_path, parent, descend_unchanged=False)
+
+        self._update_files(path for path in pending_files if os.path.dirname(path) not in pending_dirs)
+
+    def _update_files(self, paths):
+        """Re-stat changed files of known directories into the index"""
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if not is_readable(stat):
+                continue
+            name = os.path.basename(path)
+            extension = os.path.splitext(name)[1][1:].lower()
+            for root in self._roots_of(path):
+                if os.path.dirname(path) in self._known[root]:
+                    self.index.update_file(root, path, name, extension, stat.st_size, stat.st_mtime)
+
+
+_watchers = {}
+_watchers_lock = threading.Lock()
+
+
+def get_watcher(roots, logger, catalog=None, mode='auto', poll_interval=10, coalesce_window=0.2,
+                walker=None):
+    """Get (and start on first use) the process-wide watcher for a set of directories"""
+    key = tuple(roots)
+    with _watchers_lock:
+        watcher = _watchers.get(key)
+        if watcher is None or not watcher.is_alive():
+            watcher = FileWatcher(roots, logger, catalog, mode, poll_interval, coalesce_window, walker)
+            watcher.start()
+            _watchers[key] = watcher
+        return watcher
+
+
+def _max_staleness():
+    with _watchers_lock:
+        watchers = [w for w in _watchers.values() if w.is_alive()]
+    return max((w.staleness() for w in watchers), default=0.0)
+
+
+def _publish_staleness():
+    FILE_INDEX_STALENESS.set(_max_staleness())
+
+
+if not MULTIPROCESS:
+    FILE_INDEX_STALENESS.set_function(_max_staleness)
@@ -0,0 +1,13 @@
+def __getattr__(name):
+    # `uvicorn asgi:app` resolves the application on first access, so content extraction
+    # workers importing this module as their main module don't create it
+    if name == 'app':
+        from interface.asgi import asgi_app
+        return asgi_app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+if __name__ == '__main__':
+    import uvicorn
+    from interface.asgi import asgi_app
+    uvicorn.run(asgi_app, host='0.0.0.0', port=5001)
@@ -0,0 +1,74 @@
+import argparse
+import json
+import sys
+
+METRICS = ['p50', 'p95', 'p99']
+
+
+def load(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def compare(baseline, current, threshold=0.1, metric='p95'):
+    """
+    Compare two benchmark results
+
+    Args:
+        baseline (dict): Results of the reference run
+        current (dict): Results of the run to check
+        threshold (float): Relative slowdown of ``metric`` counted as a regression
+        metric (str): Latency statistic the regression check uses
+
+    Returns:
+        tuple: (rows of (benchmark, statistic, baseline, current, relative
+        change), names of the regressed benchmarks)
+    """
+    rows = []
+    regressions = []
+    for name, result in current['benchmarks'].items():
+        reference = baseline['benchmarks'].get(name)
+        if reference is None:
+            continue
+        for key in METRICS + ['throughput']:
+            old, new = reference.get(key), result.get(key)
+            change = (new - old) / old if old and new is not None else None
+            rows.append((name, key, old, new, change))
+            if key == metric and change is not None and change > threshold:
+                regressions.append(name)
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.compare',
+        description='Compare two benchmark result files, exit with 1 on a latency regression'
+    )
+    parser.add_argument('baseline', help='result file of the reference commit')
+    parser.add_argument('current', help='result file to check')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative slowdown counted as a regression')
+    parser.add_argument('--metric', choices=METRICS, default='p95', help='statistic checked for regressions')
+    args = parser.parse_args(argv)
+
+    baseline, current = load(args.baseline), load(args.current)
+    rows, regressions = compare(baseline, current, args.threshold, args.metric)
+
+    print(f"{baseline['meta'].get('commit')} -> {current['meta'].get('commit')}")
+    if baseline.get('tree', {}).get('spec') != current.get('tree', {}).get('spec'):
+        print('Warning: the runs used different trees')
+    print(f"{'benchmark':<16}{'stat':<12}{'baseline':>12}{'current':>12}{'change':>10}")
+    for name, key, old, new, change in rows:
+        scale, unit = (1, '') if key == 'throughput' else (1000, 'ms')
+        old_text = f"{old * scale:.3f}{unit}" if old is not None else '-'
+        new_text = f"{new * scale:.3f}{unit}" if new is not None else '-'
+        change_text = f"{change:+.1%}" if change is not None else '-'
+        print(f"{name:<16}{key:<12}{old_text:>12}{new_text:>12}{change_text:>10}")
+
+    if regressions:
+        print(f"Regressed ({args.metric} slower by more than {args.threshold:.0%}): {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,302 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from .stub_llm import StubLLMServer
+from .tree import SHAPES, generate_tree, sample_names, spec_id, tree_spec
+
+BENCHMARKS = ['get_files', 'find_files', 'combine_prompt', 'count_tokens', 'chat']
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return None
+    rank = max(1, int(round(q / 100 * len(values) + 0.5)))
+    return values[min(rank, len(values)) - 1]
+
+
+def summarize(durations, wall, errors=0, cold=None):
+    """
+    Summarize the durations of one benchmark
+
+    Returns:
+        dict: Iterations, errors, throughput (operations per second of wall
+        time) and latency statistics in seconds
+    """
+    durations = sorted(durations)
+    result = {
+        'iterations': len(durations),
+        'errors': errors,
+        'throughput': len(durations) / wall if wall > 0 else None,
+        'mean': sum(durations) / len(durations) if durations else None,
+        'min': durations[0] if durations else None,
+        'p50': percentile(durations, 50),
+        'p95': percentile(durations, 95),
+        'p99': percentile(durations, 99),
+        'max': durations[-1] if durations else None
+    }
+    if cold is not None:
+        result['cold'] = cold
+    return result
+
+
+def measure(func, args_list, warmup=1):
+    """
+    Time func(*args) for every args of args_list, one call at a time
+
+    The first ``warmup`` calls are not measured, the first of them is
+    reported as the cold call.
+    """
+    cold = None
+    for i, args in enumerate(args_list[:warmup]):
+        start = time.perf_counter()
+        func(*args)
+        if i == 0:
+            cold = time.perf_counter() - start
+    durations = []
+    wall_start = time.perf_counter()
+    for args in args_list[warmup:]:
+        start = time.perf_counter()
+        func(*args)
+        durations.append(time.perf_counter() - start)
+    return summarize(durations, time.perf_counter() - wall_start, cold=cold)
+
+
+def measure_concurrent(func, args_list, concurrency):
+    """Time func(*args) for every args of args_list on a pool of concurrent callers; func returns False on error"""
+    def timed(args):
+        start = time.perf_counter()
+        ok = func(*args)
+        return time.perf_counter() - start, ok
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(timed, args_list))
+    wall = time.perf_counter() - wall_start
+    return summarize([d for d, _ in outcomes], wall, errors=sum(1 for _, ok in outcomes if ok is False))
+
+
+def git_commit():
+    """Commit of the working tree, with a ``-dirty`` suffix for uncommitted changes"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True,
+                               text=True, check=True).stdout.strip()
+        return commit + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def chat_message(name):
+    """Turn a file name into the kind of message a user would type"""
+    words = os.path.splitext(name)[0].split('_')
+    # Generated names end with a running number nobody would type
+    if len(words) > 1 and words[-1].isdigit():
+        words = words[:-1]
+    return 'open the ' + ' '.join(words) + ' file'
+
+
+def search_patterns(names, count, rng):
+    """Substring, word and wildcard queries built from real file names"""
+    patterns = []
+    for i in range(count):
+        stem, extension = os.path.splitext(names[i % len(names)])
+        words = stem.split('_')
+        if i % 3 == 0:
+            patterns.append(words[0][:4])
+        elif i % 3 == 1:
+            patterns.append('_'.join(words[:2]))
+        else:
+            patterns.append(f"{words[0]}*{extension}")
+    rng.shuffle(patterns)
+    return patterns
+
+
+def create_bench_app(tree_root, log_dir, stub_url, args):
+    """Create the application with the white list pointed at the synthetic tree"""
+    os.environ['LOG_DIR'] = log_dir
+    os.environ['OPENAI_BASE_URL'] = stub_url
+    os.environ.setdefault('OPENAI_API_KEY', 'bench')
+    from interface.app import create_app
+    from AutoFileManagement.AutoFileOpening.services.container import get_services
+
+    app = create_app()
+    app.config.update({
+        'WHITE_DIRECTORIES': [tree_root],
+        'LOG_DIR': log_dir,
+        'OPENAI_ENABLED': True,
+        'OPENAI_BASE_URL': stub_url,
+        'CATALOG_ENABLED': not args.no_catalog,
+        'CATALOG_PATH': os.path.join(log_dir, 'file_catalog.db'),
+        'WATCHER_ENABLED': args.watcher,
+        'EMBEDDING_ENABLED': False,
+        'RESPONSE_CACHE_ENABLED': args.response_cache,
+        'RESPONSE_CACHE_DISK_ENABLED': False
+    })
+    services = get_services(app)
+    services.reload(reload_config=False)
+    # Opening a file launches a desktop application, the benchmark only resolves it
+    services.file_service.open_file = lambda file_path: None
+    if args.watcher:
+        services.file_service.watcher.ready.wait()
+    return app, services
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    workdir = os.path.abspath(args.workdir)
+    spec = tree_spec(args.files, args.shape, args.depth, args.fanout, args.hidden_ratio, seed=args.seed)
+    tree_root = os.path.join(workdir, f"tree-{spec_id(spec)}")
+
+    print(f"Preparing {args.files} file {args.shape} tree in {tree_root}")
+    start = time.perf_counter()
+    manifest = generate_tree(tree_root, spec)
+    print(f"Tree ready in {time.perf_counter() - start:.1f}s ({manifest['visible_files']} visible files)")
+
+    log_dir = tempfile.mkdtemp(prefix='logs-', dir=workdir)
+    selected = [b for b in BENCHMARKS if not args.only or b in args.only]
+    names = sample_names(tree_root, max(args.iterations, 100), args.seed)
+    results = {}
+
+    with StubLLMServer(latency=args.latency, jitter=args.jitter, seed=args.seed) as stub:
+        app, services = create_bench_app(tree_root, log_dir, stub.url, args)
+        file_service = services.file_service
+        prompt_service = services.prompt_service
+        client = services.chat_service.client
+
+        with app.app_context():
+            if 'get_files' in selected:
+                print('Benchmarking get_files')
+                results['get_files'] = measure(file_service.get_files, [()] * (args.iterations + 1))
+                results['get_files']['files'] = len(file_service.get_files())
+
+            if 'find_files' in selected:
+                print('Benchmarking find_files')
+                patterns = search_patterns(names, args.iterations + 1, rng)
+                results['find_files'] = measure(file_service.find_files, [(p,) for p in patterns])
+
+            files = file_service.get_files()
+            prompt_files = files[:args.prompt_files]
+            messages = [chat_message(name) for name in names]
+            if 'combine_prompt' in selected:
+                print('Benchmarking combine_prompt')
+                results['combine_prompt'] = measure(
+                    prompt_service.combine_prompt,
+                    [(messages[i % len(messages)], prompt_files) for i in range(args.iterations + 1)]
+                )
+
+            if 'count_tokens' in selected:
+                print('Benchmarking count_tokens')
+                prompts = [prompt_service.combine_prompt(m, prompt_files) for m in messages[:args.iterations + 1]]
+                results['count_tokens'] = measure(client._count_tokens, [(p,) for p in prompts])
+
+        if 'chat' in selected:
+            print(f"Benchmarking /api/chat ({args.concurrency} concurrent, {args.latency}s model latency)")
+
+            def post(message):
+                response = app.test_client().post('/api/chat', json={'message': message})
+                return response.status_code == 200 and 'error' not in response.get_json()
+
+            post(messages[0])
+            results['chat'] = measure_concurrent(
+                post, [(messages[i % len(messages)],) for i in range(args.chat_iterations)], args.concurrency
+            )
+            results['chat']['concurrency'] = args.concurrency
+            results['chat']['model_requests'] = stub.requests
+
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count()
+        },
+        'settings': {
+            'iterations': args.iterations,
+            'chat_iterations': args.chat_iterations,
+            'concurrency': args.concurrency,
+            'latency': args.latency,
+            'jitter': args.jitter,
+            'prompt_files': args.prompt_files,
+            'catalog': not args.no_catalog,
+            'watcher': args.watcher,
+            'response_cache': args.response_cache
+        },
+        'tree': manifest,
+        'benchmarks': results
+    }
+
+
+def _ms(value):
+    return f"{value * 1000:10.3f}" if value is not None else f"{'-':>10}"
+
+
+def format_results(results):
+    """Render the benchmark results as a table in milliseconds"""
+    lines = [f"{'benchmark':<16}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}"]
+    for name, result in results['benchmarks'].items():
+        lines.append(f"{name:<16}{result.get('throughput') or 0:10.1f}"
+                     f"{_ms(result['p50'])}{_ms(result['p95'])}{_ms(result['p99'])}{result['errors']:8d}")
+    return '\n'.join(lines)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks',
+        description='Benchmark the chat pipeline hot paths against a synthetic tree and a stub model'
+    )
+    parser.add_argument('--files', type=int, default=10000, help='files in the synthetic tree')
+    parser.add_argument('--shape', choices=sorted(SHAPES), default='mixed', help='directory layout')
+    parser.add_argument('--depth', type=int, help='directory levels, overrides the shape')
+    parser.add_argument('--fanout', type=int, help='sub-directories per directory, overrides the shape')
+    parser.add_argument('--hidden-ratio', type=float, default=0.05, help='share of hidden directories and files')
+    parser.add_argument('--iterations', type=int, default=200, help='measured calls per micro benchmark')
+    parser.add_argument('--chat-iterations', type=int, default=100, help='/api/chat requests')
+    parser.add_argument('--concurrency', type=int, default=8, help='concurrent /api/chat clients')
+    parser.add_argument('--latency', type=float, default=0.05, help='stub model latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='extra random stub latency in seconds')
+    parser.add_argument('--prompt-files', type=int, default=50, help='files in the combine_prompt benchmark')
+    parser.add_argument('--no-catalog', action='store_true', help='walk the directories on every get_files')
+    parser.add_argument('--watcher', action='store_true', help='serve listings from the file watcher index')
+    parser.add_argument('--response-cache', action='store_true', help='keep the LLM response cache enabled')
+    parser.add_argument('--only', type=lambda s: s.split(','), help=f"comma separated subset of {','.join(BENCHMARKS)}")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'ximehelper-bench'),
+                        help='where trees (reused across runs) and logs are created')
+    parser.add_argument('--output', help='result file (default: benchmarks/results/<commit>-<time>.json)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.makedirs(args.workdir, exist_ok=True)
+    results = run(args)
+
+    output = args.output
+    if not output:
+        stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+        output = os.path.join(RESULTS_DIR, f"{results['meta']['commit'] or 'unknown'}-{stamp}.json")
+    output_dir = os.path.dirname(output)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+
+    print(format_results(results))
+    print(f"Results written to {output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,173 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Candidate lines of the file assistant prompt: "- name (ext)"
+_CANDIDATE = re.compile(r'^- (.+) \([^)]*\)$', re.MULTILINE)
+
+
+class StubLLMServer:
+    """
+    Local OpenAI-compatible chat completions endpoint with injectable latency
+
+    Answers ``POST /v1/chat/completions`` (plain and ``stream=true``) with the
+    first candidate file of the prompt, after ``latency`` seconds plus a
+    uniform ``jitter``. ``error_rate`` of the requests fail with a 500 to
+    exercise the retry path. Point the application at it with
+    ``OPENAI_BASE_URL=<url>``.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, error_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name='stub-llm', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _delay(self):
+        with self._lock:
+            self.requests += 1
+            fail = self._rng.random() < self.error_rate
+            delay = self.latency + self._rng.uniform(0, self.jitter)
+        return delay, fail
+
+    @staticmethod
+    def answer(messages):
+        """First candidate file named in the prompt, as the model would pick it"""
+        prompt = '\n'.join(m.get('content') or '' for m in messages)
+        match = _CANDIDATE.search(prompt)
+        return match.group(1) if match else "No matching files found."
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, payload):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                try:
+                    request = json.loads(self.rfile.read(length) or b'{}')
+                except ValueError:
+                    return self._send_json(400, {'error': {'message': 'Invalid JSON', 'type': 'invalid_request_error'}})
+                if not self.path.rstrip('/').endswith('/chat/completions'):
+                    return self._send_json(404, {'error': {'message': 'Not found', 'type': 'invalid_request_error'}})
+
+                delay, fail = stub._delay()
+                time.sleep(delay)
+                if fail:
+                    return self._send_json(500, {'error': {'message': 'Injected failure', 'type': 'server_error'}})
+
+                model = request.get('model', 'stub')
+                content = stub.answer(request.get('messages', []))
+                completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+                created = int(time.time())
+                if request.get('stream'):
+                    return self._stream(completion_id, created, model, content)
+                prompt_tokens = sum(len((m.get('content') or '').split()) for m in request.get('messages', []))
+                self._send_json(200, {
+                    'id': completion_id,
+                    'object': 'chat.completion',
+                    'created': created,
+                    'model': model,
+                    'choices': [{
+                        'index': 0,
+                        'message': {'role': 'assistant', 'content': content},
+                        'finish_reason': 'stop'
+                    }],
+                    'usage': {
+                        'prompt_tokens': prompt_tokens,
+                        'completion_tokens': 1,
+                        'total_tokens': prompt_tokens + 1
+                    }
+                })
+
+            def _stream(self, completion_id, created, model, content):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                # A few characters per chunk, like model tokens
+                pieces = [content[i:i + 4] for i in range(0, len(content), 4)] + [None]
+                for piece in pieces:
+                    delta = {'content': piece} if piece is not None else {}
+                    chunk = {
+                        'id': completion_id,
+                        'object': 'chat.completion.chunk',
+                        'created': created,
+                        'model': model,
+                        'choices': [{
+                            'index': 0,
+                            'delta': delta,
+                            'finish_reason': None if piece is not None else 'stop'
+                        }]
+                    }
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.close_connection = True
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a local OpenAI-compatible stub server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency', type=float, default=0.2, help='seconds before each answer')
+    parser.add_argument('--jitter', type=float, default=0.0, help='extra random seconds, uniform')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests failing with a 500')
+    args = parser.parse_args()
+
+    stub = StubLLMServer(args.host, args.port, args.latency, args.jitter, args.error_rate)
+    print(f"Stub LLM listening on {stub.url}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.server.server_close()
+
+
+if __name__ == '__main__':
+    main()
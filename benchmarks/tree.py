@@ -0,0 +1,149 @@
+import hashlib
+import json
+import math
+import os
+import random
+
+MANIFEST = '.bench-tree.json'
+
+# Extension mix of a typical office share: (extension, weight)
+DEFAULT_EXTENSIONS = [
+    ('pdf', 20), ('docx', 15), ('xlsx', 12), ('txt', 10), ('md', 5), ('csv', 8),
+    ('pptx', 5), ('jpg', 12), ('png', 8), ('json', 3), ('zip', 2)
+]
+
+# Words file names are built from, so name searches have realistic hit rates
+WORDS = [
+    'report', 'budget', 'invoice', 'meeting', 'notes', 'draft', 'final', 'summary',
+    'contract', 'proposal', 'roadmap', 'review', 'plan', 'minutes', 'design', 'spec',
+    'photo', 'scan', 'receipt', 'backup', 'export', 'sales', 'marketing', 'team',
+    'q1', 'q2', 'q3', 'q4', 'annual', 'weekly', 'project', 'client', 'research', 'data'
+]
+
+# Directory layouts: (depth, fanout); a fanout of None is derived from the file count
+SHAPES = {
+    'wide': (2, None),
+    'deep': (10, 2),
+    'mixed': (4, 6)
+}
+
+
+def tree_spec(files, shape='mixed', depth=None, fanout=None, hidden_ratio=0.05,
+              extensions=None, seed=42):
+    """
+    Describe a synthetic tree
+
+    Args:
+        files (int): Number of files to create
+        shape (str): ``wide`` (two levels of many directories), ``deep``
+            (ten levels of binary fanout) or ``mixed``
+        depth (int, optional): Directory levels below the root, overrides the shape
+        fanout (int, optional): Sub-directories per directory, overrides the shape
+        hidden_ratio (float): Share of directories and files whose name
+            starts with a dot
+        extensions (list, optional): (extension, weight) pairs
+        seed (int): Random seed, equal specs produce equal trees
+
+    Returns:
+        dict: The spec, also stored in the tree's manifest
+    """
+    if shape not in SHAPES:
+        raise ValueError(f"Unknown tree shape: {shape}")
+    shape_depth, shape_fanout = SHAPES[shape]
+    depth = shape_depth if depth is None else depth
+    if fanout is None:
+        # About 50 files per directory when the shape doesn't fix the fanout
+        fanout = shape_fanout or max(2, math.ceil((files / 50) ** (1 / max(depth, 1))))
+    return {
+        'files': files,
+        'shape': shape,
+        'depth': depth,
+        'fanout': fanout,
+        'hidden_ratio': hidden_ratio,
+        'extensions': [list(e) for e in (extensions or DEFAULT_EXTENSIONS)],
+        'seed': seed
+    }
+
+
+def spec_id(spec):
+    """Short stable id of a spec, used to name cached trees"""
+    payload = json.dumps(spec, sort_keys=True).encode('utf-8')
+    return hashlib.sha1(payload).hexdigest()[:12]
+
+
+def _directories(rng, spec):
+    """Relative paths of all directories, breadth first"""
+    directories = ['']
+    level = ['']
+    for _ in range(spec['depth']):
+        next_level = []
+        for parent in level:
+            for i in range(spec['fanout']):
+                name = f"{rng.choice(WORDS)}_{i}"
+                if rng.random() < spec['hidden_ratio']:
+                    name = '.' + name
+                next_level.append(os.path.join(parent, name))
+        directories.extend(next_level)
+        level = next_level
+    return directories
+
+
+def generate_tree(root, spec):
+    """
+    Create the files of a spec below root, or reuse a tree created before
+
+    Files are empty but sparse-truncated to a random size, so size filters
+    and the catalog see realistic values without using disk space.
+
+    Returns:
+        dict: Manifest with the spec, the number of directories and the
+        number of visible files (outside hidden directories, not hidden)
+    """
+    manifest_path = os.path.join(root, MANIFEST)
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('spec') == spec:
+            return manifest
+    except (OSError, ValueError):
+        pass
+
+    rng = random.Random(spec['seed'])
+    directories = _directories(rng, spec)
+    for directory in directories:
+        os.makedirs(os.path.join(root, directory), exist_ok=True)
+
+    extensions = [e for e, _ in spec['extensions']]
+    weights = [w for _, w in spec['extensions']]
+    visible = 0
+    for n in range(spec['files']):
+        directory = directories[n % len(directories)]
+        words = rng.sample(WORDS, 2)
+        name = f"{words[0]}_{words[1]}_{rng.randint(2015, 2025)}_{n}.{rng.choices(extensions, weights)[0]}"
+        hidden = rng.random() < spec['hidden_ratio']
+        if hidden:
+            name = '.' + name
+        path = os.path.join(root, directory, name)
+        with open(path, 'wb') as f:
+            f.truncate(rng.randint(0, 4 * 1024 * 1024))
+        if not hidden and not any(part.startswith('.') for part in directory.split(os.sep)):
+            visible += 1
+
+    manifest = {'spec': spec, 'directories': len(directories), 'visible_files': visible}
+    # Written last: an interrupted generation is not reused
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    return manifest
+
+
+def sample_names(root, count, seed=0):
+    """Pick visible file names of a generated tree, e.g. to build chat messages and queries"""
+    rng = random.Random(seed)
+    names = []
+    for current, dirs, files in os.walk(root):
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        names.extend(f for f in files if not f.startswith('.'))
+        if len(names) >= count * 20:
+            break
+    rng.shuffle(names)
+    return names[:count]
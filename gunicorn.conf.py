@@ -0,0 +1,32 @@
+"""
+Gunicorn configuration
+
+    gunicorn -c gunicorn.conf.py interface.app:app
+
+Prometheus metrics of all workers are aggregated through prometheus_client's
+multiprocess mode: every worker writes its values to PROMETHEUS_MULTIPROC_DIR
+and a scrape of /metrics on any worker reports the totals.
+"""
+import os
+import shutil
+import tempfile
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5001')
+workers = int(os.getenv('GUNICORN_WORKERS', '4'))
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+
+# Must be set before the application imports prometheus_client
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'ximehelper-metrics'))
+
+
+def on_starting(server):
+    """Start from an empty metrics directory, values of a previous run would be added up"""
+    path = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    """Drop the live gauges of a dead worker"""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
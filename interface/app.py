@@ -1,61 +1,100 @@
-from flask import Flask, render_template, request, g
+import time
+_import_started = time.perf_counter()
+from flask import Flask, render_template, request, g, jsonify
 import os
-from dotenv import load_dotenv
+import signal
+import threading
 from .logger import setup_logger
 from .config import Config
-from prometheus_client import make_wsgi_app, Counter, Histogram
-from werkzeug.middleware.dispatcher import DispatcherMiddleware
-import time
-from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
-
-# Define Prometheus Metrics
-API_DURATION = Histogram(
-    'api_request_duration_seconds', 
-    'Duration of API requests in seconds', 
-    ['endpoint']
-)
-API_REQUESTS = Counter(
-    'api_requests_total', 
-    'Total number of API requests', 
-    ['endpoint', 'status']
-)
-
-REQUEST_COUNT = Counter(
-    'app_request_count', 'Application Request Count',
-    ['method', 'endpoint', 'http_status']
-)
-REQUEST_LATENCY = Histogram(
-    'app_request_latency_seconds',
-    'Application Request Latency',
-    ['method', 'endpoint']
-)
+from .tracing import start_trace, end_trace, current_trace
+from .metrics import generate_metrics, record_request
+from .startup import WarmUp, record_phase
 
-# Force reload environment variables
-load_dotenv(override=True)
+record_phase('import', time.perf_counter() - _import_started)
 
 def create_app():
-    # Force reload environment variables again when creating app
-    load_dotenv(override=True)
+    started = time.perf_counter()
     
     app = Flask(__name__,
                 static_folder='static',
                 template_folder='templates')
     
-    # Load configuration
+    # Load configuration (and .env, once per process)
+    phase_started = time.perf_counter()
     config = Config()
     config.init_app(app)
+    record_phase('config', time.perf_counter() - phase_started)
     
     # Setup logger
+    phase_started = time.perf_counter()
     setup_logger(app)
     app.logger.info('Starting XimeHelper application...')
+    record_phase('logging', time.perf_counter() - phase_started)
     
     # Register blueprints
+    phase_started = time.perf_counter()
     try:
         from AutoFileManagement.AutoFileOpening.api.routes import bp as file_bp
         app.register_blueprint(file_bp, url_prefix='/api')
         app.logger.info('Registered API blueprint successfully')
     except Exception as e:
         app.logger.error(f'Failed to register API blueprint: {str(e)}')
+    record_phase('blueprints', time.perf_counter() - phase_started)
+    
+    # Long-lived services shared by all requests, built before serving (eager)
+    # or by a background warm-up while /ready reports 503 (lazy)
+    lazy = app.config.get('STARTUP_MODE') == 'lazy'
+    warmup = WarmUp(app, 'lazy' if lazy else 'eager')
+    app.extensions['warmup'] = warmup
+    services = None
+    try:
+        from AutoFileManagement.AutoFileOpening.services.container import ServiceContainer
+        services = ServiceContainer(app)
+    except Exception as e:
+        app.logger.error(f'Failed to initialize application services: {str(e)}')
+        warmup.fail('services', e)
+    else:
+        warmup.add('services', lambda: services.command_service)
+        if lazy:
+            # Load the file index and the search index before the first chat needs them
+            warmup.add('file_index', lambda: services.file_service.get_listing_version())
+            warmup.add('search_index', lambda: services.file_service.find_files('', page_size=1))
+    warmup.start(background=lazy)
+    if not lazy and warmup.ready:
+        app.logger.info('Initialized application services')
+    
+    if services is not None:
+        # SIGHUP reloads the configuration and rebuilds the services
+        if hasattr(signal, 'SIGHUP'):
+            reload_requested = threading.Event()
+
+            def reload_services():
+                while True:
+                    reload_requested.wait()
+                    reload_requested.clear()
+                    try:
+                        services.reload()
+                    except Exception as e:
+                        app.logger.error(f'Failed to reload services: {str(e)}')
+
+            def request_reload(signum, frame):
+                # The handler interrupts the main thread, which may hold the locks the rebuild takes:
+                # only flag the reload, the reload thread does it (once for a burst of signals)
+                reload_requested.set()
+
+            try:
+                signal.signal(signal.SIGHUP, request_reload)
+            except ValueError:
+                # Not in the main thread (e.g. imported by a threaded server)
+                pass
+            else:
+                threading.Thread(target=reload_services, name='service-reload', daemon=True).start()
+    
+    @app.route('/ready')
+    def ready():
+        """Readiness: 200 once the warm-up is complete, 503 with its progress before"""
+        status = warmup.status()
+        return jsonify(status), 200 if status['ready'] else 503
     
     @app.route('/')
     def index():
@@ -65,36 +104,30 @@ def create_app():
     
     @app.before_request
     def before_request():
-        g.start_time = time.time()
-        request.start_time = time.time()
+        g.start_time = time.perf_counter()
+        # Continue the caller's trace (W3C traceparent or X-Request-ID) or start a new one
+        g.trace_token = start_trace(request.headers.get('traceparent'), request.headers.get('X-Request-ID'))
 
     @app.after_request
     def after_request(response):
-        if request.endpoint:  
-            if hasattr(g, 'start_time'):
-                duration = time.time() - g.start_time
-                API_DURATION.labels(
-                    endpoint=request.endpoint
-                ).observe(duration)
-            
-            API_REQUESTS.labels(
-                endpoint=request.endpoint,
-                status=str(response.status_code)
-            ).inc()
-        
-        request_latency = time.time() - request.start_time
-        REQUEST_COUNT.labels(
-            method=request.method,
-            endpoint=request.endpoint or 'unknown',
-            http_status=response.status_code
-        ).inc()
-        REQUEST_LATENCY.labels(
-            method=request.method,
-            endpoint=request.endpoint or 'unknown'
-        ).observe(request_latency)
-        
+        if hasattr(g, 'start_time'):
+            record_request(request.method, request.endpoint or 'unknown', response.status_code,
+                           time.perf_counter() - g.start_time)
+        trace = current_trace()
+        if trace is not None:
+            response.headers['X-Trace-Id'] = trace.trace_id
         return response
 
+    @app.teardown_request
+    def teardown_request(error=None):
+        token = g.pop('trace_token', None)
+        if token is not None:
+            try:
+                end_trace(token)
+            except ValueError:
+                # Token created in another context, nothing to restore here
+                pass
+
     @app.errorhandler(500)
     def internal_error(error):
         app.logger.error(f'Server Error: {error}')
@@ -105,15 +138,12 @@ def create_app():
         app.logger.warning(f'Page not found: {error}')
         return 'Not Found', 404
     
-    # Add prometheus wsgi middleware
-    app.wsgi_app = DispatcherMiddleware(app.wsgi_app, {
-        '/metrics': make_wsgi_app()
-    })
-    
     @app.route('/metrics')
     def metrics():
-        return generate_latest(), 200, {'Content-Type': CONTENT_TYPE_LATEST}
+        body, content_type = generate_metrics()
+        return body, 200, {'Content-Type': content_type}
     
+    record_phase('create_app', time.perf_counter() - started)
     return app
 
 app = create_app()
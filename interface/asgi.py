@@ -0,0 +1,87 @@
+import json
+import time
+from asgiref.wsgi import WsgiToAsgi
+from .app import app
+from .metrics import record_request
+from .tracing import start_trace, end_trace, current_trace
+
+
+class ChatASGIApp:
+    """
+    ASGI entry point serving /api/chat asynchronously
+
+    Chat requests are handled by CommandService.process_command_async, so a
+    worker is not blocked for the OpenAI round-trip. Every other route is
+    passed to the Flask application unchanged.
+    """
+
+    CHAT_PATH = '/api/chat'
+
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['path'] == self.CHAT_PATH and scope['method'] == 'POST':
+            await self.chat(scope, receive, send)
+        else:
+            await self.wsgi(scope, receive, send)
+
+    async def chat(self, scope, receive, send):
+        from AutoFileManagement.AutoFileOpening.services.container import get_services
+
+        start_time = time.perf_counter()
+        # Continue the caller's trace (W3C traceparent or X-Request-ID) or start a new one
+        headers = dict(scope.get('headers') or [])
+        trace_token = start_trace(
+            headers.get(b'traceparent', b'').decode('latin-1'),
+            headers.get(b'x-request-id', b'').decode('latin-1')
+        )
+        try:
+            try:
+                data = json.loads(await self._read_body(receive) or b'{}')
+                message = data.get('message', '')
+            except (ValueError, AttributeError):
+                status, payload = 400, {'error': 'Invalid JSON body'}
+            else:
+                try:
+                    with self.flask_app.app_context():
+                        command_service = get_services(self.flask_app).command_service
+                        payload = await command_service.process_command_async(message)
+                    status = 200
+                except Exception as e:
+                    self.flask_app.logger.error(f'Server Error: {e}', exc_info=True)
+                    status, payload = 500, {'error': 'Internal Server Error'}
+
+            await self._send_json(send, status, payload, current_trace().trace_id)
+        finally:
+            end_trace(trace_token)
+
+        # Same metrics as the Flask request hooks
+        record_request('POST', 'api.chat', status, time.perf_counter() - start_time)
+
+    @staticmethod
+    async def _read_body(receive):
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body', False):
+                return body
+
+    @staticmethod
+    async def _send_json(send, status, payload, trace_id):
+        body = json.dumps(payload).encode('utf-8')
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode('ascii')),
+                (b'x-trace-id', trace_id.encode('ascii'))
+            ]
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+
+asgi_app = ChatASGIApp(app)
@@ -1,12 +1,27 @@
 import os
 from dotenv import load_dotenv
 
+_env_loaded = False
+
+
+def load_env(force=False):
+    """
+    Load the .env file into the environment, once per process
+
+    Args:
+        force (bool, optional): Read it again, e.g. on a configuration reload
+    """
+    global _env_loaded
+    if force or not _env_loaded:
+        load_dotenv(override=True)
+        _env_loaded = True
+
+
 class Config:
     """Configuration class for the application"""
     
-    def __init__(self):
-        # Force reload environment variables
-        load_dotenv(override=True)
+    def __init__(self, reload_env=False):
+        load_env(force=reload_env)
         
     def init_app(self, app):
         """Initialize application configuration
@@ -17,6 +32,9 @@ class Config:
         # Load configuration from environment variables
         app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev')
         
+        # eager: build the services before serving; lazy: serve at once and warm up in the background
+        app.config['STARTUP_MODE'] = os.getenv('STARTUP_MODE', 'eager').lower()
+        
         # OpenAI configuration
         app.config['OPENAI_API_KEY'] = os.getenv('OPENAI_API_KEY')
         
@@ -28,6 +46,9 @@ class Config:
     
     def _load_platform_config(self, app):
         """Load platform-level configurations"""
+        # Log directory (also holds the file catalog database)
+        app.config['LOG_DIR'] = os.getenv('LOG_DIR', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'logs'))
+
         # Logging configuration
         logging_config = os.path.join('shared', 'config', 'logging', 'logging.ini')
         if os.path.exists(logging_config):
@@ -37,6 +58,15 @@ class Config:
             if config.has_section('Logging'):
                 app.config['MAX_LOG_SIZE'] = config.getint('Logging', 'max_size', fallback=10 * 1024 * 1024)
                 app.config['LOG_BACKUP_COUNT'] = config.getint('Logging', 'backup_count', fallback=10)
+                app.config['LOG_FORMAT'] = config.get('Logging', 'format', fallback='text')
+                app.config['LOG_FILE_LEVEL'] = config.get('Logging', 'file_level', fallback='DEBUG')
+                app.config['LOG_CONSOLE_LEVEL'] = config.get('Logging', 'console_level', fallback='WARNING')
+                app.config['LOG_ES_LEVEL'] = config.get('Logging', 'es_level', fallback='INFO')
+            if config.has_section('TestLogging'):
+                app.config['TEST_LOG_MAX_SIZE'] = config.getint('TestLogging', 'max_size', fallback=50 * 1024 * 1024)
+                app.config['TEST_LOG_BACKUP_COUNT'] = config.getint('TestLogging', 'backup_count', fallback=5)
+                app.config['TEST_LOG_FLUSH_INTERVAL'] = config.getfloat('TestLogging', 'flush_interval', fallback=1.0)
+                app.config['TEST_LOG_SEGMENT_INTERVAL'] = config.getfloat('TestLogging', 'segment_interval', fallback=3600)
         else:
             app.config['MAX_LOG_SIZE'] = 10 * 1024 * 1024  # 10MB
             app.config['LOG_BACKUP_COUNT'] = 10
@@ -54,6 +84,16 @@ class Config:
                 app.config['ELASTICSEARCH_PORT'] = config.getint('Elasticsearch', 'port', fallback=9200)
                 app.config['ELASTICSEARCH_INDEX'] = config.get('Elasticsearch', 'index', fallback='fileapp')
                 app.config['ELASTICSEARCH_SCHEME'] = config.get('Elasticsearch', 'scheme', fallback='http')
+                app.config['ELASTICSEARCH_BATCH_SIZE'] = config.getint('Elasticsearch', 'batch_size', fallback=500)
+                app.config['ELASTICSEARCH_FLUSH_INTERVAL'] = config.getfloat('Elasticsearch', 'flush_interval', fallback=2.0)
+                app.config['ELASTICSEARCH_QUEUE_SIZE'] = config.getint('Elasticsearch', 'queue_size', fallback=10000)
+                app.config['ELASTICSEARCH_OVERFLOW_POLICY'] = config.get('Elasticsearch', 'overflow_policy', fallback='drop')
+                if config.has_option('Elasticsearch', 'spill_path'):
+                    app.config['ELASTICSEARCH_SPILL_PATH'] = config.get('Elasticsearch', 'spill_path')
+                if config.has_option('Elasticsearch', 'retention_days'):
+                    app.config['ELASTICSEARCH_RETENTION_DAYS'] = config.getint('Elasticsearch', 'retention_days')
+                app.config['ELASTICSEARCH_SHARDS'] = config.getint('Elasticsearch', 'shards', fallback=1)
+                app.config['ELASTICSEARCH_REPLICAS'] = config.getint('Elasticsearch', 'replicas', fallback=0)
         
         # Then override with environment variables if they exist
         app.config['ELASTICSEARCH_ENABLED'] = os.getenv('ELASTICSEARCH_ENABLED', 'false').lower() == 'true'
@@ -65,6 +105,18 @@ class Config:
             app.config['ELASTICSEARCH_INDEX'] = os.getenv('ELASTICSEARCH_INDEX')
         if os.getenv('ELASTICSEARCH_SCHEME'):
             app.config['ELASTICSEARCH_SCHEME'] = os.getenv('ELASTICSEARCH_SCHEME')
+        if os.getenv('ELASTICSEARCH_BATCH_SIZE'):
+            app.config['ELASTICSEARCH_BATCH_SIZE'] = int(os.getenv('ELASTICSEARCH_BATCH_SIZE'))
+        if os.getenv('ELASTICSEARCH_FLUSH_INTERVAL'):
+            app.config['ELASTICSEARCH_FLUSH_INTERVAL'] = float(os.getenv('ELASTICSEARCH_FLUSH_INTERVAL'))
+        if os.getenv('ELASTICSEARCH_QUEUE_SIZE'):
+            app.config['ELASTICSEARCH_QUEUE_SIZE'] = int(os.getenv('ELASTICSEARCH_QUEUE_SIZE'))
+        if os.getenv('ELASTICSEARCH_OVERFLOW_POLICY'):
+            app.config['ELASTICSEARCH_OVERFLOW_POLICY'] = os.getenv('ELASTICSEARCH_OVERFLOW_POLICY')
+        if os.getenv('ELASTICSEARCH_SPILL_PATH'):
+            app.config['ELASTICSEARCH_SPILL_PATH'] = os.getenv('ELASTICSEARCH_SPILL_PATH')
+        if os.getenv('ELASTICSEARCH_RETENTION_DAYS'):
+            app.config['ELASTICSEARCH_RETENTION_DAYS'] = int(os.getenv('ELASTICSEARCH_RETENTION_DAYS'))
     
     def _load_app_config(self, app):
         """Load application-specific configurations"""
@@ -119,6 +171,109 @@ class Config:
                     app.config['PREVIEW_ENABLED'] = config.getboolean('FileOpening', 'preview_enabled')
                 if config.has_option('FileOpening', 'max_preview_size'):
                     app.config['MAX_PREVIEW_SIZE'] = config.getint('FileOpening', 'max_preview_size')
+                if config.has_option('FileOpening', 'thumbnail_size'):
+                    app.config['THUMBNAIL_SIZE'] = config.getint('FileOpening', 'thumbnail_size')
+                if config.has_option('FileOpening', 'thumbnail_cache_path'):
+                    app.config['THUMBNAIL_CACHE_PATH'] = os.path.expanduser(
+                        config.get('FileOpening', 'thumbnail_cache_path'))
+                if config.has_option('FileOpening', 'thumbnail_cache_max_bytes'):
+                    app.config['THUMBNAIL_CACHE_MAX_BYTES'] = config.getint('FileOpening', 'thumbnail_cache_max_bytes')
+            
+            # Load file catalog configuration
+            if config.has_section('Catalog'):
+                if config.has_option('Catalog', 'enabled'):
+                    app.config['CATALOG_ENABLED'] = config.getboolean('Catalog', 'enabled')
+                if config.has_option('Catalog', 'path'):
+                    app.config['CATALOG_PATH'] = os.path.expanduser(config.get('Catalog', 'path'))
+                if config.has_option('Catalog', 'refresh_interval'):
+                    app.config['CATALOG_REFRESH_INTERVAL'] = config.getfloat('Catalog', 'refresh_interval')
+            
+            # Load directory walker configuration
+            if config.has_section('Walker'):
+                if config.has_option('Walker', 'engine'):
+                    app.config['WALKER_ENGINE'] = config.get('Walker', 'engine')
+                if config.has_option('Walker', 'max_workers'):
+                    app.config['WALKER_MAX_WORKERS'] = config.getint('Walker', 'max_workers')
+                if config.has_option('Walker', 'exclude'):
+                    app.config['WALKER_EXCLUDE'] = [
+                        pattern.strip() for pattern in config.get('Walker', 'exclude').split(',') if pattern.strip()
+                    ]
+            
+            # Load candidate ranking configuration
+            if config.has_section('Ranking'):
+                if config.has_option('Ranking', 'enabled'):
+                    app.config['RANKING_ENABLED'] = config.getboolean('Ranking', 'enabled')
+                if config.has_option('Ranking', 'hint_boost'):
+                    app.config['RANKING_HINT_BOOST'] = config.getfloat('Ranking', 'hint_boost')
+                if config.has_option('Ranking', 'recency_weight'):
+                    app.config['RANKING_RECENCY_WEIGHT'] = config.getfloat('Ranking', 'recency_weight')
+                if config.has_option('Ranking', 'recency_half_life_days'):
+                    app.config['RANKING_RECENCY_HALF_LIFE_DAYS'] = config.getfloat('Ranking', 'recency_half_life_days')
+            
+            # Load embedding index configuration
+            if config.has_section('Embedding'):
+                if config.has_option('Embedding', 'enabled'):
+                    app.config['EMBEDDING_ENABLED'] = config.getboolean('Embedding', 'enabled')
+                if config.has_option('Embedding', 'path'):
+                    app.config['EMBEDDING_PATH'] = os.path.expanduser(config.get('Embedding', 'path'))
+                if config.has_option('Embedding', 'model'):
+                    app.config['EMBEDDING_MODEL'] = config.get('Embedding', 'model')
+                if config.has_option('Embedding', 'dimensions'):
+                    app.config['EMBEDDING_DIMENSIONS'] = config.getint('Embedding', 'dimensions')
+                if config.has_option('Embedding', 'snippet_bytes'):
+                    app.config['EMBEDDING_SNIPPET_BYTES'] = config.getint('Embedding', 'snippet_bytes')
+                if config.has_option('Embedding', 'threshold'):
+                    app.config['EMBEDDING_THRESHOLD'] = config.getfloat('Embedding', 'threshold')
+                if config.has_option('Embedding', 'margin'):
+                    app.config['EMBEDDING_MARGIN'] = config.getfloat('Embedding', 'margin')
+            
+            # Load response cache configuration
+            if config.has_section('ResponseCache'):
+                if config.has_option('ResponseCache', 'enabled'):
+                    app.config['RESPONSE_CACHE_ENABLED'] = config.getboolean('ResponseCache', 'enabled')
+                if config.has_option('ResponseCache', 'max_entries'):
+                    app.config['RESPONSE_CACHE_MAX_ENTRIES'] = config.getint('ResponseCache', 'max_entries')
+                if config.has_option('ResponseCache', 'ttl'):
+                    app.config['RESPONSE_CACHE_TTL'] = config.getfloat('ResponseCache', 'ttl')
+                if config.has_option('ResponseCache', 'disk_enabled'):
+                    app.config['RESPONSE_CACHE_DISK_ENABLED'] = config.getboolean('ResponseCache', 'disk_enabled')
+                if config.has_option('ResponseCache', 'path'):
+                    app.config['RESPONSE_CACHE_PATH'] = os.path.expanduser(config.get('ResponseCache', 'path'))
+                if config.has_option('ResponseCache', 'disk_max_entries'):
+                    app.config['RESPONSE_CACHE_DISK_MAX_ENTRIES'] = config.getint('ResponseCache', 'disk_max_entries')
+            
+            # Load request coalescing configuration
+            if config.has_section('Coalescing'):
+                if config.has_option('Coalescing', 'enabled'):
+                    app.config['COALESCING_ENABLED'] = config.getboolean('Coalescing', 'enabled')
+                if config.has_option('Coalescing', 'cross_process'):
+                    app.config['COALESCING_CROSS_PROCESS'] = config.getboolean('Coalescing', 'cross_process')
+                if config.has_option('Coalescing', 'lock_path'):
+                    app.config['COALESCING_LOCK_PATH'] = os.path.expanduser(config.get('Coalescing', 'lock_path'))
+                if config.has_option('Coalescing', 'wait_timeout'):
+                    app.config['COALESCING_WAIT_TIMEOUT'] = config.getfloat('Coalescing', 'wait_timeout')
+            
+            # Load content index configuration
+            if config.has_section('ContentIndex'):
+                if config.has_option('ContentIndex', 'enabled'):
+                    app.config['CONTENT_INDEX_ENABLED'] = config.getboolean('ContentIndex', 'enabled')
+                if config.has_option('ContentIndex', 'path'):
+                    app.config['CONTENT_INDEX_PATH'] = os.path.expanduser(config.get('ContentIndex', 'path'))
+                if config.has_option('ContentIndex', 'workers'):
+                    app.config['CONTENT_INDEX_WORKERS'] = config.getint('ContentIndex', 'workers')
+                if config.has_option('ContentIndex', 'batch_size'):
+                    app.config['CONTENT_INDEX_BATCH_SIZE'] = config.getint('ContentIndex', 'batch_size')
+            
+            # Load file watcher configuration
+            if config.has_section('Watcher'):
+                if config.has_option('Watcher', 'enabled'):
+                    app.config['WATCHER_ENABLED'] = config.getboolean('Watcher', 'enabled')
+                if config.has_option('Watcher', 'mode'):
+                    app.config['WATCHER_MODE'] = config.get('Watcher', 'mode')
+                if config.has_option('Watcher', 'poll_interval'):
+                    app.config['WATCHER_POLL_INTERVAL'] = config.getfloat('Watcher', 'poll_interval')
+                if config.has_option('Watcher', 'coalesce_window'):
+                    app.config['WATCHER_COALESCE_WINDOW'] = config.getfloat('Watcher', 'coalesce_window')
             
             # Load OpenAI configuration
             if config.has_section('OpenAI'):
@@ -129,4 +284,28 @@ class Config:
                 if config.has_option('OpenAI', 'temperature'):
                     app.config['OPENAI_TEMPERATURE'] = config.getfloat('OpenAI', 'temperature')
                 if config.has_option('OpenAI', 'max_prompt_tokens'):
-                    app.config['MAX_PROMPT_TOKENS'] = config.getint('OpenAI', 'max_prompt_tokens')
\ No newline at end of file
+                    app.config['MAX_PROMPT_TOKENS'] = config.getint('OpenAI', 'max_prompt_tokens')
+                if config.has_option('OpenAI', 'base_url'):
+                    app.config['OPENAI_BASE_URL'] = config.get('OpenAI', 'base_url')
+                if config.has_option('OpenAI', 'pool_size'):
+                    app.config['OPENAI_POOL_SIZE'] = config.getint('OpenAI', 'pool_size')
+                if config.has_option('OpenAI', 'timeout'):
+                    app.config['OPENAI_TIMEOUT'] = config.getfloat('OpenAI', 'timeout')
+                if config.has_option('OpenAI', 'request_timeout'):
+                    app.config['OPENAI_REQUEST_TIMEOUT'] = config.getfloat('OpenAI', 'request_timeout')
+                if config.has_option('OpenAI', 'max_retries'):
+                    app.config['OPENAI_MAX_RETRIES'] = config.getint('OpenAI', 'max_retries')
+                if config.has_option('OpenAI', 'max_concurrency'):
+                    app.config['OPENAI_MAX_CONCURRENCY'] = config.getint('OpenAI', 'max_concurrency')
+                if config.has_option('OpenAI', 'requests_per_minute'):
+                    app.config['OPENAI_REQUESTS_PER_MINUTE'] = config.getint('OpenAI', 'requests_per_minute')
+                if config.has_option('OpenAI', 'tokens_per_minute'):
+                    app.config['OPENAI_TOKENS_PER_MINUTE'] = config.getint('OpenAI', 'tokens_per_minute')
+                if config.has_option('OpenAI', 'hedge_after'):
+                    app.config['OPENAI_HEDGE_AFTER'] = config.getfloat('OpenAI', 'hedge_after')
+                if config.has_option('OpenAI', 'stream_max_tokens'):
+                    app.config['OPENAI_STREAM_MAX_TOKENS'] = config.getint('OpenAI', 'stream_max_tokens')
+        
+        # A custom endpoint (e.g. a local stub server) can also come from the environment
+        if os.getenv('OPENAI_BASE_URL'):
+            app.config['OPENAI_BASE_URL'] = os.getenv('OPENAI_BASE_URL')
\ No newline at end of file
@@ -1,65 +1,142 @@
+import copy
 import os
 import logging
-from logging.handlers import RotatingFileHandler
-from datetime import datetime
-from elasticsearch import Elasticsearch
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+from datetime import datetime, timedelta
 from logging import LogRecord
+from prometheus_client import Counter
+import atexit
 import json
+import queue
+import threading
+import time
+from .tracing import TraceContextFilter
+
+ES_LOG_RECORDS = Counter(
+    'es_log_records_total',
+    'Log records handled by the Elasticsearch log sink',
+    ['outcome']
+)
 
 class ElasticsearchHandler(logging.Handler):
-    def __init__(self, host, port, index, scheme):
+    """
+    Logging handler shipping records to Elasticsearch in the background
+
+    emit() only formats the record and puts it on a bounded queue; a
+    flusher thread sends batches through the _bulk API when batch_size
+    records are queued or flush_interval seconds have passed. When
+    Elasticsearch is unreachable a circuit breaker stops connection attempts
+    for an exponentially growing backoff. Records that cannot be shipped are
+    dropped, or with the 'spill' overflow policy appended to a local file
+    that is replayed once Elasticsearch is back.
+
+    Each record goes to a daily index ({index}-YYYY.MM.DD) picked from its
+    own timestamp; mappings come from an index template installed once, and
+    indices older than retention_days are deleted.
+    """
+
+    def __init__(self, host, port, index, scheme, batch_size=500, flush_interval=2.0,
+                 queue_size=10000, overflow_policy='drop', spill_path=None,
+                 spill_max_bytes=100 * 1024 * 1024, max_backoff=300,
+                 retention_days=None, number_of_shards=1, number_of_replicas=0):
         super().__init__()
         self.es = None
-        self.index = f"{index}-{datetime.now().strftime('%Y.%m.%d')}"
+        # Records go to {index}-YYYY.MM.DD by their own timestamp
+        self.index_prefix = index
+        self.retention_days = retention_days
+        self.number_of_shards = number_of_shards
+        self.number_of_replicas = number_of_replicas
+        self._template_installed = False
+        self._next_retention = 0.0
         self.connection_params = {
             'host': host,
             'port': port,
             'scheme': scheme
         }
-        self._connect_to_elasticsearch()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow_policy = overflow_policy if spill_path else 'drop'
+        self.spill_path = spill_path
+        self.spill_max_bytes = spill_max_bytes
+        self.max_backoff = max_backoff
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop_event = threading.Event()
+        self._failures = 0
+        self._retry_at = 0.0
+        self._flusher = threading.Thread(target=self._run, name='es-log-flusher', daemon=True)
+        self._flusher.start()
 
     def _connect_to_elasticsearch(self):
-        try:
-            self.es = Elasticsearch(
-                [self.connection_params],
-                verify_certs=False,
-                retry_on_timeout=True,
-                max_retries=3,
-                timeout=30
-            )
-            # Test the connection and create index if not exists
-            if not self.es.ping():
-                raise ConnectionError("Could not ping Elasticsearch server")
-            
-            # Create index with mapping if it doesn't exist
-            if not self.es.indices.exists(index=self.index):
-                mapping = {
+        """Create the client and install the index template (flusher thread only)"""
+        # Imported here so the client library is only loaded when shipping is enabled,
+        # and off the startup path
+        from elasticsearch import Elasticsearch
+        es = Elasticsearch(
+            [self.connection_params],
+            verify_certs=False,
+            max_retries=0,
+            timeout=10
+        )
+        # Test the connection
+        if not es.ping():
+            raise ConnectionError("Could not ping Elasticsearch server")
+        
+        # Mappings come from a template, so daily indices need no explicit create
+        if not self._template_installed:
+            es.indices.put_index_template(name=self.index_prefix, body={
+                "index_patterns": [f"{self.index_prefix}-*"],
+                "template": {
+                    "settings": {
+                        "number_of_shards": self.number_of_shards,
+                        "number_of_replicas": self.number_of_replicas
+                    },
                     "mappings": {
                         "properties": {
                             "timestamp": {"type": "date"},
                             "level": {"type": "keyword"},
                             "module": {"type": "keyword"},
-                            "message": {"type": "text"}
+                            "message": {"type": "text"},
+                            "trace_id": {"type": "keyword"},
+                            "span": {"type": "keyword"}
                         }
                     }
                 }
-                self.es.indices.create(index=self.index, body=mapping)
-            
-            print(f"Successfully connected to Elasticsearch at {self.connection_params['host']}:{self.connection_params['port']}")
-        except Exception as e:
-            print(f"Failed to initialize Elasticsearch: {str(e)}")
-            self.es = None
+            })
+            self._template_installed = True
+        
+        self.es = es
+        print(f"Successfully connected to Elasticsearch at {self.connection_params['host']}:{self.connection_params['port']}")
+
+    def _index_for(self, doc):
+        """Daily index of a record, from its own timestamp (YYYY-MM-DD...)"""
+        return f"{self.index_prefix}-{doc['timestamp'][:10].replace('-', '.')}"
+
+    def _apply_retention(self):
+        """Delete daily indices older than retention_days, at most once an hour"""
+        if not self.retention_days or time.monotonic() < self._next_retention:
+            return
+        self._next_retention = time.monotonic() + 3600
+        cutoff = (datetime.now() - timedelta(days=self.retention_days)).strftime('%Y.%m.%d')
+        prefix = f"{self.index_prefix}-"
+        expired = []
+        for name in self.es.indices.get_alias(index=f"{prefix}*"):
+            suffix = name[len(prefix):]
+            try:
+                datetime.strptime(suffix, '%Y.%m.%d')
+            except ValueError:
+                continue
+            if suffix < cutoff:
+                expired.append(name)
+        if expired:
+            self.es.indices.delete(index=','.join(expired))
+            print(f"Deleted expired log indices: {', '.join(expired)}")
 
     def emit(self, record: LogRecord):
-        if not self.es:
-            self._connect_to_elasticsearch()
-            if not self.es:
-                return
-            
         try:
             msg = self.format(record)
             doc = {
-                'timestamp': datetime.now().isoformat(),
+                'timestamp': datetime.fromtimestamp(record.created).isoformat(),
                 'level': record.levelname,
                 'module': record.module,
                 'message': msg,
@@ -67,16 +144,188 @@ class ElasticsearchHandler(logging.Handler):
                 'line_number': record.lineno,
                 'path': record.pathname,
                 'thread': record.threadName,
-                'process': record.process
+                'process': record.process,
+                'trace_id': getattr(record, 'trace_id', None),
+                'span': getattr(record, 'span', None)
             }
-            self.es.index(index=self.index, document=doc)
-        except Exception as e:
-            print(f"Error sending log to Elasticsearch: {e}")
+        except Exception:
+            self.handleError(record)
+            return
+        try:
+            self._queue.put_nowait(doc)
+        except queue.Full:
+            ES_LOG_RECORDS.labels(outcome='dropped').inc()
+
+    def _next_batch(self):
+        """Collect up to batch_size records, waiting at most flush_interval"""
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            stopping = self._stop_event.is_set()
+            batch = self._next_batch()
+            if batch:
+                self._ship(batch, stopping)
+            elif stopping:
+                return
+
+    def _ship(self, batch, stopping=False):
+        """Send a batch, holding it back (or spilling it) while the circuit breaker is open"""
+        while True:
+            wait = self._retry_at - time.monotonic()
+            if wait > 0:
+                if self.overflow_policy == 'spill':
+                    self._spill(batch)
+                    return
+                if stopping or self._stop_event.wait(wait):
+                    ES_LOG_RECORDS.labels(outcome='dropped').inc(len(batch))
+                    return
+                continue
+            try:
+                if self.es is None:
+                    self._connect_to_elasticsearch()
+                self._replay_spill()
+                self._bulk(batch)
+                self._failures = 0
+                try:
+                    self._apply_retention()
+                except Exception as e:
+                    print(f"Error applying log index retention: {e}")
+                return
+            except Exception as e:
+                self._trip_breaker(e)
+
+    def _bulk(self, docs):
+        from elasticsearch import helpers
+        actions = ({'_index': self._index_for(doc), '_source': doc} for doc in docs)
+        shipped, errors = helpers.bulk(self.es, actions, raise_on_error=False, max_retries=0)
+        ES_LOG_RECORDS.labels(outcome='shipped').inc(shipped)
+        if errors:
+            ES_LOG_RECORDS.labels(outcome='rejected').inc(len(errors))
+
+    def _trip_breaker(self, error):
+        self._failures += 1
+        self.es = None
+        backoff = min(2 ** (self._failures - 1), self.max_backoff)
+        self._retry_at = time.monotonic() + backoff
+        print(f"Error sending logs to Elasticsearch, retrying in {backoff}s: {error}")
+
+    def _spill(self, docs):
+        """Append records to the spill file, dropping them once it is full"""
+        try:
+            size = os.path.getsize(self.spill_path) if os.path.exists(self.spill_path) else 0
+            if size >= self.spill_max_bytes:
+                ES_LOG_RECORDS.labels(outcome='dropped').inc(len(docs))
+                return
+            with open(self.spill_path, 'a', encoding='utf-8') as f:
+                for doc in docs:
+                    f.write(json.dumps(doc, ensure_ascii=False) + '\n')
+            ES_LOG_RECORDS.labels(outcome='spilled').inc(len(docs))
+        except OSError as e:
+            print(f"Error spilling logs to {self.spill_path}: {e}")
+            ES_LOG_RECORDS.labels(outcome='dropped').inc(len(docs))
+
+    def _replay_spill(self):
+        """Ship spilled records, oldest first, then remove the spill file"""
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return
+        replaying = self.spill_path + '.replay'
+        if not os.path.exists(replaying):
+            os.replace(self.spill_path, replaying)
+        batch = []
+        with open(replaying, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    batch.append(json.loads(line))
+                except ValueError:
+                    continue
+                if len(batch) >= self.batch_size:
+                    self._bulk(batch)
+                    batch = []
+        if batch:
+            self._bulk(batch)
+        os.remove(replaying)
+
+    def close(self):
+        """Flush queued records (waiting up to flush_interval) and stop the flusher"""
+        self._stop_event.set()
+        self._flusher.join(timeout=self.flush_interval + 5)
+        super().close()
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            'timestamp': datetime.fromtimestamp(record.created).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'module': record.module,
+            'function': record.funcName,
+            'line_number': record.lineno,
+            'thread': record.threadName,
+            'process': record.process,
+            'message': record.getMessage()
+        }
+        if getattr(record, 'trace_id', None):
+            entry['trace_id'] = record.trace_id
+            entry['span'] = record.span
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        if record.stack_info:
+            entry['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """
+    QueueHandler that defers the sink formatting to the listener thread
+
+    Like QueueHandler.prepare, the message is merged with its arguments in
+    the calling thread, so arguments mutated after the call can't change
+    it; the traceback is rendered there too. The exception itself is kept
+    on the record for the sinks, and the record is not made picklable: the
+    listener runs in the same process.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        record.message = record.msg
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        return record
+
+
+def _stop_listener(listener):
+    """Flush the log queue at exit, unless the listener was already stopped"""
+    if listener._thread is not None:
+        listener.stop()
+
+
+def _level(app, key, default):
+    return logging.getLevelName(str(app.config.get(key, default)).upper())
+
 
 def setup_logger(app):
     """
     Setup application logging system
     
+    All application loggers write to a single in-memory queue; a
+    QueueListener thread formats the records and fans them out to the file,
+    console and Elasticsearch sinks, each with its own level.
+    
     Args:
         app: Flask application instance
     """
@@ -92,6 +341,7 @@ def setup_logger(app):
     formatter = logging.Formatter(
         '[%(asctime)s] %(levelname)s in %(module)s.%(funcName)s:%(lineno)d: %(message)s'
     )
+    file_formatter = JsonFormatter() if app.config.get('LOG_FORMAT', 'text') == 'json' else formatter
     
     # File handler with DEBUG level for detailed logging
     file_handler = RotatingFileHandler(
@@ -99,55 +349,60 @@ def setup_logger(app):
         maxBytes=app.config.get('MAX_LOG_SIZE', 10485760),
         backupCount=app.config.get('LOG_BACKUP_COUNT', 10)
     )
-    file_handler.setFormatter(formatter)
-    file_handler.setLevel(logging.DEBUG)
+    file_handler.setFormatter(file_formatter)
+    file_handler.setLevel(_level(app, 'LOG_FILE_LEVEL', 'DEBUG'))
     
     # Console handler remains at WARNING level
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(formatter)
-    console_handler.setLevel(logging.WARNING)
+    console_handler.setLevel(_level(app, 'LOG_CONSOLE_LEVEL', 'WARNING'))
     
-    # Setup Elasticsearch handler
-    try:
-        es_handler = ElasticsearchHandler(
-            host=app.config['ELASTICSEARCH_HOST'],
-            port=app.config['ELASTICSEARCH_PORT'],
-            index=app.config['ELASTICSEARCH_INDEX'],
-            scheme=app.config['ELASTICSEARCH_SCHEME']
-        )
-        es_handler.setFormatter(formatter)
-        es_handler.setLevel(logging.INFO)
-        
-        if es_handler.es:  # Only add handler if connection successful
-            app.logger.addHandler(es_handler)
-            werkzeug_logger = logging.getLogger('werkzeug')
-            werkzeug_logger.addHandler(es_handler)
-            sqlalchemy_logger = logging.getLogger('sqlalchemy.engine')
-            sqlalchemy_logger.addHandler(es_handler)
-            app.logger.info('Elasticsearch logging enabled')
-        else:
-            app.logger.warning('Elasticsearch logging disabled due to connection failure')
-    except Exception as e:
-        app.logger.warning(f'Failed to initialize Elasticsearch logging: {str(e)}')
+    sinks = [file_handler, console_handler]
     
-    # Configure Flask application logger
-    app.logger.addHandler(file_handler)
-    app.logger.addHandler(console_handler)
-    app.logger.setLevel(logging.INFO)
+    # Setup Elasticsearch handler, records are shipped by a background thread
+    es_error = None
+    if app.config.get('ELASTICSEARCH_ENABLED'):
+        try:
+            es_handler = ElasticsearchHandler(
+                host=app.config.get('ELASTICSEARCH_HOST', 'localhost'),
+                port=app.config.get('ELASTICSEARCH_PORT', 9200),
+                index=app.config.get('ELASTICSEARCH_INDEX', 'fileapp'),
+                scheme=app.config.get('ELASTICSEARCH_SCHEME', 'http'),
+                batch_size=app.config.get('ELASTICSEARCH_BATCH_SIZE', 500),
+                flush_interval=app.config.get('ELASTICSEARCH_FLUSH_INTERVAL', 2.0),
+                queue_size=app.config.get('ELASTICSEARCH_QUEUE_SIZE', 10000),
+                overflow_policy=app.config.get('ELASTICSEARCH_OVERFLOW_POLICY', 'drop'),
+                spill_path=app.config.get('ELASTICSEARCH_SPILL_PATH') or os.path.join(log_dir, 'es_spill.jsonl'),
+                retention_days=app.config.get('ELASTICSEARCH_RETENTION_DAYS'),
+                number_of_shards=app.config.get('ELASTICSEARCH_SHARDS', 1),
+                number_of_replicas=app.config.get('ELASTICSEARCH_REPLICAS', 0)
+            )
+            es_handler.setFormatter(formatter)
+            es_handler.setLevel(_level(app, 'LOG_ES_LEVEL', 'INFO'))
+            sinks.append(es_handler)
+        except Exception as e:
+            es_error = e
     
-    # Configure Werkzeug logger
-    werkzeug_logger = logging.getLogger('werkzeug')
-    werkzeug_logger.addHandler(file_handler)
-    werkzeug_logger.addHandler(console_handler)
-    werkzeug_logger.setLevel(logging.INFO)
+    # Loggers only enqueue records, the listener thread does the formatting and I/O
+    log_queue = queue.SimpleQueue()
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    # Trace context is read on the logging thread, before the record is queued
+    queue_handler.addFilter(TraceContextFilter())
+    listener = QueueListener(log_queue, *sinks, respect_handler_level=True)
+    listener.start()
+    atexit.register(_stop_listener, listener)
+    app.extensions['log_listener'] = listener
     
-    # Configure SQLAlchemy logger
-    sqlalchemy_logger = logging.getLogger('sqlalchemy.engine')
-    sqlalchemy_logger.addHandler(file_handler)
-    sqlalchemy_logger.addHandler(console_handler)
-    sqlalchemy_logger.setLevel(logging.INFO)
+    # Configure Flask application, Werkzeug and SQLAlchemy loggers
+    for logger in (app.logger, logging.getLogger('werkzeug'), logging.getLogger('sqlalchemy.engine')):
+        logger.addHandler(queue_handler)
+        logger.setLevel(logging.INFO)
     
     # Create a general logger for the entire application
     app.config['LOGGER'] = app.logger
     
-    app.logger.info('Logger initialized successfully') 
\ No newline at end of file
+    if es_error is not None:
+        app.logger.warning(f'Failed to initialize Elasticsearch logging: {str(es_error)}')
+    elif app.config.get('ELASTICSEARCH_ENABLED'):
+        app.logger.info('Elasticsearch logging enabled')
+    app.logger.info('Logger initialized successfully')
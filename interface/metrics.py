@@ -0,0 +1,67 @@
+import os
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+)
+
+# Set by the gunicorn configuration (or by hand for other multi-worker servers)
+# before prometheus_client is imported; every worker then writes its values to
+# this directory and a scrape of any worker aggregates all of them
+MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+MULTIPROCESS = bool(MULTIPROC_DIR)
+if MULTIPROCESS:
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+
+class LabelCache:
+    """
+    Children of a labelled metric, cached by label values
+
+    ``metric.labels()`` validates and locks on every call; per-request
+    metrics look their child up in a plain dict instead.
+    """
+
+    def __init__(self, metric):
+        self.metric = metric
+        self._children = {}
+
+    def __call__(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            child = self.metric.labels(*values)
+            self._children[values] = child
+        return child
+
+
+API_DURATION = Histogram(
+    'api_request_duration_seconds',
+    'Duration of API requests in seconds',
+    ['method', 'endpoint']
+)
+API_REQUESTS = Counter(
+    'api_requests_total',
+    'Total number of API requests',
+    ['method', 'endpoint', 'status']
+)
+_api_duration = LabelCache(API_DURATION)
+_api_requests = LabelCache(API_REQUESTS)
+
+
+def record_request(method, endpoint, status, duration):
+    """Record one request in the request metrics (Flask hooks and the ASGI chat handler)"""
+    _api_duration(method, endpoint).observe(duration)
+    _api_requests(method, endpoint, str(status)).inc()
+
+
+def generate_metrics():
+    """
+    Render the metrics for a scrape
+
+    Returns:
+        tuple: (body, content type), aggregated over all workers in multiprocess mode
+    """
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,88 @@
+import threading
+import time
+from prometheus_client import Gauge
+
+STARTUP_DURATION = Gauge(
+    'app_startup_duration_seconds',
+    'Seconds spent in each startup phase and warm-up step',
+    ['phase'],
+    multiprocess_mode='max'
+)
+
+
+def record_phase(phase, seconds):
+    """Record the duration of a startup phase"""
+    STARTUP_DURATION.labels(phase=phase).set(seconds)
+
+
+class WarmUp:
+    """
+    Warm-up steps of an application, run once after it is created
+
+    Steps run in order inside an application context, either before
+    create_app() returns (eager startup) or on a background thread while
+    requests are already served (lazy startup). The application is ready
+    once every step succeeded; a failed step is logged and keeps it unready.
+    """
+
+    def __init__(self, app, mode='eager'):
+        self.app = app
+        self.mode = mode
+        self.done = threading.Event()
+        self._steps = []
+        self._status = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, func):
+        """Add a step; func is called without arguments"""
+        self._steps.append((name, func))
+        self._status[name] = {'state': 'pending'}
+
+    def fail(self, name, error):
+        """Record a step that failed before the warm-up could run it"""
+        self._status[name] = {'state': 'failed', 'error': str(error)}
+
+    def start(self, background=False):
+        if background:
+            threading.Thread(target=self._run, name='warm-up', daemon=True).start()
+        else:
+            self._run()
+
+    def _run(self):
+        for name, func in self._steps:
+            self._set(name, state='running')
+            start = time.perf_counter()
+            try:
+                with self.app.app_context():
+                    func()
+            except Exception as e:
+                self._set(name, state='failed', error=str(e))
+                self.app.logger.error(f'Warm-up step {name} failed: {e}')
+            else:
+                self._set(name, state='done')
+            duration = time.perf_counter() - start
+            self._set(name, duration=round(duration, 6))
+            record_phase(f'warmup_{name}', duration)
+        self.done.set()
+
+    def _set(self, name, **values):
+        with self._lock:
+            self._status[name] = dict(self._status[name], **values)
+
+    @property
+    def ready(self):
+        with self._lock:
+            return self.done.is_set() and all(s['state'] == 'done' for s in self._status.values())
+
+    def status(self):
+        """
+        Get the warm-up state for the readiness endpoint
+
+        Returns:
+            dict: ``ready``, the startup ``mode`` and the state (and duration)
+            of every step
+        """
+        ready = self.ready
+        with self._lock:
+            steps = {name: dict(status) for name, status in self._status.items()}
+        return {'ready': ready, 'mode': self.mode, 'steps': steps}
@@ -1,6 +1,55 @@
 class ChatAPI {
     constructor() {
         this.endpoint = '/api/chat';
+        this.streamEndpoint = '/api/chat/stream';
+    }
+
+    // Send a message to the streaming endpoint, calling onEvent(event, data)
+    // for every server-sent event; resolves with the final result
+    async streamMessage(message, onEvent) {
+        const response = await fetch(this.streamEndpoint, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'Accept': 'text/event-stream'
+            },
+            body: JSON.stringify({ message })
+        });
+
+        if (!response.ok || !response.body) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let result = null;
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            // Events are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const block = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                let event = 'message';
+                let data = '';
+                for (const line of block.split('\n')) {
+                    if (line.startsWith('event:')) event = line.slice(6).trim();
+                    else if (line.startsWith('data:')) data += line.slice(5).trim();
+                }
+                const payload = data ? JSON.parse(data) : null;
+                if (event === 'result') result = payload;
+                onEvent(event, payload);
+            }
+        }
+
+        if (!result) {
+            throw new Error('Stream ended without a result');
+        }
+        return result;
     }
 
     async sendMessage(message) {
@@ -73,13 +122,32 @@ class ChatUI {
         this.chatInput.value = '';
         this.chatInput.style.height = 'auto';
 
+        // 助手回复先显示进度，收到结果后替换
+        const messageText = this.appendMessage('Looking for files...', 'assistant');
+        let answer = '';
+
         try {
-            // 发送消息到后端
-            const response = await this.chatAPI.sendMessage(message);
-            // 添加助手回复
-            this.appendMessage(response.response, 'assistant');
+            const response = await this.chatAPI.streamMessage(message, (event, data) => {
+                if (event === 'status' && data.stage === 'model') {
+                    messageText.textContent = `Asking the model about ${data.candidates} files...`;
+                } else if (event === 'token') {
+                    answer += data.text;
+                    messageText.textContent = answer;
+                } else if (event === 'error') {
+                    answer = '';
+                    messageText.closest('.message').classList.replace('message-assistant', 'message-error');
+                }
+            });
+            messageText.innerHTML = response.response;
         } catch (error) {
-            this.appendMessage('Sorry, something went wrong. Please try again.', 'error');
+            console.error('Streaming failed, retrying without streaming:', error);
+            try {
+                const response = await this.chatAPI.sendMessage(message);
+                messageText.innerHTML = response.response;
+            } catch (fallbackError) {
+                messageText.closest('.message').remove();
+                this.appendMessage('Sorry, something went wrong. Please try again.', 'error');
+            }
         }
     }
 
@@ -92,6 +160,7 @@ class ChatUI {
         messageText.innerHTML = text;
         this.messagesContainer.appendChild(message);
         this.messagesContainer.scrollTop = this.messagesContainer.scrollHeight;
+        return messageText;
     }
 }
 
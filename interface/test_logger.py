@@ -1,12 +1,264 @@
-import os
+import atexit
+import glob
+import gzip
 import json
-from datetime import datetime
+import logging
+import os
+import shutil
+import threading
 import time
+import uuid
+from datetime import datetime
+from contextvars import ContextVar
 from flask import current_app
 
+from .trace_query import TraceQuery, iter_traces, lock_trace_file, read_index
+from .tracing import current_trace, end_trace, span, start_trace
+
+
+class TraceWriter:
+    """
+    Buffered, indexed JSONL writer of execution traces
+
+    Records are serialized on the calling thread and appended to an in-memory
+    buffer; a background thread writes the buffer with a single ``O_APPEND``
+    write every ``flush_interval`` seconds (or as soon as ``max_buffered``
+    records are waiting). Writes and rotation hold an ``flock`` on a sibling
+    lock file, so several worker processes can share one trace file.
+
+    Each write is a block of at most ``block_size`` records, and a line with
+    the block's byte range, time range and event types is appended to the
+    sparse index next to the segment (``<segment>.idx``), so queries only
+    read the blocks they need (see ``interface.trace_query``). The active
+    segment is closed when it exceeds ``max_size`` bytes or its first record
+    belongs to an earlier ``segment_interval``; closed segments are gzip
+    compressed block by block, keeping their index usable, and only the
+    newest ``backup_count`` of them are kept.
+    """
+
+    def __init__(self, path, max_size=50 * 1024 * 1024, backup_count=5, flush_interval=1.0,
+                 segment_interval=3600, max_buffered=256, block_size=256, logger=None):
+        self.path = path
+        # Flush errors happen on the writer thread, outside any application context
+        self.logger = logger or logging.getLogger(__name__)
+        self.index_path = path + '.idx'
+        self.max_size = max_size
+        self.backup_count = backup_count
+        self.flush_interval = flush_interval
+        self.segment_interval = segment_interval
+        self.max_buffered = max_buffered
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._buffer = []
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._pid = None
+        self._thread = None
+        self._segment_start = (None, None)
+
+        log_dir = os.path.dirname(path)
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
+        atexit.register(self.close)
+
+    def _ensure_thread(self):
+        """Start the flusher thread, again in a forked worker where it does not survive"""
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='trace-writer', daemon=True)
+            self._thread.start()
+
+    def write(self, record, ts=None, types=()):
+        """
+        Queue one record, written as a single JSON line
+
+        Args:
+            record (dict): Trace record
+            ts (float, optional): Record time indexed for queries, defaults to now
+            types (iterable, optional): Event types indexed for queries
+        """
+        line = json.dumps(record, ensure_ascii=False, separators=(',', ':'), default=str) + '\n'
+        entry = (line.encode('utf-8'), time.time() if ts is None else ts, types)
+        with self._lock:
+            if self._closed:
+                return
+            self._ensure_thread()
+            self._buffer.append(entry)
+            if len(self._buffer) >= self.max_buffered:
+                self._wakeup.set()
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                self.logger.error(f"Error writing trace log: {e}")
+
+    def _blocks(self, entries):
+        for i in range(0, len(entries), self.block_size):
+            block = entries[i:i + self.block_size]
+            timestamps = [ts for _, ts, _ in block]
+            yield b''.join(data for data, _, _ in block), {
+                'start': min(timestamps),
+                'end': max(timestamps),
+                'count': len(block),
+                'types': sorted({t for _, _, types in block for t in types})
+            }
+
+    def _partition(self, ts):
+        return int(ts // self.segment_interval) if self.segment_interval else 0
+
+    def _active_segment_start(self):
+        """Time of the first block of the active segment, cached per index file"""
+        try:
+            st = os.stat(self.index_path)
+        except FileNotFoundError:
+            return None
+        ident, start = self._segment_start
+        if ident != (st.st_dev, st.st_ino):
+            start = None
+            with open(self.index_path, 'rb') as f:
+                try:
+                    start = json.loads(f.readline())['start']
+                except (ValueError, KeyError):
+                    pass
+            self._segment_start = ((st.st_dev, st.st_ino), start)
+        return start
+
+    def flush(self):
+        """Write all buffered records to the active segment"""
+        with self._flush_lock:
+            with self._lock:
+                entries, self._buffer = self._buffer, []
+            if not entries:
+                return
+
+            rotated = []
+            lock_fd = lock_trace_file(self.path)
+            try:
+                # Close the segment when the new records belong to a later partition
+                segment_start = self._active_segment_start()
+                if segment_start is not None and \
+                        self._partition(segment_start) != self._partition(min(ts for _, ts, _ in entries)):
+                    rotated.append(self._rotate())
+
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    offset = os.fstat(fd).st_size
+                    index_lines = []
+                    for data, block in self._blocks(entries):
+                        view = memoryview(data)
+                        while view:
+                            view = view[os.write(fd, view):]
+                        index_lines.append(json.dumps(dict(block, offset=offset, length=len(data))) + '\n')
+                        offset += len(data)
+                finally:
+                    os.close(fd)
+                # The index is written after the data, so readers never see a block that is not there
+                with open(self.index_path, 'a', encoding='utf-8') as f:
+                    f.write(''.join(index_lines))
+                if offset >= self.max_size:
+                    rotated.append(self._rotate())
+            finally:
+                os.close(lock_fd)
+
+            # Compression runs outside the lock, no other process touches the renamed files
+            for segment in rotated:
+                if segment:
+                    self._compress(segment)
+
+    def _rotate(self):
+        """Move the active segment and its index aside, returning the segment's new name"""
+        rotated = f"{self.path}.{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.{os.getpid()}"
+        try:
+            os.replace(self.path, rotated)
+        except FileNotFoundError:
+            return None
+        try:
+            os.replace(self.index_path, rotated + '.idx')
+        except FileNotFoundError:
+            pass
+        return rotated
+
+    def _compress(self, rotated):
+        """Compress a closed segment, one gzip member per indexed block"""
+        blocks = read_index(rotated + '.idx')
+        index_lines = []
+        with open(rotated, 'rb') as src, open(rotated + '.gz.tmp', 'wb') as dst:
+            if blocks:
+                for block in blocks:
+                    src.seek(block['offset'])
+                    data = gzip.compress(src.read(block['length']))
+                    index_lines.append(json.dumps(dict(block, offset=dst.tell(), length=len(data))) + '\n')
+                    dst.write(data)
+            else:
+                with gzip.GzipFile(fileobj=dst, mode='wb') as gz:
+                    shutil.copyfileobj(src, gz)
+        if index_lines:
+            with open(rotated + '.gz.idx', 'w', encoding='utf-8') as f:
+                f.write(''.join(index_lines))
+        os.replace(rotated + '.gz.tmp', rotated + '.gz')
+        for path in (rotated, rotated + '.idx'):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+        backups = sorted(glob.glob(glob.escape(self.path) + '.*.gz'))
+        for path in backups[:max(len(backups) - self.backup_count, 0)]:
+            for stale in (path, path + '.idx'):
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+
+    def close(self):
+        """Stop the flusher thread and write the remaining records"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._wakeup.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout=5)
+        try:
+            self.flush()
+        except Exception as e:
+            self.logger.error(f"Error writing trace log: {e}")
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_trace_writer(path, max_size=50 * 1024 * 1024, backup_count=5, flush_interval=1.0, segment_interval=3600,
+                     logger=None):
+    """Get the process-wide trace writer for a configuration"""
+    key = (path, max_size, backup_count, flush_interval, segment_interval)
+    with _writers_lock:
+        writer = _writers.get(key)
+        if writer is None:
+            writer = TraceWriter(path, max_size, backup_count, flush_interval, segment_interval, logger=logger)
+            _writers[key] = writer
+        return writer
+
+
 class TestLogger:
-    """Test logger for debugging and analysis"""
-    
+    """
+    Test logger for debugging and analysis
+
+    Every execution (one chat request) is collected in memory and written as
+    a single trace record, one JSON object per line in ``test_log.jsonl``::
+
+        {"trace_id": ..., "title": ..., "start": ..., "end": ..., "duration": ...,
+         "events": [{"type": "prompt", "timestamp": ..., "content": {...}}, ...]}
+
+    Events logged outside an execution are written as a trace of their own.
+    """
+
     def __init__(self):
         # Load test logging configuration
         self.enabled = {
@@ -16,86 +268,91 @@ class TestLogger:
             'directory_info': current_app.config.get('TEST_DIRECTORY_INFO_LOGGING', True),
             'local_state': current_app.config.get('TEST_LOCAL_STATE_LOGGING', True)
         }
-        
+
         # Use LOG_DIR from environment or config
-        log_dir = os.getenv('LOG_DIR', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'logs'))
+        log_dir = current_app.config.get('LOG_DIR') or \
+            os.getenv('LOG_DIR', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'logs'))
         self.log_file = os.path.join(log_dir, 'test_log.jsonl')
-        self.log_format = current_app.config.get('TEST_LOG_FORMAT', 'jsonl')
-        self.execution_start = None
-        
-        # Create logs directory if it doesn't exist
-        os.makedirs(log_dir, exist_ok=True)
-    
+        self.writer = get_trace_writer(
+            self.log_file,
+            current_app.config.get('TEST_LOG_MAX_SIZE', 50 * 1024 * 1024),
+            current_app.config.get('TEST_LOG_BACKUP_COUNT', 5),
+            current_app.config.get('TEST_LOG_FLUSH_INTERVAL', 1.0),
+            current_app.config.get('TEST_LOG_SEGMENT_INTERVAL', 3600),
+            current_app.logger
+        )
+        # One logger is shared by all requests (threads or asyncio tasks),
+        # so traces are tracked per execution context
+        self._trace = ContextVar(f'trace_{id(self)}', default=None)
+
+    @staticmethod
+    def _new_trace(title, context=None):
+        return {
+            'trace_id': context.trace_id if context is not None else uuid.uuid4().hex,
+            'title': title,
+            'pid': os.getpid(),
+            'start': datetime.now().isoformat(),
+            'started_at': time.time(),
+            'events': []
+        }
+
+    def _finish_trace(self, trace, context=None):
+        trace['end'] = datetime.now().isoformat()
+        trace['duration'] = round(time.time() - trace['started_at'], 4)
+        if context is not None:
+            # Stage timings of the request (see interface.tracing)
+            trace['spans'] = list(context.spans)
+        with span('trace_log'):
+            self.writer.write(trace, trace['started_at'], {event['type'] for event in trace['events']})
+
     def start_execution(self, title=None):
-        """Start a new test execution"""
-        self.execution_start = time.time()
-        separator = "=" * 50
+        """Start a new test execution, part of the current request trace if there is one"""
         title = title or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        header = f"\n{separator}\n{title}\n{separator}\n"
-        
-        with open(self.log_file, 'a', encoding='utf-8') as f:
-            f.write(header)
-    
+        context, token = current_trace(), None
+        if context is None:
+            token = start_trace()
+            context = current_trace()
+        trace = self._new_trace(title, context)
+        trace['_context'] = (context, token)
+        self._trace.set(trace)
+
     def end_execution(self):
-        """End current test execution"""
-        if self.execution_start:
-            runtime = time.time() - self.execution_start
-            footer = f"\nExecution completed in {runtime:.2f} seconds\n\n"
-            with open(self.log_file, 'a', encoding='utf-8') as f:
-                f.write(footer)
-            self.execution_start = None
-    
-    def _format_content(self, content):
-        """Format content with proper line breaks"""
-        if isinstance(content, str):
-            # Preserve existing line breaks and add breaks at reasonable points
-            formatted = content.replace('\\n', '\n')
-            # Add breaks after punctuation marks if line is too long
-            lines = []
-            current_line = ""
-            for word in formatted.split():
-                if len(current_line) + len(word) > 80:  # 80 chars per line
-                    lines.append(current_line)
-                    current_line = word
-                else:
-                    current_line = f"{current_line} {word}" if current_line else word
-                if any(word.endswith(p) for p in ['.', '?', '!', ';', ':']):
-                    lines.append(current_line)
-                    current_line = ""
-            if current_line:
-                lines.append(current_line)
-            return '\n'.join(lines)
-        return content
-    
+        """End current test execution and write its trace"""
+        trace = self._trace.get()
+        if trace is not None:
+            self._trace.set(None)
+            context, token = trace.pop('_context')
+            try:
+                self._finish_trace(trace, context)
+            except Exception as e:
+                current_app.logger.error(f"Error writing test log: {str(e)}")
+            finally:
+                if token is not None:
+                    try:
+                        end_trace(token)
+                    except ValueError:
+                        # Ended from another context, e.g. a streaming generator closed elsewhere
+                        pass
+
     def _write_log(self, data):
-        """Write log entry to file"""
+        """Add a log entry to the current execution's trace"""
         try:
-            # Add timestamp
             data['timestamp'] = datetime.now().isoformat()
-            
-            # Format content with proper line breaks
-            if isinstance(data.get('content'), dict):
-                for key, value in data['content'].items():
-                    if isinstance(value, str):
-                        data['content'][key] = self._format_content(value)
-            
-            with open(self.log_file, 'a', encoding='utf-8') as f:
-                if self.log_format == 'jsonl':
-                    # Format JSON with proper indentation and line breaks
-                    formatted_json = json.dumps(data, ensure_ascii=False, indent=2)
-                    f.write(formatted_json + '\n')
-                else:
-                    # For plain format, preserve formatting
-                    content = json.dumps(data['content'], ensure_ascii=False, indent=2)
-                    f.write(f"[{data['timestamp']}] {data['type']}:\n{content}\n")
+            trace = self._trace.get()
+            if trace is not None:
+                trace['events'].append(data)
+            else:
+                trace = self._new_trace(None)
+                trace['events'].append(data)
+                self._finish_trace(trace)
         except Exception as e:
             current_app.logger.error(f"Error writing test log: {str(e)}")
-    
+
     def log_prompt(self, prompt, context=None):
         """Log prompt information"""
         if not self.enabled['prompt']:
             return
-            
+
         self._write_log({
             'type': 'prompt',
             'content': {
@@ -103,12 +360,12 @@ class TestLogger:
                 'context': context
             }
         })
-    
+
     def log_llm_response(self, response, metadata=None):
         """Log LLM response"""
         if not self.enabled['llm_response']:
             return
-            
+
         self._write_log({
             'type': 'llm_response',
             'content': {
@@ -116,73 +373,91 @@ class TestLogger:
                 'metadata': metadata
             }
         })
-    
+
     def log_file_info(self, file_info):
         """Log file information"""
         if not self.enabled['file_info']:
             return
-            
+
         self._write_log({
             'type': 'file_info',
             'content': file_info
         })
-    
+
     def log_directory_info(self, directory_info):
         """Log directory information"""
         if not self.enabled['directory_info']:
             return
-            
+
         self._write_log({
             'type': 'directory_info',
             'content': directory_info
         })
-    
+
     def log_local_state(self, state_info):
         """Log local state information"""
         if not self.enabled['local_state']:
             return
-            
+
         self._write_log({
             'type': 'local_state',
             'content': state_info
         })
-    
+
+    def query(self, types=None, start=None, end=None, trace_id=None, min_duration=None,
+              limit=None, offset=0, descending=False):
+        """
+        Stream execution traces from the current and closed trace segments
+
+        Args:
+            types (list, optional): Keep traces containing one of these event types
+            start, end (optional): Start time range (datetime, ISO string or timestamp)
+            trace_id (str, optional): Keep only this trace
+            min_duration (float, optional): Keep traces that took at least this many seconds
+            limit (int, optional): Maximum number of traces
+            offset (int): Matching traces to skip
+            descending (bool): Newest traces first
+
+        Returns:
+            generator: Trace records
+        """
+        self.writer.flush()
+        return iter_traces(
+            self.log_file,
+            TraceQuery(types, start, end, trace_id, min_duration),
+            limit=limit, offset=offset, descending=descending, logger=current_app.logger
+        )
+
     def get_logs(self, log_types=None, start_time=None, end_time=None):
         """
         Get filtered logs
-        
+
         Args:
             log_types (list, optional): Types of logs to retrieve
             start_time (datetime, optional): Start time filter
             end_time (datetime, optional): End time filter
-            
+
         Returns:
-            list: Filtered log entries
+            list: Filtered log entries, each with the trace_id of its execution
         """
         try:
             logs = []
-            with open(self.log_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    try:
-                        entry = json.loads(line)
-                        
-                        # Apply filters
-                        if log_types and entry['type'] not in log_types:
-                            continue
-                            
-                        if start_time and datetime.fromisoformat(entry['timestamp']) < start_time:
-                            continue
-                            
-                        if end_time and datetime.fromisoformat(entry['timestamp']) > end_time:
-                            continue
-                        
-                        logs.append(entry)
-                    except json.JSONDecodeError:
+            # The time range applies to each entry's timestamp: an execution started before
+            # start_time can hold later entries, one started after end_time cannot match
+            for trace in self.query(log_types, end=end_time):
+                for entry in trace.get('events', []):
+                    # Apply filters
+                    if log_types and entry['type'] not in log_types:
                         continue
-                        
+                    
+                    if start_time and datetime.fromisoformat(entry['timestamp']) < start_time:
+                        continue
+                    
+                    if end_time and datetime.fromisoformat(entry['timestamp']) > end_time:
+                        continue
+                    
+                    logs.append(dict(entry, trace_id=trace.get('trace_id')))
             return logs
-        except FileNotFoundError:
-            return []
         except Exception as e:
             current_app.logger.error(f"Error reading test logs: {str(e)}")
-            return [] 
\ No newline at end of file
+            return []
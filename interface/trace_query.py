@@ -0,0 +1,237 @@
+import glob
+import gzip
+import json
+import os
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are still atomic per write, rotation is not locked
+    fcntl = None
+
+
+def lock_trace_file(path, shared=False):
+    """
+    Lock the trace file for writing (exclusive) or for opening a consistent snapshot (shared)
+
+    Returns:
+        int: Descriptor of the lock file, closing it releases the lock
+    """
+    fd = os.open(path + '.lock', os.O_WRONLY | os.O_CREAT, 0o644)
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+    return fd
+
+
+def read_index(index_path):
+    """
+    Read the sparse block index of a segment
+
+    Returns:
+        list: Blocks (offset, length, start, end, count, types) in file order,
+        or None when the segment has no index
+    """
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            blocks = []
+            for line in f:
+                try:
+                    blocks.append(json.loads(line))
+                except ValueError:
+                    continue
+            return blocks
+    except FileNotFoundError:
+        return None
+
+
+def list_segments(path):
+    """
+    List the segments of a trace file, oldest first
+
+    Closed segments (``<path>.<rotation time>.<pid>``, gzip compressed once
+    the writer has processed them) come before the active segment.
+    """
+    closed = {}
+    for segment in glob.glob(glob.escape(path) + '.*'):
+        if segment.endswith(('.idx', '.lock', '.tmp')):
+            continue
+        name = segment[:-3] if segment.endswith('.gz') else segment
+        # A compressed segment replaces its uncompressed original
+        if segment.endswith('.gz') or name not in closed:
+            closed[name] = segment
+    return [closed[name] for name in sorted(closed)] + [path]
+
+
+def to_timestamp(value):
+    """Convert a datetime, ISO 8601 string or number to a POSIX timestamp"""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            value = datetime.fromisoformat(value)
+    return value.timestamp()
+
+
+class TraceQuery:
+    """
+    Filter over execution trace records
+
+    Time range and event types are first checked against the block index,
+    then against the raw JSON line, and only candidate lines are parsed.
+
+    Args:
+        types (iterable, optional): Keep traces containing one of these event types
+        start, end (optional): Keep traces started in this range (datetime, ISO string or timestamp)
+        trace_id (str, optional): Keep only this trace
+        min_duration (float, optional): Keep traces that took at least this many seconds
+    """
+
+    def __init__(self, types=None, start=None, end=None, trace_id=None, min_duration=None):
+        self.types = set(types) if types else None
+        self.start = to_timestamp(start)
+        self.end = to_timestamp(end)
+        self.trace_id = trace_id
+        self.min_duration = min_duration
+        self._needles = None
+        if self.types:
+            self._needles = [f'"type":{json.dumps(t)}'.encode('utf-8') for t in self.types]
+        self._trace_needle = f'"trace_id":{json.dumps(trace_id)}'.encode('utf-8') if trace_id else None
+
+    def match_range(self, first, last):
+        """Check whether records started between first and last can match"""
+        if self.start is not None and last is not None and last < self.start:
+            return False
+        if self.end is not None and first is not None and first > self.end:
+            return False
+        return True
+
+    def match_block(self, block):
+        if not self.match_range(block.get('start'), block.get('end')):
+            return False
+        return not self.types or not self.types.isdisjoint(block.get('types', ()))
+
+    def match_line(self, line):
+        """Cheap check on the raw line, before it is parsed"""
+        if self._trace_needle and self._trace_needle not in line:
+            return False
+        return not self._needles or any(needle in line for needle in self._needles)
+
+    def match(self, trace):
+        if self.trace_id and trace.get('trace_id') != self.trace_id:
+            return False
+        started_at = trace.get('started_at')
+        if (self.start is not None or self.end is not None) and started_at is None:
+            return False
+        if self.start is not None and started_at < self.start:
+            return False
+        if self.end is not None and started_at > self.end:
+            return False
+        if self.min_duration is not None and (trace.get('duration') or 0) < self.min_duration:
+            return False
+        if self.types and not any(e.get('type') in self.types for e in trace.get('events', ())):
+            return False
+        return True
+
+
+def _segment_lines(segment, query, descending, active, logger=None):
+    """Yield the candidate raw lines of one segment"""
+    compressed = segment.endswith('.gz')
+    lock_fd = lock_trace_file(segment, shared=True) if active else None
+    try:
+        # Data and index are opened together, so a concurrent rotation cannot split them
+        try:
+            f = open(segment, 'rb')
+        except FileNotFoundError:
+            return
+        blocks = read_index(segment + '.idx')
+    finally:
+        if lock_fd is not None:
+            os.close(lock_fd)
+
+    with f:
+        if blocks is None:
+            # Segment written without an index: scan it as a whole
+            lines = gzip.GzipFile(fileobj=f) if compressed else f
+            if not compressed and not _is_jsonl(f):
+                if logger:
+                    logger.warning(f"Skipping trace file {segment}: not one JSON record per line "
+                                   f"(pretty-printed log of an older version?)")
+                return
+            if descending:
+                lines = reversed(list(lines))
+            for line in lines:
+                if query.match_line(line):
+                    yield line
+            return
+
+        if blocks and not query.match_range(min(b['start'] for b in blocks), max(b['end'] for b in blocks)):
+            return
+        for block in reversed(blocks) if descending else blocks:
+            if not query.match_block(block):
+                continue
+            f.seek(block['offset'])
+            data = f.read(block['length'])
+            if compressed:
+                data = gzip.decompress(data)
+            lines = data.splitlines()
+            for line in reversed(lines) if descending else lines:
+                if query.match_line(line):
+                    yield line
+
+
+def _is_jsonl(f):
+    """Check that the first line of a file is a whole JSON object, leaving the file at its start"""
+    first = f.readline()
+    f.seek(0)
+    if not first.strip():
+        return True
+    try:
+        return isinstance(json.loads(first), dict)
+    except ValueError:
+        return False
+
+
+def iter_traces(path, query=None, limit=None, offset=0, descending=False, logger=None):
+    """
+    Stream the trace records of a trace file matching a query
+
+    Args:
+        path (str): Active trace file, its closed segments are found next to it
+        query (TraceQuery, optional): Filter, defaults to all records
+        limit (int, optional): Maximum number of records
+        offset (int): Matching records to skip
+        descending (bool): Newest segments and blocks first
+        logger (logging.Logger, optional): Warned about segments and lines that can't be read
+
+    Yields:
+        dict: Trace records
+    """
+    query = query or TraceQuery()
+    if limit is not None and limit <= 0:
+        return
+    segments = list_segments(path)
+    if descending:
+        segments.reverse()
+
+    skipped = returned = 0
+    for segment in segments:
+        invalid = 0
+        for line in _segment_lines(segment, query, descending, segment == path, logger):
+            try:
+                trace = json.loads(line)
+            except ValueError:
+                invalid += 1
+                continue
+            if not query.match(trace):
+                continue
+            if skipped < offset:
+                skipped += 1
+                continue
+            yield trace
+            returned += 1
+            if limit is not None and returned >= limit:
+                return
+        if invalid and logger:
+            logger.warning(f"Skipped {invalid} unreadable lines of trace file {segment}")
@@ -0,0 +1,139 @@
+import functools
+import inspect
+import logging
+import re
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from prometheus_client import Counter, Histogram
+from .metrics import LabelCache
+
+STAGE_DURATION = Histogram(
+    'chat_stage_duration_seconds',
+    'Duration of chat pipeline stages in seconds',
+    ['stage'],
+    buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30)
+)
+FILES_SCANNED = Counter(
+    'chat_files_scanned_total',
+    'Files listed from the file index for chat requests',
+    ['source']
+)
+PROMPT_TOKENS = Counter(
+    'llm_prompt_tokens_total',
+    'Prompt tokens sent to the model',
+    ['model']
+)
+
+_stage_duration = LabelCache(STAGE_DURATION)
+
+# W3C trace context: version-trace_id-parent_id-flags
+_TRACEPARENT = re.compile(r'^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$')
+
+_trace = ContextVar('trace_context', default=None)
+_span = ContextVar('trace_span', default=None)
+
+
+class TraceContext:
+    """Trace of one request: its id, the caller's span id and the timed stages"""
+
+    def __init__(self, trace_id=None, parent_id=None):
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.parent_id = parent_id
+        self.started_at = time.perf_counter()
+        self.spans = []
+
+
+def start_trace(traceparent=None, trace_id=None):
+    """
+    Start the trace of a request in the current execution context
+
+    Args:
+        traceparent (str, optional): W3C ``traceparent`` header of the caller
+        trace_id (str, optional): Trace id to use when there is no traceparent,
+            e.g. an ``X-Request-ID`` header
+
+    Returns:
+        Token: Pass to end_trace to restore the previous trace
+    """
+    parent_id = None
+    match = _TRACEPARENT.match((traceparent or '').strip().lower())
+    if match:
+        trace_id, parent_id = match.groups()
+    elif trace_id:
+        trace_id = re.sub(r'[^\w.-]', '', trace_id)[:64] or None
+    return _trace.set(TraceContext(trace_id, parent_id))
+
+
+def end_trace(token):
+    _trace.reset(token)
+
+
+def current_trace():
+    """Get the trace of the current request, or None"""
+    return _trace.get()
+
+
+@contextmanager
+def span(stage):
+    """
+    Time a pipeline stage
+
+    The duration is observed in the ``chat_stage_duration_seconds``
+    histogram and, inside a trace, recorded with its offset from the start
+    of the request. Log records emitted in the stage carry its name.
+    """
+    token = _span.set(stage)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _span.reset(token)
+        observe_stage(stage, start)
+
+
+def observe_stage(stage, start, end=None):
+    """
+    Record a stage timed by hand between two ``time.perf_counter()`` values
+
+    Used where a ``with span()`` block cannot enclose the work, e.g. a
+    stage spread over the iterations of a streaming generator.
+    """
+    duration = (time.perf_counter() if end is None else end) - start
+    _stage_duration(stage).observe(duration)
+    trace = _trace.get()
+    if trace is not None:
+        trace.spans.append({
+            'stage': stage,
+            'offset': round(start - trace.started_at, 6),
+            'duration': round(duration, 6)
+        })
+
+
+def traced(stage):
+    """Decorator timing every call of a function (or coroutine function) as a stage"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TraceContextFilter(logging.Filter):
+    """Add the trace_id and span of the current request to log records"""
+
+    def filter(self, record):
+        trace = _trace.get()
+        record.trace_id = trace.trace_id if trace is not None else None
+        record.span = _span.get()
+        return True
@@ -1,4 +1,4 @@
-from interface.app import app
-
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5001) 
\ No newline at end of file
+    # Imported here: content extraction workers import this module, they must not create the application
+    from interface.app import app
+    app.run(debug=True, host='0.0.0.0', port=5001)
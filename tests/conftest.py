@@ -0,0 +1,76 @@
+import os
+import pytest
+
+
+def write_file(path, content=b'data'):
+    """Create a file and its parent directories"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+    return str(path)
+
+
+def touch_dir(path):
+    """
+    Move a directory's mtime forward
+
+    Changes made in quick succession can leave a directory with the same
+    mtime, which the catalog would take for an unchanged directory.
+    """
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+@pytest.fixture
+def white_dir(tmp_path):
+    """White list directory with a few documents, a hidden file and a hidden directory"""
+    root = tmp_path / 'files'
+    write_file(root / 'q3_report.pdf', b'%PDF-1.4 quarterly report')
+    write_file(root / 'notes.txt', b'meeting notes\n')
+    write_file(root / 'reports' / 'annual_report.pdf', b'%PDF-1.4 annual report')
+    write_file(root / 'reports' / 'budget.xlsx', b'PK budget')
+    write_file(root / '.env', b'SECRET=1\n')
+    write_file(root / '.ssh' / 'id_rsa', b'private key\n')
+    return str(root)
+
+
+@pytest.fixture(scope='session')
+def app(tmp_path_factory):
+    """Application created once per session; tests point it at their own directories with ``services``"""
+    log_dir = str(tmp_path_factory.mktemp('logs'))
+    os.environ['LOG_DIR'] = log_dir
+    from interface.app import create_app
+
+    app = create_app()
+    app.config.update({
+        'TESTING': True,
+        'LOG_DIR': log_dir,
+        'OPENAI_ENABLED': False,
+        'WATCHER_ENABLED': False,
+        'EMBEDDING_ENABLED': False,
+        'CONTENT_INDEX_ENABLED': False,
+        'WHITE_FILE_TYPES': {'document': ['pdf', 'txt'], 'data': ['xlsx']},
+        'WALKER_EXCLUDE': []
+    })
+    return app
+
+
+@pytest.fixture
+def services(app, white_dir, tmp_path):
+    """Services rebuilt for the test's white list directory and a fresh catalog"""
+    from AutoFileManagement.AutoFileOpening.services.container import get_services
+
+    app.config.update({
+        'WHITE_DIRECTORIES': [white_dir],
+        'CATALOG_ENABLED': True,
+        'CATALOG_PATH': str(tmp_path / 'file_catalog.db'),
+        'CATALOG_REFRESH_INTERVAL': 0
+    })
+    services = get_services(app)
+    services.reload(reload_config=False)
+    return services
+
+
+@pytest.fixture
+def client(app, services):
+    return app.test_client()
@@ -0,0 +1,117 @@
+import os
+import time
+from .conftest import touch_dir, write_file
+
+ALL_FILES = ['notes.txt', 'q3_report.pdf', 'reports/annual_report.pdf', 'reports/budget.xlsx']
+
+
+def list_all(client, **params):
+    """Follow next_cursor from the first page to the last"""
+    pages = []
+    cursor = None
+    while True:
+        query = dict(params, cursor=cursor) if cursor else params
+        response = client.get('/api/files', query_string=query)
+        assert response.status_code == 200
+        pages.append(response.get_json())
+        cursor = pages[-1]['next_cursor']
+        if cursor is None:
+            return pages
+
+
+def test_pages_follow_the_cursor(client, white_dir):
+    pages = list_all(client, limit=3)
+
+    assert [len(page['files']['path']) for page in pages] == [3, 1]
+    assert [path for page in pages for path in page['files']['path']] == ALL_FILES
+    assert pages[0]['roots'] == [white_dir]
+    assert pages[0]['files']['type'] == ['txt', 'pdf', 'pdf']
+
+
+def test_later_pages_keep_the_first_page_version(client, white_dir):
+    first = client.get('/api/files', query_string={'limit': 2}).get_json()
+    write_file(os.path.join(white_dir, 'added.txt'))
+    touch_dir(white_dir)
+    second = client.get('/api/files', query_string={'limit': 2, 'cursor': first['next_cursor']}).get_json()
+
+    assert second['version'] == first['version']
+    changes = client.get('/api/files', query_string={'since': first['version']}).get_json()
+    assert changes['delta'] and changes['files']['path'] == ['added.txt']
+
+
+def test_etag_and_not_modified(client, white_dir):
+    response = client.get('/api/files')
+    etag = response.headers['ETag']
+    version = response.get_json()['version']
+
+    assert etag == f'W/"files-{version}"'
+    assert client.get('/api/files', headers={'If-None-Match': etag}).status_code == 304
+
+    write_file(os.path.join(white_dir, 'added.txt'))
+    touch_dir(white_dir)
+    response = client.get('/api/files', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] == f'W/"files-{version + 1}"'
+
+
+def test_changes_since_version(client, white_dir):
+    version = client.get('/api/files').get_json()['version']
+    os.remove(os.path.join(white_dir, 'notes.txt'))
+    write_file(os.path.join(white_dir, 'reports', 'forecast.xlsx'))
+    touch_dir(white_dir)
+    touch_dir(os.path.join(white_dir, 'reports'))
+
+    page = client.get('/api/files', query_string={'since': version}).get_json()
+    assert page['delta'] and not page['reset']
+    assert page['files']['path'] == ['reports/forecast.xlsx']
+    assert page['removed'] == {'root': [0], 'path': ['notes.txt']}
+
+
+def test_unknown_version_resets_to_full_listing(client):
+    page = client.get('/api/files', query_string={'since': 999}).get_json()
+
+    assert page['reset'] and not page['delta']
+    assert page['files']['path'] == ALL_FILES
+
+
+def test_filters_and_invalid_cursor(client, white_dir):
+    page = client.get('/api/files', query_string={'type': 'data'}).get_json()
+    assert page['files']['path'] == ['reports/budget.xlsx']
+
+    response = client.get('/api/files', query_string={'cursor': 'not-a-cursor'})
+    assert response.status_code == 400
+
+
+def test_content_etag_without_catalog(app, client):
+    from AutoFileManagement.AutoFileOpening.services.container import get_services
+    app.config['CATALOG_ENABLED'] = False
+    get_services(app).reload(reload_config=False)
+
+    response = client.get('/api/files', query_string={'limit': 3})
+    page = response.get_json()
+    assert page['version'] is None
+    assert [path for page in list_all(client, limit=3) for path in page['files']['path']] == ALL_FILES
+    assert client.get('/api/files', query_string={'limit': 3},
+                      headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+
+def test_watcher_backed_version_refreshes_after_changes(app, services, white_dir, monkeypatch):
+    monkeypatch.setitem(app.config, 'WATCHER_ENABLED', True)
+    services.reload(reload_config=False)
+    file_service = services.file_service
+    assert file_service.watcher.ready.wait(5)
+    version = file_service.get_listing_version()
+
+    refreshes = []
+    refresh = file_service.catalog.refresh
+    monkeypatch.setattr(file_service.catalog, 'refresh', lambda *a, **k: refreshes.append(a) or refresh(*a, **k))
+    assert file_service.get_listing_version() == version
+    assert refreshes == []
+
+    watch_version = file_service.watcher.index.version
+    write_file(os.path.join(white_dir, 'minutes.txt'))
+    deadline = time.monotonic() + 5
+    while file_service.watcher.index.version == watch_version and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert file_service.get_listing_version() == version + 1
+    assert len(refreshes) == 1
@@ -0,0 +1,77 @@
+import time
+from AutoFileManagement.AutoFileOpening.services.cache import ResponseCache, make_key, normalize_query
+
+FILES = [{'path': '/data/a.pdf', 'size': 10, 'mtime': 1.0}, {'path': '/data/b.txt', 'size': 20, 'mtime': 2.0}]
+
+
+def test_normalize_query():
+    assert normalize_query('  Open the Q3 report, please!! ') == 'open the q3 report please'
+    assert normalize_query('report.pdf.') == 'report.pdf'
+
+
+def test_key_covers_query_files_and_model():
+    key = make_key('Open the report', FILES, 'gpt-4o-mini', 0.0)
+
+    assert make_key('open the report!', list(reversed(FILES)), 'gpt-4o-mini', 0.0) == key
+    assert make_key('open the budget', FILES, 'gpt-4o-mini', 0.0) != key
+    assert make_key('open the report', [dict(FILES[0], mtime=3.0), FILES[1]], 'gpt-4o-mini', 0.0) != key
+    assert make_key('open the report', FILES, 'gpt-4o', 0.0) != key
+    assert make_key('open the report', FILES, 'gpt-4o-mini', 0.7) != key
+
+
+def test_memory_lru():
+    cache = ResponseCache(max_entries=2)
+    cache.set('a', 'A')
+    cache.set('b', 'B')
+    cache.get('a')
+    cache.set('c', 'C')
+
+    assert cache.get('a') == 'A'
+    assert cache.get('b') is None
+    assert cache.get('c') == 'C'
+
+
+def test_entries_expire():
+    cache = ResponseCache(ttl=0.05)
+    cache.set('a', 'A')
+    time.sleep(0.1)
+
+    assert cache.get('a') is None
+
+
+def test_version_change_invalidates_memory():
+    cache = ResponseCache()
+    cache.set('a', 'A', version=1)
+
+    assert cache.get('a', version=1) == 'A'
+    assert cache.get('a', version=2) is None
+    assert cache.get('a', version=1) is None
+
+
+def test_disk_tier_is_shared(tmp_path):
+    path = str(tmp_path / 'responses.db')
+    ResponseCache(disk_path=path).set('a', 'A', version=3)
+    other = ResponseCache(disk_path=path)
+
+    assert other.get('a', version=3) == 'A'
+    # Promoted to the memory tier of the reading worker
+    assert other._entries['a'][0] == 'A'
+
+
+def test_disk_entries_of_another_version_are_discarded(tmp_path):
+    path = str(tmp_path / 'responses.db')
+    ResponseCache(disk_path=path).set('a', 'A', version=3)
+    other = ResponseCache(disk_path=path)
+
+    assert other.get('a', version=4) is None
+    assert ResponseCache(disk_path=path).get('a', version=3) is None
+
+
+def test_disk_tier_is_bounded(tmp_path):
+    path = str(tmp_path / 'responses.db')
+    cache = ResponseCache(disk_path=path, disk_max_entries=2)
+    for key in 'abc':
+        cache.set(key, key.upper())
+        time.sleep(0.01)
+
+    assert cache._connect().execute('SELECT key FROM responses ORDER BY key').fetchall() == [('b',), ('c',)]
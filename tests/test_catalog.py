@@ -0,0 +1,104 @@
+import os
+import shutil
+from AutoFileManagement.AutoFileOpening.services.catalog import FileCatalog
+from .conftest import touch_dir, write_file
+
+
+def make_catalog(tmp_path, refresh_interval=0):
+    return FileCatalog(str(tmp_path / 'catalog.db'), refresh_interval)
+
+
+def names(files):
+    return sorted(f['name'] for f in files)
+
+
+def test_refresh_lists_visible_files(tmp_path, white_dir):
+    catalog = make_catalog(tmp_path)
+
+    assert catalog.refresh([white_dir]) > 0
+    assert names(catalog.get_files([white_dir])) == ['annual_report.pdf', 'budget.xlsx', 'notes.txt', 'q3_report.pdf']
+    assert names(catalog.get_files([white_dir], extensions=['pdf'])) == ['annual_report.pdf', 'q3_report.pdf']
+    assert catalog.count_files([white_dir], extensions=['pdf']) == 2
+    assert catalog.version() == 1
+
+
+def test_unchanged_tree_keeps_version(tmp_path, white_dir):
+    catalog = make_catalog(tmp_path)
+    catalog.refresh([white_dir])
+
+    assert catalog.refresh([white_dir]) == 0
+    assert catalog.version() == 1
+
+
+def test_refresh_interval(tmp_path, white_dir):
+    catalog = make_catalog(tmp_path, refresh_interval=3600)
+    catalog.refresh([white_dir])
+    write_file(os.path.join(white_dir, 'new.txt'))
+    touch_dir(white_dir)
+
+    assert catalog.refresh([white_dir]) == 0
+    assert 'new.txt' not in names(catalog.get_files([white_dir]))
+    assert catalog.refresh([white_dir], force=True) == 1
+    assert 'new.txt' in names(catalog.get_files([white_dir]))
+
+
+def test_removed_files_and_directories(tmp_path, white_dir):
+    catalog = make_catalog(tmp_path)
+    catalog.refresh([white_dir])
+
+    os.remove(os.path.join(white_dir, 'notes.txt'))
+    shutil.rmtree(os.path.join(white_dir, 'reports'))
+    touch_dir(white_dir)
+    catalog.refresh([white_dir])
+
+    assert names(catalog.get_files([white_dir])) == ['q3_report.pdf']
+    assert catalog.version() == 2
+
+
+def test_changes_since_version(tmp_path, white_dir):
+    catalog = make_catalog(tmp_path)
+    catalog.refresh([white_dir])
+    since = catalog.version()
+
+    os.remove(os.path.join(white_dir, 'notes.txt'))
+    added = write_file(os.path.join(white_dir, 'minutes.txt'))
+    touch_dir(white_dir)
+    catalog.refresh([white_dir])
+
+    assert catalog.version() == since + 1
+    assert [row[1] for row in catalog.list_files([white_dir], since=since)] == [added]
+    assert catalog.removed_since([white_dir], since) == [(0, os.path.join(white_dir, 'notes.txt'))]
+    assert catalog.removed_since([white_dir], catalog.version()) == []
+
+
+def test_removed_directory_leaves_tombstones(tmp_path, white_dir):
+    catalog = make_catalog(tmp_path)
+    catalog.refresh([white_dir])
+    since = catalog.version()
+
+    shutil.rmtree(os.path.join(white_dir, 'reports'))
+    touch_dir(white_dir)
+    catalog.refresh([white_dir])
+
+    assert names(catalog.get_files([white_dir])) == ['notes.txt', 'q3_report.pdf']
+    assert [path for _, path in catalog.removed_since([white_dir], since)] == [
+        os.path.join(white_dir, 'reports', 'annual_report.pdf'),
+        os.path.join(white_dir, 'reports', 'budget.xlsx')
+    ]
+
+
+def test_old_tombstones_are_pruned(tmp_path, white_dir):
+    catalog = make_catalog(tmp_path)
+    catalog.TOMBSTONE_VERSIONS = 2
+    catalog.refresh([white_dir])
+    os.remove(os.path.join(white_dir, 'notes.txt'))
+    touch_dir(white_dir)
+    catalog.refresh([white_dir])
+    for i in range(3):
+        write_file(os.path.join(white_dir, f'file{i}.txt'))
+        touch_dir(white_dir)
+        catalog.refresh([white_dir])
+
+    assert catalog.version() == 5
+    assert catalog.delta_floor() == 3
+    assert catalog.removed_since([white_dir], 0) == []
@@ -0,0 +1,55 @@
+import asyncio
+import json
+from AutoFileManagement.AutoFileOpening.services.openai_client import PROMPT_TOO_LONG
+
+
+def chat(client, message):
+    response = client.post('/api/chat', json={'message': message})
+    assert response.status_code == 200
+    return response.get_json()['response']
+
+
+def test_model_is_not_asked_without_files_in_budget(app, services, client, monkeypatch):
+    assert chat(client, 'open the q3 report') != PROMPT_TOO_LONG
+
+    monkeypatch.setitem(app.config, 'MAX_PROMPT_TOKENS', 50)
+    services.reload(reload_config=False)
+    assert chat(app.test_client(), 'open the q3 report') == PROMPT_TOO_LONG
+
+
+def test_reload_closes_the_async_client(services, monkeypatch):
+    client = services.chat_service.client
+    monkeypatch.setattr(client, 'api_key', 'test-key')
+    monkeypatch.setattr(client.policy, 'timeout', 0)
+
+    async def main():
+        async_client = client._get_async_client()
+        assert client._get_async_client() is async_client
+        services.reload(reload_config=False)
+        await asyncio.sleep(0.05)
+        return async_client
+
+    assert asyncio.run(main()).is_closed()
+
+
+def stream_events(client, message):
+    response = client.post('/api/chat/stream', json={'message': message})
+    assert response.status_code == 200
+    events = []
+    for frame in response.get_data(as_text=True).strip().split('\n\n'):
+        event, data = frame.split('\n', 1)
+        events.append((event[len('event: '):], json.loads(data[len('data: '):])))
+    return events
+
+
+def test_stream_failure_is_an_error_event(services, client, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError('model unavailable')
+        yield
+
+    monkeypatch.setattr(services.chat_service.client, 'stream_chat_completion', fail)
+
+    events = stream_events(client, 'open the q3 report')
+    assert [event for event, _ in events] == ['status', 'status', 'error', 'result']
+    assert events[2][1] == {'error': 'model unavailable'}
+    assert events[3][1]['response'] == "Sorry, I encountered an error processing your command."
@@ -0,0 +1,163 @@
+import asyncio
+import multiprocessing
+import threading
+import time
+import pytest
+from AutoFileManagement.AutoFileOpening.services import coalesce
+from AutoFileManagement.AutoFileOpening.services.coalesce import SingleFlight
+
+
+def run_threads(targets):
+    threads = [threading.Thread(target=target) for target in targets]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def test_followers_share_the_leader_result():
+    flight = SingleFlight('test')
+    started, release = threading.Event(), threading.Event()
+    calls, results = [], []
+
+    def work():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {'answer': 42}
+
+    threads = run_threads([lambda: results.append(flight.do('key', work))])
+    started.wait(5)
+    threads += run_threads([lambda: results.append(flight.do('key', work)) for _ in range(4)])
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert len(results) == 5 and all(result is results[0] for result in results)
+    # Nothing is cached once the leader is done
+    assert flight.do('key', lambda: 'again') == 'again'
+
+
+def test_followers_get_the_leader_error():
+    flight = SingleFlight('test')
+    started, release = threading.Event(), threading.Event()
+    errors = []
+
+    def fail():
+        started.set()
+        release.wait(5)
+        raise RuntimeError('model unavailable')
+
+    def call():
+        try:
+            flight.do('key', fail)
+        except RuntimeError as e:
+            errors.append(e)
+
+    threads = run_threads([call])
+    started.wait(5)
+    threads += run_threads([call, call])
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(errors) == 3 and errors[1] is errors[0] and errors[2] is errors[0]
+    assert flight._calls == {}
+
+
+def test_different_keys_run_concurrently():
+    flight = SingleFlight('test')
+    barrier = threading.Barrier(2, timeout=5)
+    results = []
+    threads = run_threads([lambda k=k: results.append(flight.do(k, lambda: barrier.wait() is not None))
+                           for k in ('a', 'b')])
+    for thread in threads:
+        thread.join(5)
+
+    assert results == [True, True]
+
+
+def test_async_followers_share_the_leader_task():
+    flight = SingleFlight('test')
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return 'result'
+
+    async def main():
+        return await asyncio.gather(*(flight.do_async('key', work) for _ in range(3)))
+
+    assert asyncio.run(main()) == ['result'] * 3
+    assert len(calls) == 1
+    assert flight._async_calls == {}
+
+
+@pytest.fixture
+def one_slot(monkeypatch):
+    """Hash every key onto the same lock slot"""
+    monkeypatch.setattr(coalesce, 'LOCK_SLOTS', 1)
+
+
+def test_threads_sharing_a_slot_are_serialized(tmp_path, one_slot):
+    flight = SingleFlight('test', str(tmp_path / 'coalesce.lock'), wait_timeout=5)
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def work():
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+
+    threads = run_threads([lambda k=k: flight.do(k, work) for k in 'abcd'])
+    for thread in threads:
+        thread.join(5)
+
+    assert peak[0] == 1
+    assert not flight._slot_lock(0).locked()
+
+
+def test_slot_wait_times_out(tmp_path, one_slot):
+    flight = SingleFlight('test', str(tmp_path / 'coalesce.lock'), wait_timeout=0.1)
+    started, release = threading.Event(), threading.Event()
+    threads = run_threads([lambda: flight.do('a', lambda: (started.set(), release.wait(5)))])
+    started.wait(5)
+
+    begin = time.monotonic()
+    assert flight.do('b', lambda: 'done anyway') == 'done anyway'
+    assert time.monotonic() - begin < 2
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert not flight._slot_lock(0).locked()
+
+
+def _hold_slot(lock_path, held, release):
+    flight = SingleFlight('test', lock_path, wait_timeout=5)
+    flight.do('key', lambda: (held.set(), release.wait(5)))
+
+
+@pytest.mark.skipif(coalesce.fcntl is None or 'fork' not in multiprocessing.get_all_start_methods(),
+                    reason='needs fcntl and fork')
+def test_other_processes_wait_for_the_slot(tmp_path):
+    lock_path = str(tmp_path / 'coalesce.lock')
+    context = multiprocessing.get_context('fork')
+    held, release = context.Event(), context.Event()
+    process = context.Process(target=_hold_slot, args=(lock_path, held, release))
+    process.start()
+    try:
+        assert held.wait(5)
+        flight = SingleFlight('test', lock_path, wait_timeout=5)
+        threading.Timer(0.2, release.set).start()
+        begin = time.monotonic()
+        flight.do('key', lambda: None)
+        assert time.monotonic() - begin >= 0.15
+    finally:
+        release.set()
+        process.join(5)
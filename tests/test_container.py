@@ -0,0 +1,17 @@
+import pytest
+
+
+def test_failed_reload_keeps_config_and_services(app, services, monkeypatch):
+    config = dict(app.config)
+    command_service = services.command_service
+
+    def fail():
+        raise RuntimeError('bad configuration')
+
+    monkeypatch.setenv('SECRET_KEY', 'changed')
+    monkeypatch.setattr(services, '_build', fail)
+    with pytest.raises(RuntimeError):
+        services.reload()
+
+    assert dict(app.config) == config
+    assert services.command_service is command_service
@@ -0,0 +1,63 @@
+import os
+from AutoFileManagement.AutoFileOpening.services import content
+from AutoFileManagement.AutoFileOpening.services.content import ContentIndex, extract_terms
+from .conftest import write_file
+
+
+def record(path, root):
+    st = os.stat(path)
+    name = os.path.basename(path)
+    return {
+        'name': name,
+        'path': path,
+        'type': name.rsplit('.', 1)[-1],
+        'size': st.st_size,
+        'mtime': st.st_mtime,
+        'directory': root
+    }
+
+
+def make_index(tmp_path):
+    return ContentIndex(str(tmp_path / 'content.db'), workers=0)
+
+
+def test_extract_terms_across_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(content, 'READ_CHUNK', 4)
+    path = write_file(tmp_path / 'a.txt', b'invoice overdue invoice')
+
+    assert extract_terms(path, 'txt', 1024) == (path, {'invoice': 2, 'overdue': 1}, 3)
+    assert extract_terms(path, 'txt', 7) == (path, {'invoice': 1}, 1)
+    assert extract_terms(str(tmp_path / 'missing.txt'), 'txt', 1024)[1] is None
+
+
+def test_search_ranks_by_bm25(tmp_path):
+    root = str(tmp_path)
+    files = [
+        write_file(tmp_path / 'short.txt', b'quarterly invoice'),
+        write_file(tmp_path / 'long.txt', b'invoice ' + b'padding words ' * 20),
+        write_file(tmp_path / 'other.txt', b'holiday plans'),
+        write_file(tmp_path / 'image.png', b'invoice')
+    ]
+    index = make_index(tmp_path)
+    index.sync([record(path, root) for path in files])
+
+    results = index.search('the invoice')
+    assert [f['name'] for _, f in results] == ['short.txt', 'long.txt']
+    assert results[0][0] > results[1][0]
+    assert index.search('invoice', roots=['/elsewhere']) == []
+    assert index.search('the') == []
+
+
+def test_sync_reindexes_changed_and_drops_removed_files(tmp_path):
+    root = str(tmp_path)
+    first = write_file(tmp_path / 'a.txt', b'draft contract')
+    second = write_file(tmp_path / 'b.txt', b'contract signed')
+    index = make_index(tmp_path)
+    index.sync([record(first, root), record(second, root)])
+
+    write_file(first, b'final agreement text')
+    os.utime(first, (1, 1))
+    index.sync([record(first, root)])
+
+    assert index.search('contract') == []
+    assert [f['name'] for _, f in index.search('agreement')] == ['a.txt']
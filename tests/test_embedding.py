@@ -0,0 +1,49 @@
+import json
+import os
+import time
+from AutoFileManagement.AutoFileOpening.services.embedding import EmbeddingIndex, HashingEmbedder
+
+
+def record(directory, name, size=1):
+    return {'name': name, 'path': os.path.join(directory, name), 'type': name.rsplit('.', 1)[1],
+            'size': size, 'mtime': 1.0, 'directory': directory}
+
+
+def make_index(tmp_path):
+    return EmbeddingIndex(str(tmp_path / 'embeddings'), HashingEmbedder(64))
+
+
+def test_saved_index_is_shared(tmp_path):
+    index = make_index(tmp_path)
+    index.sync([record('/data', 'budget_2024.xlsx'), record('/data', 'meeting_notes.txt')])
+    index.save()
+
+    reloaded = make_index(tmp_path)
+    assert [r['name'] for r in reloaded._records] == ['budget_2024.xlsx', 'meeting_notes.txt']
+    assert reloaded.query('budget', limit=1)[0][1]['name'] == 'budget_2024.xlsx'
+
+
+def test_file_list_is_paired_with_its_own_matrix(tmp_path):
+    index = make_index(tmp_path)
+    index.sync([record('/data', 'budget_2024.xlsx')])
+    index.save()
+    first = json.load(open(tmp_path / 'embeddings' / 'files.json'))
+    index.sync([record('/data', 'budget_2024.xlsx'), record('/data', 'meeting_notes.txt')])
+    index.save()
+
+    second = json.load(open(tmp_path / 'embeddings' / 'files.json'))
+    assert second['matrix'] != first['matrix']
+    assert second['shape'] == [2, 64]
+    os.remove(tmp_path / 'embeddings' / second['matrix'])
+    assert make_index(tmp_path)._records == []
+
+
+def test_sync_saves_in_the_background(tmp_path):
+    index = make_index(tmp_path)
+    index.sync([record('/data', 'budget_2024.xlsx')])
+    assert index._thread.name == 'embedding-writer'
+
+    deadline = time.monotonic() + 5
+    while not make_index(tmp_path)._records and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert [r['name'] for r in make_index(tmp_path)._records] == ['budget_2024.xlsx']
@@ -0,0 +1,82 @@
+import os
+import pytest
+from .conftest import write_file
+
+
+def preview(client, path):
+    return client.get('/api/preview', query_string={'path': path})
+
+
+def test_listed_file(client, white_dir):
+    response = preview(client, os.path.join(white_dir, 'notes.txt'))
+
+    assert response.status_code == 200
+    page = response.get_json()
+    assert (page['kind'], page['text'], page['truncated']) == ('text', 'meeting notes\n', False)
+    assert preview(client, os.path.join(white_dir, 'reports', 'annual_report.pdf')).status_code == 200
+
+
+def test_unchanged_file_is_not_modified(client, white_dir):
+    path = os.path.join(white_dir, 'notes.txt')
+    etag = preview(client, path).headers['ETag']
+
+    response = client.get('/api/preview', query_string={'path': path}, headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+
+@pytest.mark.parametrize('relative', [
+    '.env',
+    '.ssh/id_rsa',
+    'reports/../.env',
+    '../outside.txt',
+    '',
+    '.'
+])
+def test_unlisted_paths_are_refused(client, white_dir, relative):
+    write_file(os.path.join(os.path.dirname(white_dir), 'outside.txt'))
+
+    response = preview(client, os.path.join(white_dir, relative))
+    assert response.status_code == 400
+
+
+def test_missing_path_is_refused(client):
+    assert preview(client, '').status_code == 400
+
+
+def test_symlinks_must_stay_listed(client, white_dir, tmp_path):
+    outside = write_file(tmp_path / 'outside.txt')
+    os.symlink(outside, os.path.join(white_dir, 'link_out.txt'))
+    os.symlink(os.path.join(white_dir, '.env'), os.path.join(white_dir, 'link_env.txt'))
+    os.symlink(os.path.join(white_dir, 'notes.txt'), os.path.join(white_dir, 'link_notes.txt'))
+
+    assert preview(client, os.path.join(white_dir, 'link_out.txt')).status_code == 400
+    assert preview(client, os.path.join(white_dir, 'link_env.txt')).status_code == 400
+    assert preview(client, os.path.join(white_dir, 'link_notes.txt')).get_json()['name'] == 'notes.txt'
+
+
+def test_environment_variables_are_not_expanded(client, white_dir, monkeypatch):
+    monkeypatch.setenv('WHITE_DIR', white_dir)
+
+    assert preview(client, '$WHITE_DIR/notes.txt').status_code == 400
+
+
+def test_excluded_components_are_refused(app, services, white_dir, monkeypatch):
+    monkeypatch.setitem(app.config, 'WALKER_EXCLUDE', ['drafts'])
+    services.reload(reload_config=False)
+    path = write_file(os.path.join(white_dir, 'drafts', 'plan.txt'))
+
+    assert preview(app.test_client(), path).status_code == 400
+
+
+def test_missing_file_is_not_found(client, white_dir):
+    assert preview(client, os.path.join(white_dir, 'gone.txt')).status_code == 404
+
+
+def test_content_supports_ranges(client, white_dir):
+    response = client.get('/api/preview/content', query_string={'path': os.path.join(white_dir, 'notes.txt')},
+                          headers={'Range': 'bytes=0-6'})
+
+    assert response.status_code == 206
+    assert response.data == b'meeting'
+    response = client.get('/api/preview/content', query_string={'path': os.path.join(white_dir, '.env')})
+    assert response.status_code == 400
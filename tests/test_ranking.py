@@ -0,0 +1,86 @@
+from AutoFileManagement.AutoFileOpening.services.ranking import CandidateRanker, tokenize
+
+NOW = 1_000_000_000.0
+DAY = 86400
+
+
+def record(path, root='/data', size=100, mtime=NOW - 365 * DAY):
+    name = path.rsplit('/', 1)[-1]
+    return {
+        'name': name,
+        'path': f'{root}/{path}',
+        'type': name.rsplit('.', 1)[-1].lower() if '.' in name else '',
+        'size': size,
+        'mtime': mtime,
+        'directory': root
+    }
+
+
+def make_ranker(files, **options):
+    ranker = CandidateRanker({'image': ['png', 'jpg'], 'document': ['pdf', 'docx']}, **options)
+    ranker.sync(files, version=1)
+    return ranker
+
+
+def ranked(ranker, message, **options):
+    return [f['name'] for f in ranker.rank(message, now=NOW, **options)]
+
+
+FILES = [
+    record('finance/q3_report.pdf'),
+    record('finance/budget_2024.xlsx'),
+    record('photos/holidayBeach.png'),
+    record('travel/holiday_plan.docx'),
+    record('notes.txt', mtime=NOW - DAY),
+    record('readme.md')
+]
+
+
+def test_tokenize():
+    assert tokenize('Q3_Report-final.pdf') == ['q', '3', 'report', 'final', 'pdf']
+    assert tokenize('holidayBeach') == ['holiday', 'beach']
+    assert tokenize('HTMLParser') == ['html', 'parser']
+    assert tokenize('年度报告') == ['年度报告', '年度', '度报', '报告']
+
+
+def test_name_matches_rank_first():
+    ranker = make_ranker(FILES)
+
+    assert ranked(ranker, 'open the q3 report please', limit=1) == ['q3_report.pdf']
+    assert ranked(ranker, 'budget for 2024', limit=1) == ['budget_2024.xlsx']
+
+
+def test_directory_names_are_indexed():
+    ranker = make_ranker(FILES)
+
+    # Same term frequency: the shorter document scores higher
+    assert ranked(ranker, 'something in finance', limit=2) == ['budget_2024.xlsx', 'q3_report.pdf']
+
+
+def test_type_hints_boost_matching_files():
+    ranker = make_ranker(FILES)
+
+    assert ranked(ranker, 'the holiday image', limit=1) == ['holidayBeach.png']
+    assert ranked(ranker, 'the holiday document', limit=1) == ['holiday_plan.docx']
+
+
+def test_unmatched_message_falls_back_to_recent_files():
+    ranker = make_ranker(FILES)
+
+    assert ranked(ranker, 'xyzzy', limit=1) == ['notes.txt']
+
+
+def test_filters():
+    files = FILES + [record('q3_report.pdf', root='/archive', size=10_000)]
+    ranker = make_ranker(files)
+
+    assert [f['directory'] for f in ranker.rank('q3 report', roots=['/archive'], now=NOW)] == ['/archive']
+    assert [f['directory'] for f in ranker.rank('q3 report', max_size=1000, limit=1, now=NOW)] == ['/data']
+
+
+def test_sync_drops_removed_files():
+    ranker = make_ranker(FILES)
+    ranker.sync([f for f in FILES if f['name'] != 'q3_report.pdf'], version=2)
+
+    assert 'q3_report.pdf' not in ranked(ranker, 'q3 report')
+    assert not ranker.refresh(2, lambda: [])
@@ -0,0 +1,216 @@
+import asyncio
+import threading
+import time
+import httpx
+import openai
+import pytest
+from AutoFileManagement.AutoFileOpening.services.resilience import (
+    CallPolicy, DeadlineExceeded, RateLimiter, RetryPolicy, parse_duration, retry_after
+)
+
+REQUEST = httpx.Request('POST', 'http://localhost/v1/chat/completions')
+
+
+def connection_error():
+    return openai.APIConnectionError(request=REQUEST)
+
+
+def status_error(cls, status, headers=None):
+    return cls('error', response=httpx.Response(status, request=REQUEST, headers=headers), body=None)
+
+
+def make_policy(**options):
+    options.setdefault('retry', RetryPolicy(max_retries=3, base_delay=0.001, max_delay=0.01))
+    return CallPolicy(**options)
+
+
+def flaky(errors, result='ok'):
+    """Attempt function raising the given errors in turn, then returning result"""
+    timeouts = []
+
+    def attempt(timeout):
+        timeouts.append(timeout)
+        if len(timeouts) <= len(errors):
+            raise errors[len(timeouts) - 1]
+        return result
+
+    return attempt, timeouts
+
+
+def test_parse_duration():
+    assert parse_duration('1.5') == 1.5
+    assert parse_duration('20ms') == pytest.approx(0.02)
+    assert parse_duration('6m0s') == 360
+    assert parse_duration('soon') is None
+    assert parse_duration(None) is None
+
+
+def test_retry_after_headers():
+    assert retry_after(status_error(openai.RateLimitError, 429, {'retry-after-ms': '250'})) == 0.25
+    assert retry_after(status_error(openai.RateLimitError, 429, {'retry-after': '2'})) == 2
+    assert retry_after(status_error(openai.RateLimitError, 429, {
+        'x-ratelimit-reset-requests': '1s', 'x-ratelimit-reset-tokens': '3s'})) == 3
+    assert retry_after(connection_error()) is None
+
+
+def test_transient_errors_are_retried():
+    attempt, timeouts = flaky([connection_error(), status_error(openai.InternalServerError, 503)])
+
+    assert make_policy().call(attempt) == 'ok'
+    assert len(timeouts) == 3
+
+
+def test_client_errors_are_not_retried():
+    attempt, timeouts = flaky([status_error(openai.BadRequestError, 400)])
+
+    with pytest.raises(openai.BadRequestError):
+        make_policy().call(attempt)
+    assert len(timeouts) == 1
+
+
+def test_retries_are_bounded():
+    attempt, timeouts = flaky([connection_error()] * 10)
+
+    with pytest.raises(openai.APIConnectionError):
+        make_policy(retry=RetryPolicy(max_retries=2, base_delay=0.001)).call(attempt)
+    assert len(timeouts) == 3
+
+
+def test_rate_limit_waits_as_asked():
+    attempt, timeouts = flaky([status_error(openai.RateLimitError, 429, {'retry-after-ms': '100'})])
+
+    begin = time.monotonic()
+    assert make_policy().call(attempt) == 'ok'
+    assert time.monotonic() - begin >= 0.09
+
+
+def test_attempts_share_the_deadline():
+    timeouts = []
+
+    def attempt(timeout):
+        timeouts.append(timeout)
+        time.sleep(0.15)
+        raise connection_error()
+
+    begin = time.monotonic()
+    with pytest.raises((openai.APIConnectionError, DeadlineExceeded)):
+        make_policy(timeout=0.3, request_timeout=10).call(attempt)
+    assert time.monotonic() - begin < 0.6
+    assert timeouts[0] <= 0.3
+    assert all(later < earlier for earlier, later in zip(timeouts, timeouts[1:]))
+
+
+def test_rate_limiter_gives_up_past_the_deadline():
+    limiter = RateLimiter(requests_per_minute=1)
+    limiter.wait(0, time.monotonic() + 1)
+
+    with pytest.raises(DeadlineExceeded):
+        limiter.wait(0, time.monotonic() + 1)
+
+
+def test_concurrency_limit_respects_the_deadline():
+    policy = make_policy(timeout=0.1, max_concurrency=1)
+    started, release = threading.Event(), threading.Event()
+    thread = threading.Thread(target=policy.call, args=(lambda timeout: (started.set(), release.wait(5)),))
+    thread.start()
+    started.wait(5)
+    try:
+        with pytest.raises(DeadlineExceeded):
+            policy.call(lambda timeout: 'never')
+    finally:
+        release.set()
+        thread.join(5)
+
+
+def test_slow_attempt_is_hedged():
+    calls = []
+
+    def attempt(timeout):
+        calls.append(timeout)
+        if len(calls) == 1:
+            time.sleep(0.5)
+            return 'slow'
+        return 'fast'
+
+    begin = time.monotonic()
+    assert make_policy(hedge_after=0.05, request_timeout=5).call(attempt) == 'fast'
+    assert time.monotonic() - begin < 0.4
+    assert calls[1] == pytest.approx(calls[0] - 0.05)
+
+
+def test_fast_attempt_is_not_hedged():
+    attempt, timeouts = flaky([])
+
+    assert make_policy(hedge_after=0.5, request_timeout=5).call(attempt) == 'ok'
+    assert len(timeouts) == 1
+
+
+def slow_then_fast():
+    calls = []
+
+    def attempt(timeout):
+        calls.append(timeout)
+        if len(calls) == 1:
+            time.sleep(0.2)
+            return 'slow'
+        return 'fast'
+
+    return attempt, calls
+
+
+def test_unhedged_calls_wait_for_the_first_attempt():
+    attempt, calls = slow_then_fast()
+
+    assert make_policy(hedge_after=0.05, request_timeout=5).call(attempt, hedge=False) == 'slow'
+    assert len(calls) == 1
+
+
+def test_hedge_needs_rate_limit_room():
+    attempt, calls = slow_then_fast()
+    policy = make_policy(hedge_after=0.05, request_timeout=5, limiter=RateLimiter(requests_per_minute=1))
+
+    assert policy.call(attempt) == 'slow'
+    assert len(calls) == 1
+
+
+def test_retries_are_rate_limited():
+    attempt, timeouts = flaky([connection_error(), connection_error()])
+    policy = make_policy(limiter=RateLimiter(requests_per_minute=10, tokens_per_minute=1000))
+
+    assert policy.call(attempt, tokens=100) == 'ok'
+    assert policy.limiter.requests.tokens == pytest.approx(7, abs=0.1)
+    assert policy.limiter.tokens.tokens == pytest.approx(700, abs=1)
+
+
+def test_async_hedge_cancels_the_loser():
+    cancelled = []
+
+    async def attempt(timeout):
+        if not cancelled:
+            cancelled.append(False)
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled[0] = True
+                raise
+            return 'slow'
+        return 'fast'
+
+    async def main():
+        result = await make_policy(hedge_after=0.05, request_timeout=5).call_async(attempt)
+        await asyncio.sleep(0)
+        return result
+
+    assert asyncio.run(main()) == 'fast'
+    assert cancelled == [True]
+
+
+def test_async_retries():
+    errors = [connection_error()]
+
+    async def attempt(timeout):
+        if errors:
+            raise errors.pop()
+        return 'ok'
+
+    assert asyncio.run(make_policy().call_async(attempt)) == 'ok'
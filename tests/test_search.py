@@ -0,0 +1,101 @@
+from AutoFileManagement.AutoFileOpening.services.search import SearchIndex, SearchQuery, literal_runs
+
+
+def record(name, directory='/data', size=100, mtime=1000.0):
+    return {
+        'name': name,
+        'path': f'{directory}/{name}',
+        'type': name.rsplit('.', 1)[-1].lower(),
+        'size': size,
+        'mtime': mtime,
+        'directory': directory
+    }
+
+
+def make_index(files):
+    index = SearchIndex({'document': ['.pdf', 'txt'], 'data': ['xlsx', 'csv']})
+    index.sync(files, version=1)
+    return index
+
+
+def found(result):
+    return [f['name'] for f in result[1]]
+
+
+FILES = [
+    record('report.pdf', mtime=1000),
+    record('q3_report.pdf', mtime=3000),
+    record('reporting_tool.txt', mtime=2000),
+    record('preport.txt', mtime=4000),
+    record('budget.xlsx', size=5000),
+    record('Annual Report.PDF', directory='/archive', size=20)
+]
+
+
+def test_literal_runs():
+    assert literal_runs('q3*report?.pdf') == ['q3', 'report', '.pdf']
+    assert literal_runs('[abc]def') == ['def']
+    assert literal_runs('[unclosed') == ['[unclosed']
+
+
+def test_query_matching():
+    assert SearchQuery('Report').matches('q3_report.pdf')
+    assert SearchQuery('q3*.pdf').matches('q3_report.pdf')
+    assert not SearchQuery('q3*.txt').matches('q3_report.pdf')
+    assert not SearchQuery('report', whole_name=True).matches('q3_report.pdf')
+    assert SearchQuery('REPORT.PDF', whole_name=True).matches('report.pdf')
+
+
+def test_substring_search_ranking():
+    index = make_index(FILES)
+
+    # Name stem, prefix, word start (earliest first), then inside a word
+    assert index.search('report') == (5, [FILES[0], FILES[2], FILES[1], FILES[5], FILES[3]])
+    assert index.search('zzz') == (0, [])
+
+
+def test_ties_rank_newest_first():
+    index = make_index([record('a_log.txt', mtime=1000), record('b_log.txt', mtime=2000)])
+
+    assert found(index.search('log')) == ['b_log.txt', 'a_log.txt']
+
+
+def test_wildcard_search():
+    index = make_index(FILES)
+
+    assert found(index.search('*.pdf')) == ['report.pdf', 'q3_report.pdf', 'Annual Report.PDF']
+    assert found(index.search('q?_*')) == ['q3_report.pdf']
+    assert found(index.search('report.pdf', whole_name=True)) == ['report.pdf']
+
+
+def test_filters():
+    index = make_index(FILES)
+
+    assert found(index.search('', roots=['/archive'])) == ['Annual Report.PDF']
+    assert found(index.search('', category='data')) == ['budget.xlsx']
+    assert found(index.search('', extensions=['txt'])) == ['preport.txt', 'reporting_tool.txt']
+    assert found(index.search('', min_size=1000)) == ['budget.xlsx']
+    assert found(index.search('report', modified_after=2500)) == ['q3_report.pdf', 'preport.txt']
+
+
+def test_paging():
+    index = make_index(FILES)
+    everything = found(index.search('', limit=None))
+
+    assert len(everything) == len(FILES)
+    total, page = index.search('', offset=2, limit=2)
+    assert total == len(FILES)
+    assert [f['name'] for f in page] == everything[2:4]
+
+
+def test_sync_applies_changes():
+    index = make_index(FILES)
+    changed = [f for f in FILES if f['name'] != 'budget.xlsx'] + [record('forecast.csv')]
+    changed[0] = dict(changed[0], size=999)
+
+    assert index.sync(changed, version=2) == (2, 2)
+    assert found(index.search('budget')) == []
+    assert found(index.search('', category='data')) == ['forecast.csv']
+    assert index.search('report.pdf', whole_name=True)[1][0]['size'] == 999
+    assert not index.refresh(2, lambda: [])
+    assert len(index) == len(FILES)
@@ -0,0 +1,151 @@
+import glob
+import gzip
+import json
+import logging
+import os
+import pytest
+from interface.test_logger import TraceWriter
+from interface.trace_query import TraceQuery, _segment_lines, iter_traces, list_segments, read_index
+
+HOUR = 3600
+BASE = 1_700_000_000 - 1_700_000_000 % HOUR
+
+
+def trace(n, started_at=None, types=('prompt',), duration=1.0):
+    return {
+        'trace_id': f'trace-{n}',
+        'started_at': BASE + n if started_at is None else started_at,
+        'duration': duration,
+        'events': [{'type': t} for t in types]
+    }
+
+
+@pytest.fixture
+def writer(tmp_path):
+    writer = TraceWriter(str(tmp_path / 'test_log.jsonl'), flush_interval=60, block_size=2)
+    yield writer
+    writer.close()
+
+
+def write(writer, traces):
+    for t in traces:
+        writer.write(t, ts=t['started_at'], types=[e['type'] for e in t['events']])
+    writer.flush()
+
+
+def ids(traces):
+    return [t['trace_id'] for t in traces]
+
+
+def read_lines(path):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        return [json.loads(line)['trace_id'] for line in f]
+
+
+def test_records_are_buffered_until_flushed(writer):
+    writer.write(trace(0))
+    writer.write(trace(1))
+
+    assert not glob.glob(writer.path)
+    writer.flush()
+    assert read_lines(writer.path) == ['trace-0', 'trace-1']
+
+
+def test_full_buffer_wakes_the_flusher(tmp_path):
+    writer = TraceWriter(str(tmp_path / 'test_log.jsonl'), flush_interval=60, max_buffered=2)
+    try:
+        writer.write(trace(0))
+        writer.write(trace(1))
+        writer._thread.join(0.5)
+        assert read_lines(writer.path) == ['trace-0', 'trace-1']
+    finally:
+        writer.close()
+
+
+def test_close_writes_remaining_records(writer):
+    writer.write(trace(0))
+    writer.close()
+    writer.write(trace(1))
+
+    assert read_lines(writer.path) == ['trace-0']
+
+
+def test_blocks_are_indexed(writer):
+    write(writer, [trace(n) for n in range(5)])
+
+    blocks = read_index(writer.index_path)
+    assert [b['count'] for b in blocks] == [2, 2, 1]
+    assert [b['start'] for b in blocks] == [BASE, BASE + 2, BASE + 4]
+    assert blocks[1]['offset'] == blocks[0]['offset'] + blocks[0]['length']
+    assert blocks[2]['offset'] + blocks[2]['length'] == os.path.getsize(writer.path)
+    assert ids(iter_traces(writer.path)) == [f'trace-{n}' for n in range(5)]
+
+
+def test_query_filters(writer):
+    write(writer, [
+        trace(0, types=('prompt',)),
+        trace(1, types=('llm_response',), duration=5.0),
+        trace(2, types=('prompt', 'file_info')),
+        trace(3, types=('error',), duration=0.5)
+    ])
+
+    assert ids(iter_traces(writer.path, TraceQuery(types=['file_info', 'error']))) == ['trace-2', 'trace-3']
+    assert ids(iter_traces(writer.path, TraceQuery(start=BASE + 1, end=BASE + 2))) == ['trace-1', 'trace-2']
+    assert ids(iter_traces(writer.path, TraceQuery(trace_id='trace-3'))) == ['trace-3']
+    assert ids(iter_traces(writer.path, TraceQuery(min_duration=2))) == ['trace-1']
+
+
+def test_time_range_only_reads_matching_blocks(writer):
+    write(writer, [trace(n) for n in range(6)])
+
+    lines = list(_segment_lines(writer.path, TraceQuery(start=BASE + 4), False, True))
+    assert [json.loads(line)['trace_id'] for line in lines] == ['trace-4', 'trace-5']
+
+
+def test_paging(writer):
+    write(writer, [trace(n) for n in range(5)])
+
+    assert ids(iter_traces(writer.path, limit=2, offset=1)) == ['trace-1', 'trace-2']
+    assert ids(iter_traces(writer.path, limit=2, descending=True)) == ['trace-4', 'trace-3']
+    assert ids(iter_traces(writer.path, limit=0)) == []
+
+
+def test_rotated_segments_are_compressed_and_still_queried(tmp_path):
+    writer = TraceWriter(str(tmp_path / 'test_log.jsonl'), max_size=1, backup_count=2,
+                         flush_interval=60, block_size=2)
+    try:
+        for n in range(4):
+            write(writer, [trace(n)])
+    finally:
+        writer.close()
+
+    segments = list_segments(writer.path)
+    assert len(segments) == 3
+    assert all(s.endswith('.gz') and os.path.exists(s + '.idx') for s in segments[:-1])
+    # Only the newest backup_count closed segments are kept
+    assert ids(iter_traces(writer.path)) == ['trace-2', 'trace-3']
+    assert ids(iter_traces(writer.path, TraceQuery(start=BASE + 3))) == ['trace-3']
+    assert ids(iter_traces(writer.path, descending=True)) == ['trace-3', 'trace-2']
+
+
+def test_segments_rotate_per_interval(writer):
+    write(writer, [trace(0)])
+    write(writer, [trace(1, started_at=BASE + HOUR)])
+
+    assert len(glob.glob(writer.path + '.*.gz')) == 1
+    assert ids(iter_traces(writer.path)) == ['trace-0', 'trace-1']
+
+
+def test_unreadable_files_are_reported(tmp_path, caplog):
+    path = str(tmp_path / 'test_log.jsonl')
+    with open(path + '.20240101-000000-000000.1', 'w') as f:
+        json.dump(trace(0), f, indent=2)
+    with open(path, 'w') as f:
+        f.write(json.dumps(trace(1)) + '\n{"truncated\n')
+    logger = logging.getLogger('tests.traces')
+
+    with caplog.at_level(logging.WARNING, logger='tests.traces'):
+        assert ids(iter_traces(path, logger=logger)) == ['trace-1']
+    assert 'Skipping trace file' in caplog.text
+    assert 'Skipped 1 unreadable lines' in caplog.text